@@ -0,0 +1,350 @@
+"""
+Disk-backed album art cache for Radio Calico
+
+Cover images are fetched from the origin through one pooled HTTP session per
+process and kept on disk, bounded by size with least-recently-used eviction.
+Stale copies are revalidated with If-None-Match/If-Modified-Since, and a
+per-file lock coalesces concurrent misses so that only one request goes
+upstream, even across gunicorn workers that share the cache directory. The
+locks are a fixed set of stripes, so arbitrary filenames cannot grow them.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+from metrics import registry
+from static_index import StaticEntry
+
+try:
+    import fcntl
+
+    FLOCK_AVAILABLE = True
+except ImportError:
+    FLOCK_AVAILABLE = False
+
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+MAX_OBJECT_BYTES = 10 * 1024 * 1024  # refuse to cache anything larger
+FRESH_FOR = 300  # seconds before a cached copy is revalidated
+TOUCH_INTERVAL = 60  # seconds between last-used updates for one file
+UPSTREAM_TIMEOUT = 10
+POOL_MAXSIZE = 16
+FILL_LOCK_STRIPES = 64  # fill locks shared by hash of the cache key
+
+LOOKUPS = registry.counter(
+    "radiocalico_album_art_lookups_total",
+    "Album art cache lookups by result: hit, miss, revalidated or stale",
+    ("result",),
+)
+UPSTREAM_SECONDS = registry.histogram(
+    "radiocalico_album_art_upstream_seconds",
+    "Time spent fetching or revalidating album art at the origin",
+)
+UPSTREAM_FAILURES = registry.counter(
+    "radiocalico_album_art_upstream_failures_total",
+    "Album art origin requests that raised or returned an error",
+)
+EVICTIONS = registry.counter(
+    "radiocalico_album_art_evictions_total",
+    "Album art files evicted from the disk cache",
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AlbumArtCache:
+    """LRU cache of origin files in cache_dir, keyed by origin path"""
+
+    def __init__(
+        self,
+        cache_dir,
+        origin,
+        max_bytes=CACHE_MAX_BYTES,
+        fresh_for=FRESH_FOR,
+        timeout=UPSTREAM_TIMEOUT,
+        pool_maxsize=POOL_MAXSIZE,
+    ):
+        self.cache_dir = cache_dir
+        self.origin = origin.rstrip("/")
+        self.max_bytes = max_bytes
+        self.fresh_for = fresh_for
+        self.timeout = timeout
+        self.pool_maxsize = pool_maxsize
+
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+        self._fill_locks = [threading.Lock() for _ in range(FILL_LOCK_STRIPES)]
+        self._bytes = None
+
+    @property
+    def session(self):
+        """Pooled requests.Session, created lazily in each worker process
+
+        A session inherited across fork would share sockets with the parent,
+        so a new one is made whenever the process id changes.
+        """
+        pid = os.getpid()
+        if self._session is None or self._session_pid != pid:
+            with self._session_lock:
+                if self._session is None or self._session_pid != pid:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=1, pool_maxsize=self.pool_maxsize
+                    )
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session, self._session_pid = session, pid
+        return self._session
+
+    def opened_session(self):
+        """This process's session, or None if it has not needed one yet"""
+        if self._session_pid == os.getpid():
+            return self._session
+        return None
+
+    def _key(self, filename):
+        return hashlib.sha256(filename.encode()).hexdigest()[:32]
+
+    def _meta_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _read_meta(self, key):
+        try:
+            with open(self._meta_path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, key, meta):
+        tmp_path = f"{self._meta_path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path(key))
+
+    @contextmanager
+    def _fill_lock(self, key):
+        """Serialize fetches of one file across threads and processes
+
+        Keys share one of FILL_LOCK_STRIPES locks, picked from the key itself
+        rather than hash() so every worker maps a key to the same lock file.
+        """
+        stripe = int(key[:8], 16) % FILL_LOCK_STRIPES
+        with self._fill_locks[stripe]:
+            if not FLOCK_AVAILABLE:
+                yield
+                return
+            lock_path = os.path.join(self.cache_dir, f"fill-{stripe:02x}.lock")
+            with open(lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _is_fresh(self, meta, validated_after):
+        if meta["validated_at"] < validated_after:
+            return False
+        return time.time() - meta["validated_at"] < self.fresh_for
+
+    def _entry(self, meta):
+        path = os.path.join(self.cache_dir, meta["data_file"])
+        last_modified = meta["validated_at"]
+        if meta.get("last_modified"):
+            try:
+                last_modified = parsedate_to_datetime(meta["last_modified"]).timestamp()
+            except (TypeError, ValueError):
+                pass
+
+        # Record the use so eviction keeps popular covers; throttled to spare
+        # a syscall per hit
+        try:
+            if time.time() - os.path.getmtime(path) > TOUCH_INTERVAL:
+                os.utime(path)
+        except OSError:
+            pass
+
+        return StaticEntry(
+            path=path,
+            size=meta["size"],
+            mtime=last_modified,
+            mtime_ns=int(last_modified * 1e9),
+            etag=meta["content_hash"],
+        )
+
+    def get(self, filename, validated_after=0):
+        """Return a StaticEntry for filename, fetching or revalidating as needed
+
+        A copy last validated before the validated_after timestamp is
+        revalidated even if it is otherwise fresh, e.g. cover.jpg after a
+        track change. Raises requests exceptions when the origin fails and
+        there is no cached copy to fall back to.
+        """
+        key = self._key(filename)
+        meta = self._read_meta(key)
+        if meta is not None and self._is_fresh(meta, validated_after):
+            LOOKUPS.inc("hit")
+            return self._entry(meta)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with self._fill_lock(key):
+            # Whoever held the lock before us may have just filled it
+            meta = self._read_meta(key)
+            if meta is not None and self._is_fresh(meta, validated_after):
+                LOOKUPS.inc("hit")
+                return self._entry(meta)
+
+            try:
+                meta = self._fetch(filename, key, meta)
+            except Exception:
+                if meta is None:
+                    raise
+                # Serve the stale copy rather than fail while the origin is down
+                LOOKUPS.inc("stale")
+                logger.warning(
+                    "Album art revalidation failed, serving stale %s", filename
+                )
+
+        return self._entry(meta)
+
+    def _fetch(self, filename, key, meta):
+        """Fetch filename from the origin, revalidating meta when present"""
+        headers = {}
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        started = time.perf_counter()
+        try:
+            with self.session.get(
+                f"{self.origin}/{filename}",
+                headers=headers,
+                timeout=self.timeout,
+                stream=True,
+            ) as resp:
+                if resp.status_code == 304 and meta is not None:
+                    meta["validated_at"] = time.time()
+                    self._write_meta(key, meta)
+                    LOOKUPS.inc("revalidated")
+                    return meta
+
+                resp.raise_for_status()
+                data_file, size, content_hash = self._store_body(key, resp)
+        except Exception:
+            UPSTREAM_FAILURES.inc()
+            raise
+        finally:
+            UPSTREAM_SECONDS.observe(time.perf_counter() - started)
+        LOOKUPS.inc("miss")
+
+        old_data_file = meta and meta.get("data_file")
+        meta = {
+            "filename": filename,
+            "data_file": data_file,
+            "size": size,
+            "content_hash": content_hash,
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "validated_at": time.time(),
+        }
+        self._write_meta(key, meta)
+
+        # Readers that already opened the old body keep reading it; it goes
+        # once the new meta points elsewhere
+        if old_data_file and old_data_file != data_file:
+            self._unlink(old_data_file)
+
+        self._account(size)
+        return meta
+
+    def _store_body(self, key, resp):
+        """Stream a response body into a content-addressed file"""
+        digest = hashlib.sha256()
+        size = 0
+        tmp_path = os.path.join(
+            self.cache_dir, f"{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in resp.iter_content(65536):
+                    size += len(chunk)
+                    if size > MAX_OBJECT_BYTES:
+                        raise ValueError(
+                            f"album art larger than {MAX_OBJECT_BYTES} bytes"
+                        )
+                    digest.update(chunk)
+                    f.write(chunk)
+
+            content_hash = digest.hexdigest()[:32]
+            data_file = f"{key}.{content_hash[:16]}.bin"
+            os.replace(tmp_path, os.path.join(self.cache_dir, data_file))
+        except BaseException:
+            self._unlink(os.path.basename(tmp_path))
+            raise
+        return data_file, size, content_hash
+
+    def _unlink(self, name):
+        try:
+            os.remove(os.path.join(self.cache_dir, name))
+        except OSError:
+            pass
+
+    def _account(self, added):
+        """Track bytes written and evict once the cache grows past max_bytes
+
+        The running total is per process, so a full directory scan settles
+        the real size before anything is evicted.
+        """
+        if self._bytes is None:
+            self._bytes = self.disk_bytes()
+        else:
+            self._bytes += added
+        if self._bytes > self.max_bytes:
+            self._bytes = self.evict()
+
+    def disk_bytes(self):
+        """Total size of cached bodies on disk"""
+        return sum(size for _, size, _ in self._scan())
+
+    def _scan(self):
+        """Yield (name, size, last used) for each cached body"""
+        try:
+            entries = list(os.scandir(self.cache_dir))
+        except OSError:
+            return
+        for entry in entries:
+            if not entry.name.endswith(".bin"):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            yield entry.name, stat.st_size, stat.st_mtime
+
+    def evict(self, target_ratio=0.9):
+        """Drop least recently used files until under target_ratio of max_bytes"""
+        files = sorted(self._scan(), key=lambda f: f[2])
+        total = sum(size for _, size, _ in files)
+        target = self.max_bytes * target_ratio
+
+        for name, size, _ in files:
+            if total <= target:
+                break
+            key = name.split(".", 1)[0]
+            meta = self._read_meta(key)
+            if meta is not None and meta.get("data_file") == name:
+                self._unlink(f"{key}.json")
+            self._unlink(name)
+            EVICTIONS.inc()
+            total -= size
+        return total
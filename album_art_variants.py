@@ -0,0 +1,197 @@
+"""
+Resized and re-encoded album art variants for Radio Calico
+
+Covers can be requested at a smaller size with ?w=/?h= and are re-encoded as
+AVIF or WebP when the client's Accept header asks for them. Encoding runs on
+a small thread pool (Pillow releases the GIL while resizing and encoding), and
+finished variants are kept in a size-bounded LRU keyed by
+(source ETag, width, height, format), so each variant is rendered once per
+worker. Concurrent requests for a variant share one render.
+"""
+
+import hashlib
+import importlib.util
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from static_index import StaticEntry
+
+# Pillow and its format plugins take longer to load than the rest of the
+# app's own modules, so they are imported on the first album art request
+PIL_AVAILABLE = importlib.util.find_spec("PIL") is not None
+
+# Requested sizes snap up to one of these so the variant count stays bounded
+VARIANT_SIZES = (64, 128, 192, 256, 384, 512, 768, 1024)
+VARIANT_CACHE_MAX_BYTES = 32 * 1024 * 1024
+ENCODE_WORKERS = 2
+ENCODE_TIMEOUT = 5  # seconds; slower renders are served as the original
+VARIANT_QUALITY = 80
+
+FORMAT_MIMETYPES = {
+    "AVIF": "image/avif",
+    "WEBP": "image/webp",
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+}
+# Tried in order against the formats the client lists explicitly
+NEGOTIATED_FORMATS = ("AVIF", "WEBP")
+
+
+def source_format(filename):
+    """Pillow format name for an album art filename"""
+    if filename.endswith(".webp"):
+        return "WEBP"
+    elif filename.endswith(".png"):
+        return "PNG"
+    return "JPEG"
+
+
+def snap_size(value):
+    """Parse a ?w=/?h= value and round it up to the next variant size"""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return None
+    if size <= 0:
+        return None
+    for variant_size in VARIANT_SIZES:
+        if size <= variant_size:
+            return variant_size
+    return VARIANT_SIZES[-1]
+
+
+class VariantRenderer:
+    """Render and cache album art variants on a worker pool"""
+
+    def __init__(
+        self,
+        max_bytes=VARIANT_CACHE_MAX_BYTES,
+        workers=ENCODE_WORKERS,
+        timeout=ENCODE_TIMEOUT,
+        quality=VARIANT_QUALITY,
+    ):
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.timeout = timeout
+        self.quality = quality
+
+        self._formats = None
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+
+    @property
+    def enabled(self):
+        return PIL_AVAILABLE
+
+    @property
+    def formats(self):
+        """Formats Pillow can encode; the first call loads Pillow's plugins"""
+        if self._formats is None:
+            formats = set()
+            if PIL_AVAILABLE:
+                from PIL import Image
+
+                Image.init()
+                formats = {fmt for fmt in FORMAT_MIMETYPES if fmt in Image.SAVE}
+            self._formats = formats
+        return self._formats
+
+    @property
+    def pool(self):
+        """Encoding pool, created lazily in each worker process"""
+        pid = os.getpid()
+        with self._lock:
+            if self._pool is None or self._pool_pid != pid:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="album-art-encode"
+                )
+                self._pool_pid = pid
+            return self._pool
+
+    def negotiate(self, accept_mimetypes, default_format):
+        """Pick the best format the client names explicitly in Accept
+
+        Wildcards like */* do not count; browsers that can decode AVIF or WebP
+        list them by name.
+        """
+        explicit = {value for value, quality in accept_mimetypes if quality > 0}
+        for fmt in NEGOTIATED_FORMATS:
+            if fmt in self.formats and FORMAT_MIMETYPES[fmt] in explicit:
+                return fmt
+        return default_format
+
+    def get(self, source, fmt, width=None, height=None):
+        """Return a StaticEntry for a variant of source, or None on timeout
+
+        A render that misses the timeout keeps running and is cached for the
+        next request.
+        """
+        key = (source.etag, width, height, fmt)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+                return entry
+            future = self._inflight.get(key)
+
+        if future is None:
+            pool = self.pool
+            with self._lock:
+                future = self._inflight.get(key)
+                if future is None:
+                    future = pool.submit(self._render, key, source, fmt, width, height)
+                    self._inflight[key] = future
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            return None
+
+    def _render(self, key, source, fmt, width, height):
+        try:
+            from PIL import Image
+
+            from optimize_images import encode_image, resize_to_fit
+
+            with Image.open(source.path) as img:
+                img = resize_to_fit(img, width, height)
+                data = encode_image(img, fmt, quality=self.quality)
+
+            variant_id = f"{source.etag}:{width}x{height}:{fmt}"
+            entry = StaticEntry(
+                path=source.path,
+                size=len(data),
+                mtime=source.mtime,
+                mtime_ns=source.mtime_ns,
+                etag=hashlib.sha256(variant_id.encode()).hexdigest()[:32],
+                data=data,
+            )
+            self._store(key, entry)
+            return entry
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _store(self, key, entry):
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._cache.pop(key, None)
+            if previous is not None:
+                self._cache_bytes -= previous.size
+            self._cache[key] = entry
+            self._cache_bytes += entry.size
+            while self._cache_bytes > self.max_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= evicted.size
+
+    def memory_bytes(self):
+        """Bytes of rendered variants currently cached"""
+        return self._cache_bytes
@@ -1,21 +1,76 @@
 import hashlib
+import hmac
+import importlib.util
+import json
+import logging
+import mimetypes
 import os
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
 from datetime import datetime, timedelta
-from urllib.parse import urlparse
-
-from flask import Flask, g, jsonify, make_response, request, send_from_directory
+from functools import wraps
+from urllib.parse import quote, urljoin, urlparse
+
+from flask import (
+    Flask,
+    Response,
+    abort,
+    g,
+    jsonify,
+    make_response,
+    redirect,
+    request,
+)
 from flask_compress import Compress
 from flask_cors import CORS
-
-try:
-    import psycopg2
-    import psycopg2.extras
-    POSTGRES_AVAILABLE = True
-except ImportError:
-    POSTGRES_AVAILABLE = False
-
-app = Flask(__name__)
+from werkzeug.http import http_date
+
+from album_art_cache import AlbumArtCache
+from album_art_variants import (
+    FORMAT_MIMETYPES,
+    VariantRenderer,
+    snap_size,
+    source_format,
+)
+from health import HealthProber
+from hls_relay import HlsRelay, hls_mimetype, is_playlist
+from listener_count import ListenerCounter
+from listener_identity import (
+    LISTENER_COOKIE_MAX_AGE,
+    LISTENER_COOKIE_NAME,
+    load_secret,
+    sign_listener_id,
+    verify_listener_cookie,
+)
+from memory_snapshots import GROUP_BY as MEMORY_GROUP_BY
+from memory_snapshots import SnapshotStore
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from metrics import http_pool_stats, registry
+from now_playing import NowPlayingPoller
+from play_history import Play, PlayHistory, play_from_snapshot
+from rating_stream import RatingsHub
+from request_profile import (
+    profile_requests,
+    timed_phase,
+    trace_statement,
+    traced_connection,
+)
+from sampling_profiler import MAX_SECONDS as PROFILE_MAX_SECONDS
+from sampling_profiler import ActiveThreads, format_collapsed, sample_stacks
+from schema import SCHEMA_VERSION, create_schema, ensure_schema, fingerprint_to_bytes
+from sse import SubscriberLimit, stream_events
+from structured_logging import configure_logging, log_requests, parse_sample_rates
+from static_index import StaticFileIndex, make_entry_response
+
+# psycopg2 is only imported by deployments that connect to PostgreSQL
+POSTGRES_AVAILABLE = importlib.util.find_spec("psycopg2") is not None
+
+# static_folder=None so /static/ goes through serve_static rather than
+# Flask's built-in static route, which would otherwise shadow it
+app = Flask(__name__, static_folder=None)
 CORS(app)
 
 # Enable compression for all responses
@@ -26,9 +81,177 @@ Compress(app)
 DATABASE = os.getenv("DATABASE_PATH") or os.getenv("DATABASE_URL") or "database.db"
 CACHE_TIMEOUT = 300  # 5 minutes for most responses
 STATIC_CACHE_TIMEOUT = 86400 * 30  # 30 days for static files
+IMMUTABLE_CACHE_TIMEOUT = 86400 * 365  # 1 year for content-hashed files
+# Prebuilt variants written by precompress_assets.py, in order of preference
+PRECOMPRESSED_VARIANTS = (("br", ".br"), ("gzip", ".gz"))
+# Content-hashed build written by asset_pipeline.py
+ASSET_DIST_DIR = "static/dist"
+# When nginx fronts the app, hand file bodies to it via X-Accel-Redirect
+ACCEL_REDIRECT = os.getenv("ACCEL_REDIRECT") == "1"
+ACCEL_STATIC_PREFIX = "/_accel/static/"
+ACCEL_ALBUM_ART_PREFIX = "/_accel/album-art/"
+ALBUM_ART_ORIGIN = os.getenv(
+    "ALBUM_ART_ORIGIN", "https://d3d4yli4hf5bmh.cloudfront.net"
+)
+ALBUM_ART_CACHE_DIR = os.getenv("ALBUM_ART_CACHE_DIR", ".album_art_cache")
+ALBUM_ART_CACHE_MAX_MB = int(os.getenv("ALBUM_ART_CACHE_MAX_MB", "256"))
+ALBUM_ART_VARIANT_CACHE_MB = int(os.getenv("ALBUM_ART_VARIANT_CACHE_MB", "32"))
+METADATA_URL = os.getenv("METADATA_URL", f"{ALBUM_ART_ORIGIN}/metadatav2.json")
+# Shared by all workers on a host: the poller lock and latest metadata snapshot
+RUNTIME_DIR = os.getenv("RUNTIME_DIR", ".runtime")
+# Open Server-Sent Event streams per worker, each holding one thread
+SSE_MAX_SUBSCRIBERS = int(os.getenv("SSE_MAX_SUBSCRIBERS", "200"))
+# Live tallies are pushed at most once per this many ms per song
+RATINGS_PUSH_INTERVAL_MS = int(os.getenv("RATINGS_PUSH_INTERVAL_MS", "500"))
+# Relay mode serves the HLS stream to local listeners from memory, fetching
+# each playlist and segment from the origin once
+HLS_RELAY = os.getenv("HLS_RELAY") == "1"
+HLS_ORIGIN_URL = os.getenv("HLS_ORIGIN_URL", f"{ALBUM_ART_ORIGIN}/hls/live.m3u8")
+HLS_RELAY_SEGMENTS = int(os.getenv("HLS_RELAY_SEGMENTS", "32"))
+# Recent plays kept in memory per worker; /api/history reads beyond it hit the DB
+HISTORY_BUFFER_SIZE = int(os.getenv("HISTORY_BUFFER_SIZE", "50"))
+HISTORY_DEFAULT_LIMIT = 10
+HISTORY_MAX_LIMIT = 200
+# Seconds between checks of the static tree for changed files; 0 disables
+STATIC_RESCAN_INTERVAL = float(os.getenv("STATIC_RESCAN_INTERVAL", "2"))
+# JSON logs are queued and written by a background thread; past
+# LOG_QUEUE_SIZE waiting records, new ones are dropped and counted
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Fraction of requests written to the access log, overridable per URL rule
+# as "rule=rate,..."; slow requests and server errors are always logged
+ACCESS_LOG_SAMPLE_RATE = float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "1"))
+ACCESS_LOG_ROUTE_RATES = parse_sample_rates(
+    os.getenv(
+        "ACCESS_LOG_ROUTE_RATES",
+        "/health=0.01,/health/live=0.01,/health/ready=0.01,/metrics=0,"
+        "/api/heartbeat=0.01,/hls/<path:name>=0.01",
+    )
+)
+LOG_SLOW_REQUEST_MS = float(os.getenv("LOG_SLOW_REQUEST_MS", "1000"))
+# Seconds between background health probe rounds, and the origin probe timeout
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "5"))
+HEALTH_PROBE_TIMEOUT = 2
+# Bearer token for the /admin/ endpoints, which are disabled without one
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# Per-request SQL and phase timings in a Server-Timing header; off by default
+REQUEST_PROFILE = os.getenv("REQUEST_PROFILE") == "1"
+# Profiled requests at least this slow log every statement they ran
+REQUEST_PROFILE_SLOW_MS = float(os.getenv("REQUEST_PROFILE_SLOW_MS", "500"))
+LISTENER_SECRET = load_secret(os.getenv("LISTENER_SECRET_FILE", ".listener_secret"))
+
+log_handler = configure_logging(LOG_LEVEL, queue_size=LOG_QUEUE_SIZE)
+log = logging.getLogger("radiocalico")
+log_requests(
+    app,
+    logging.getLogger("radiocalico.access"),
+    ACCESS_LOG_SAMPLE_RATE,
+    ACCESS_LOG_ROUTE_RATES,
+    LOG_SLOW_REQUEST_MS,
+)
 
 # In-memory cache for frequently accessed data
 cache = {}
+RESPONSE_CACHE_MAX_ENTRIES = 100
+
+# Prometheus metrics, merged across workers through RUNTIME_DIR
+registry.state_dir = os.path.join(RUNTIME_DIR, "metrics")
+REQUESTS = registry.counter(
+    "radiocalico_http_requests_total",
+    "HTTP requests by method, route and status",
+    ("method", "route", "status"),
+)
+REQUEST_SECONDS = registry.histogram(
+    "radiocalico_http_request_duration_seconds",
+    "Time to produce a response, by route (streamed bodies excluded)",
+    ("route",),
+)
+IN_FLIGHT = registry.gauge(
+    "radiocalico_http_requests_in_flight",
+    "Requests currently being handled, by route",
+    ("route",),
+)
+RESPONSE_CACHE = registry.counter(
+    "radiocalico_response_cache_lookups_total",
+    "In-memory response cache lookups by result: hit, miss or expired",
+    ("result",),
+)
+RESPONSE_CACHE_EVICTIONS = registry.counter(
+    "radiocalico_response_cache_evictions_total",
+    "Entries dropped to keep the response cache under its size limit",
+)
+DB_QUERIES = registry.histogram(
+    "radiocalico_db_query_seconds",
+    "Time spent in database execute calls; the count is the number of queries",
+)
+DB_CONNECTIONS = registry.counter(
+    "radiocalico_db_connections_opened_total",
+    "Database connections opened",
+)
+registry.gauge(
+    "radiocalico_response_cache_entries",
+    "Entries in the in-memory response caches",
+)
+registry.gauge(
+    "radiocalico_sse_subscribers",
+    "Open Server-Sent Event streams",
+)
+registry.gauge(
+    "radiocalico_upstream_pool_connections_opened",
+    "Connections opened by each upstream HTTP pool of the live workers",
+    ("pool",),
+)
+registry.gauge(
+    "radiocalico_upstream_pool_connections_idle",
+    "Idle keep-alive connections in each upstream HTTP pool",
+    ("pool",),
+)
+registry.gauge(
+    "radiocalico_upstream_pool_requests",
+    "Requests sent through each upstream HTTP pool of the live workers",
+    ("pool",),
+)
+
+# Album art fetched from the origin, shared on disk by all workers
+album_art_cache = AlbumArtCache(
+    ALBUM_ART_CACHE_DIR,
+    ALBUM_ART_ORIGIN,
+    max_bytes=ALBUM_ART_CACHE_MAX_MB * 1024 * 1024,
+    fresh_for=CACHE_TIMEOUT,
+)
+# Metadata polled by one worker per deployment and pushed to SSE subscribers
+now_playing = NowPlayingPoller(
+    RUNTIME_DIR,
+    METADATA_URL,
+    on_change=lambda snapshot, is_leader: record_track_change(snapshot, is_leader),
+)
+play_history = PlayHistory(HISTORY_BUFFER_SIZE)
+# Approximate distinct listeners, shared across workers through RUNTIME_DIR
+listener_counter = ListenerCounter(os.path.join(RUNTIME_DIR, "listeners"))
+hls_relay = (
+    HlsRelay(HLS_ORIGIN_URL, prefix="/hls/", ring_size=HLS_RELAY_SEGMENTS)
+    if HLS_RELAY
+    else None
+)
+stream_slots = SubscriberLimit(SSE_MAX_SUBSCRIBERS)
+
+# Resized and AVIF/WebP re-encoded covers, rendered per worker
+album_art_variants = VariantRenderer(
+    max_bytes=ALBUM_ART_VARIANT_CACHE_MB * 1024 * 1024
+)
+
+# Track-level part of /api/bootstrap, keyed by now-playing snapshot id and
+# holding (snapshot changed_at, shared part) for the latest build only
+bootstrap_cache = {}
+# Snapshot id -> Future of the build in progress, so each is built once
+bootstrap_builds = {}
+bootstrap_lock = threading.Lock()
+BOOTSTRAP_WAIT_SECONDS = 2
+
+# Intern cache mapping public song_id strings to integer songs.id values
+SONG_INTERN_CACHE_SIZE = 10000
+song_id_cache = OrderedDict()
+song_id_cache_lock = threading.Lock()
 
 
 def get_cache_key(prefix, *args):
@@ -42,10 +265,14 @@ def get_cached_response(cache_key, max_age=CACHE_TIMEOUT):
     if cache_key in cache:
         cached_data, timestamp = cache[cache_key]
         if datetime.now() - timestamp < timedelta(seconds=max_age):
+            RESPONSE_CACHE.inc("hit")
             return cached_data
         else:
             # Remove expired cache entry
             del cache[cache_key]
+            RESPONSE_CACHE.inc("expired")
+            return None
+    RESPONSE_CACHE.inc("miss")
     return None
 
 
@@ -54,33 +281,131 @@ def set_cache(cache_key, data):
     cache[cache_key] = (data, datetime.now())
 
     # Simple cache cleanup - keep only last 100 entries
-    if len(cache) > 100:
+    if len(cache) > RESPONSE_CACHE_MAX_ENTRIES:
         oldest_key = min(cache.keys(), key=lambda k: cache[k][1])
         del cache[oldest_key]
+        RESPONSE_CACHE_EVICTIONS.inc()
+
+
+if REQUEST_PROFILE:
+    profile_requests(app, REQUEST_PROFILE_SLOW_MS, log=log.warning)
+    get_cached_response = timed_phase("cache", get_cached_response)
+    set_cache = timed_phase("cache", set_cache)
+
+
+def load_asset_manifest():
+    """Load the hashed-asset manifest, or an empty one when no build exists"""
+    manifest_path = os.path.join(app.root_path, ASSET_DIST_DIR, "manifest.json")
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+asset_manifest = load_asset_manifest()
+hashed_assets = set(asset_manifest.values())
+
+
+def build_static_indexes():
+    """Index static/ and the root HTML pages, keyed by send_precompressed directory"""
+    return {
+        "static": StaticFileIndex(
+            os.path.join(app.root_path, "static"),
+            rescan_interval=STATIC_RESCAN_INTERVAL,
+        ),
+        ".": StaticFileIndex(
+            app.root_path,
+            suffixes=(".html", ".html.br", ".html.gz"),
+            recursive=False,
+            rescan_interval=STATIC_RESCAN_INTERVAL,
+        ),
+    }
+
+
+static_indexes = build_static_indexes()
+
+
+def lookup_static_file(directory, filename):
+    """Find a file in the startup index; directory is relative to the app root"""
+    top, _, subdir = directory.partition("/")
+    index = static_indexes.get(top)
+    if index is None:
+        return None
+    return index.get(f"{subdir}/{filename}" if subdir else filename)
+
+
+class TimedConnection(sqlite3.Connection):
+    """SQLite connection that records the time spent in each execute call
+
+    SQLite steps a SELECT lazily, so rows fetched after the first are not
+    included.
+    """
+
+    def execute(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().execute(*args)
+        finally:
+            DB_QUERIES.observe(time.perf_counter() - started)
+
+    def executemany(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().executemany(*args)
+        finally:
+            DB_QUERIES.observe(time.perf_counter() - started)
+
+
+SQLITE_CONNECTION_CLASS = (
+    traced_connection(TimedConnection) if REQUEST_PROFILE else TimedConnection
+)
+
+
+def open_db_connection():
+    """Open a new database connection"""
+    if DATABASE.startswith('postgresql://') and POSTGRES_AVAILABLE:
+        import psycopg2
+
+        url = urlparse(DATABASE)
+        conn_params = {
+            'dbname': url.path[1:],
+            'user': url.username,
+            'password': url.password,
+            'host': url.hostname,
+            'port': url.port or 5432
+        }
+        conn = psycopg2.connect(**conn_params)
+        conn.autocommit = True
+    else:
+        conn = sqlite3.connect(DATABASE, factory=SQLITE_CONNECTION_CLASS)
+        if REQUEST_PROFILE:
+            conn.set_trace_callback(trace_statement)
+        conn.row_factory = sqlite3.Row
+        # Enable WAL mode for better concurrent performance
+        conn.execute("PRAGMA journal_mode=WAL")
+    DB_CONNECTIONS.inc()
+    return conn
 
 
 def get_db_connection():
     """Get database connection with connection pooling"""
     if not hasattr(g, "db_connection"):
-        if DATABASE.startswith('postgresql://') and POSTGRES_AVAILABLE:
-            url = urlparse(DATABASE)
-            conn_params = {
-                'dbname': url.path[1:],
-                'user': url.username,
-                'password': url.password,
-                'host': url.hostname,
-                'port': url.port or 5432
-            }
-            g.db_connection = psycopg2.connect(**conn_params)
-            g.db_connection.autocommit = True
-        else:
-            g.db_connection = sqlite3.connect(DATABASE)
-            g.db_connection.row_factory = sqlite3.Row
-            # Enable WAL mode for better concurrent performance
-            g.db_connection.execute("PRAGMA journal_mode=WAL")
+        g.db_connection = open_db_connection()
     return g.db_connection
 
 
+def get_background_db_connection():
+    """Connection for background threads, which have no request context"""
+    conn = getattr(background_db, "conn", None)
+    if conn is None:
+        conn = background_db.conn = open_db_connection()
+    return conn
+
+
+background_db = threading.local()
+
+
 @app.teardown_appcontext
 def close_db_connection(exception):
     """Close database connection at end of request"""
@@ -90,46 +415,25 @@ def close_db_connection(exception):
 
 
 def init_db():
-    conn = get_db_connection()
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """
-    )
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS song_ratings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            song_id TEXT NOT NULL,
-            user_fingerprint TEXT NOT NULL,
-            rating INTEGER NOT NULL CHECK(rating IN (1, -1)),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(song_id, user_fingerprint)
-        )
-    """
-    )
+    """Create or migrate the schema now, whatever version it is at"""
+    create_schema(get_db_connection())
 
-    # Create indexes for better query performance
-    conn.execute(
-        "CREATE INDEX IF NOT EXISTS idx_song_ratings_song_id ON song_ratings(song_id)"
-    )
-    conn.execute(
-        "CREATE INDEX IF NOT EXISTS idx_song_ratings_fingerprint ON song_ratings(user_fingerprint)"
-    )
-    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)")
-
-    conn.commit()
+    # Interned ids belong to the database that was just initialized
+    with song_id_cache_lock:
+        song_id_cache.clear()
 
 
-def add_cache_headers(response, max_age=CACHE_TIMEOUT):
+def add_cache_headers(response, max_age=CACHE_TIMEOUT, immutable=False):
     """Add caching headers to response"""
     response.headers["Cache-Control"] = f"public, max-age={max_age}"
+    if immutable:
+        response.headers["Cache-Control"] += ", immutable"
     
+    # nginx supplies validators for the file behind an X-Accel-Redirect, and
+    # indexed static files already carry a strong content-hash ETag
+    if "X-Accel-Redirect" in response.headers or "ETag" in response.headers:
+        return response
+
     # Only generate ETag if response data is accessible (not in direct passthrough mode)
     try:
         if hasattr(response, 'get_data') and not response.direct_passthrough:
@@ -150,9 +454,37 @@ def add_security_headers(response):
     return response
 
 
+# Threads inside a request, the only ones a CPU profile samples by default
+request_threads = ActiveThreads()
+
+
+@app.before_request
+def start_request_metrics():
+    """Count the request as in flight under its route pattern"""
+    g.metrics_route = request.url_rule.rule if request.url_rule else "unmatched"
+    g.metrics_started = time.perf_counter()
+    IN_FLIGHT.inc(g.metrics_route)
+    request_threads.enter()
+
+
+@app.teardown_request
+def record_request_metrics(exception):
+    """Record duration and outcome once the response has been produced"""
+    started = g.pop("metrics_started", None)
+    if started is None:
+        return
+    request_threads.exit()
+    route = g.metrics_route
+    IN_FLIGHT.dec(route)
+    REQUEST_SECONDS.observe(time.perf_counter() - started, route)
+    status = "500" if exception is not None else g.get("metrics_status", "500")
+    REQUESTS.inc(request.method, route, status)
+
+
 @app.after_request
 def after_request(response):
     """Add headers to all responses"""
+    g.metrics_status = str(response.status_code)
     response = add_security_headers(response)
 
     # Add CORS headers
@@ -160,25 +492,136 @@ def after_request(response):
     response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
     response.headers["Access-Control-Allow-Headers"] = "Content-Type"
 
+    # Hand out a signed listener id the first time we had to derive one
+    if g.get("issue_listener_cookie"):
+        response.set_cookie(
+            LISTENER_COOKIE_NAME,
+            sign_listener_id(LISTENER_SECRET, g.listener_id),
+            max_age=LISTENER_COOKIE_MAX_AGE,
+            secure=request.is_secure,
+            httponly=True,
+            samesite="Lax",
+        )
+        # A shared cache must never replay one listener's cookie to another
+        response.cache_control.public = False
+        response.cache_control.private = True
+
+    return response
+
+
+def use_accel_redirect():
+    """Whether this request came through an nginx that honours X-Accel-Redirect
+
+    Requests that reach the app directly (health checks, local runs without
+    nginx) fall back to streaming the file from Python.
+    """
+    return (
+        ACCEL_REDIRECT
+        and request.headers.get("X-Sendfile-Type") == "X-Accel-Redirect"
+    )
+
+
+def accel_redirect(internal_uri, mimetype):
+    """Empty response telling nginx to stream internal_uri itself"""
+    response = make_response("")
+    response.headers["X-Accel-Redirect"] = quote(internal_uri)
+    response.headers["Content-Type"] = mimetype or "application/octet-stream"
+    return response
+
+
+def send_precompressed(directory, filename):
+    """Send an indexed file, swapping in a prebuilt .br/.gz sibling the client accepts
+
+    Responses that carry Content-Encoding are left alone by Flask-Compress,
+    so precompressed assets are never compressed again per request. Files
+    come from the startup index, so validators, 304s and ranges need no
+    filesystem calls and small files are served straight from memory.
+    """
+    entry = lookup_static_file(directory, filename)
+    if entry is None:
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+    if use_accel_redirect() and directory.split("/")[0] == "static":
+        # nginx picks the .gz sibling itself with gzip_static
+        static_root = os.path.join(app.root_path, "static")
+        response = accel_redirect(
+            ACCEL_STATIC_PREFIX + os.path.relpath(entry.path, static_root), mimetype
+        )
+        response.vary.add("Accept-Encoding")
+        return response
+
+    encoding = None
+    for candidate, suffix in PRECOMPRESSED_VARIANTS:
+        if not request.accept_encodings[candidate]:
+            continue
+        variant = lookup_static_file(directory, filename + suffix)
+        # A variant older than its source is stale; skip it
+        if variant is not None and variant.mtime_ns >= entry.mtime_ns:
+            entry, encoding = variant, candidate
+            break
+
+    # Flask-Compress would re-encode a partial body, so ranges are only
+    # offered when the bytes sent are the bytes the client will see
+    accept_ranges = (
+        encoding is not None or mimetype not in app.config["COMPRESS_MIMETYPES"]
+    )
+    try:
+        response = make_entry_response(
+            entry,
+            request.environ,
+            mimetype,
+            accept_ranges=accept_ranges,
+            response_class=app.response_class,
+        )
+    except OSError:
+        # Removed since the last scan
+        abort(404)
+
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
     return response
 
 
 @app.route("/")
 def home():
-    response = make_response(send_from_directory(".", "index_optimized.html"))
+    get_listener_id(request)
+    if asset_manifest:
+        # The page names hashed assets, so it must be revalidated on every
+        # load for a deploy to reach returning listeners
+        response = send_precompressed(ASSET_DIST_DIR, "index_optimized.html")
+        return add_cache_headers(response, max_age=0)
+
+    response = send_precompressed(".", "index_optimized.html")
     return add_cache_headers(response, max_age=3600)  # Cache for 1 hour
 
 
+@app.route("/sw.js")
+def service_worker():
+    """Serve the service worker from the site root so it can control /"""
+    directory = ASSET_DIST_DIR if asset_manifest else "static"
+    response = send_precompressed(directory, "sw.js")
+    response.headers["Service-Worker-Allowed"] = "/"
+    return add_cache_headers(response, max_age=0)
+
+
 @app.route("/test")
 def test_page():
-    response = make_response(send_from_directory("static", "index.html"))
+    response = send_precompressed("static", "index.html")
     return add_cache_headers(response, max_age=3600)
 
 
 @app.route("/static/<path:filename>")
 def serve_static(filename):
     """Serve static files with aggressive caching"""
-    response = make_response(send_from_directory("static", filename))
+    response = send_precompressed("static", filename)
+
+    # Content-hashed files never change under the same name
+    if filename in hashed_assets:
+        return add_cache_headers(
+            response, max_age=IMMUTABLE_CACHE_TIMEOUT, immutable=True
+        )
 
     # Set different cache times based on file type
     if filename.endswith((".css", ".js")):
@@ -191,6 +634,40 @@ def serve_static(filename):
     return add_cache_headers(response, max_age=cache_time)
 
 
+def streams_full_response():
+    response = jsonify({"error": "Too many listeners on this worker"})
+    response.status_code = 503
+    response.headers["Retry-After"] = "5"
+    return response
+
+
+def event_stream_response(broadcast, on_close):
+    """Stream a Broadcast as Server-Sent Events; the caller holds a stream slot"""
+    response = app.response_class(
+        stream_events(broadcast, request.headers.get("Last-Event-ID")),
+        mimetype="text/event-stream",
+    )
+    # Runs when the stream ends or the client goes away, even if the body
+    # was never started
+    response.call_on_close(stream_slots.release)
+    if on_close is not None:
+        response.call_on_close(on_close)
+    response.headers["Cache-Control"] = "no-cache"
+    # Stop nginx from buffering the stream
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+@app.route("/api/now-playing/stream")
+def now_playing_stream():
+    """Push track changes to the player as Server-Sent Events"""
+    now_playing.start()
+    if not stream_slots.try_acquire():
+        return streams_full_response()
+    count_listener()
+    return event_stream_response(now_playing.broadcast, None)
+
+
 @app.route("/api/users", methods=["GET"])
 def get_users():
     """Get users with caching"""
@@ -268,54 +745,164 @@ def generate_user_fingerprint(request):
     return hashlib.sha256(fingerprint_data.encode()).hexdigest()[:32]
 
 
+def get_listener_id(request):
+    """Return the caller's 16-byte listener id, preferring the signed cookie"""
+    listener_id = g.get("listener_id")
+    if listener_id is None:
+        listener_id = verify_listener_cookie(
+            LISTENER_SECRET, request.cookies.get(LISTENER_COOKIE_NAME)
+        )
+        if listener_id is None:
+            # Cookieless client: seed the id from the fingerprint so votes cast
+            # before the cookie existed stay attached to the same listener
+            listener_id = fingerprint_to_bytes(generate_user_fingerprint(request))
+            g.issue_listener_cookie = True
+        g.listener_id = listener_id
+    return listener_id
+
+
+def intern_song_id(conn, song_id, create=False):
+    """Map a public song_id string to its songs.id, creating the row if asked"""
+    with song_id_cache_lock:
+        song_ref = song_id_cache.get(song_id)
+        if song_ref is not None:
+            song_id_cache.move_to_end(song_id)
+            return song_ref
+
+    row = conn.execute("SELECT id FROM songs WHERE song_key = ?", (song_id,)).fetchone()
+    if row is None:
+        if not create:
+            return None
+        conn.execute(
+            "INSERT INTO songs (song_key) VALUES (?) ON CONFLICT(song_key) DO NOTHING",
+            (song_id,),
+        )
+        row = conn.execute(
+            "SELECT id FROM songs WHERE song_key = ?", (song_id,)
+        ).fetchone()
+
+    song_ref = row[0]
+    with song_id_cache_lock:
+        song_id_cache[song_id] = song_ref
+        if len(song_id_cache) > SONG_INTERN_CACHE_SIZE:
+            song_id_cache.popitem(last=False)
+    return song_ref
+
+
+def get_song_tally(conn, song_ref):
+    """Return (thumbs_up, thumbs_down) for an interned song"""
+    if song_ref is None:
+        return 0, 0
+
+    ratings = conn.execute(
+        """
+        SELECT 
+            SUM(CASE WHEN rating = 1 THEN 1 ELSE 0 END) as thumbs_up,
+            SUM(CASE WHEN rating = -1 THEN 1 ELSE 0 END) as thumbs_down
+        FROM song_ratings WHERE song_id = ?
+        """,
+        (song_ref,),
+    ).fetchone()
+    return ratings["thumbs_up"] or 0, ratings["thumbs_down"] or 0
+
+
+def get_cached_tally(conn, song_id, song_ref):
+    """Return (tally, cache_status); only the shared tally is cached"""
+    cache_key = get_cache_key("ratings", song_id)
+    tally = get_cached_response(cache_key, max_age=30)  # 30 second cache
+    if tally:
+        return tally, "HIT"
+    tally = get_song_tally(conn, song_ref)
+    set_cache(cache_key, tally)
+    return tally, "MISS"
+
+
+def get_user_rating(conn, song_ref, user_fingerprint):
+    """Return the listener's own vote on a song, or None"""
+    if song_ref is None:
+        return None
+    row = conn.execute(
+        "SELECT rating FROM song_ratings WHERE song_id = ? AND user_fingerprint = ?",
+        (song_ref, user_fingerprint),
+    ).fetchone()
+    return row["rating"] if row else None
+
+
 @app.route("/api/ratings/<song_id>", methods=["GET"])
 def get_ratings(song_id):
     """Get ratings with caching and optimized queries"""
     song_id = str(song_id)[:100]  # Sanitize input
 
-    cache_key = get_cache_key("ratings", song_id)
-    cached_response = get_cached_response(cache_key, max_age=30)  # 30 second cache
-
-    if cached_response:
-        response = make_response(jsonify(cached_response))
-        response.headers["X-Cache"] = "HIT"
-        return add_cache_headers(response, max_age=30)
-
     try:
         conn = get_db_connection()
-
-        # Single optimized query for all rating data
-        ratings_query = """
-            SELECT 
-                SUM(CASE WHEN rating = 1 THEN 1 ELSE 0 END) as thumbs_up,
-                SUM(CASE WHEN rating = -1 THEN 1 ELSE 0 END) as thumbs_down
-            FROM song_ratings WHERE song_id = ?
-        """
-        ratings = conn.execute(ratings_query, (song_id,)).fetchone()
-
-        user_fingerprint = generate_user_fingerprint(request)
-        user_rating = conn.execute(
-            "SELECT rating FROM song_ratings WHERE song_id = ? AND user_fingerprint = ?",
-            (song_id, user_fingerprint),
-        ).fetchone()
+        song_ref = intern_song_id(conn, song_id)
+        tally, cache_status = get_cached_tally(conn, song_id, song_ref)
 
         result = {
             "song_id": song_id,
-            "thumbs_up": ratings["thumbs_up"] or 0,
-            "thumbs_down": ratings["thumbs_down"] or 0,
-            "user_rating": user_rating["rating"] if user_rating else None,
+            "thumbs_up": tally[0],
+            "thumbs_down": tally[1],
+            "user_rating": get_user_rating(conn, song_ref, get_listener_id(request)),
         }
 
-        set_cache(cache_key, result)
-
         response = make_response(jsonify(result))
-        response.headers["X-Cache"] = "MISS"
-        return add_cache_headers(response, max_age=30)
+        response.headers["X-Cache"] = cache_status
+        # Holds the caller's own vote, so only the browser may reuse it
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
 
     except Exception:
         return jsonify({"error": "Internal server error"}), 500
 
 
+def poll_rating_changes(known_versions):
+    """Tallies of the watched songs whose ratings_version moved; for ratings_hub"""
+    conn = get_background_db_connection()
+    song_ids = list(known_versions)
+    placeholders = ",".join("?" * len(song_ids))
+    rows = conn.execute(
+        f"SELECT id, song_key, ratings_version FROM songs "
+        f"WHERE song_key IN ({placeholders})",
+        song_ids,
+    ).fetchall()
+
+    changes = {}
+    for song_ref, song_id, version in rows:
+        if version != known_versions[song_id]:
+            changes[song_id] = (version, get_song_tally(conn, song_ref))
+    return changes
+
+
+ratings_hub = RatingsHub(poll_rating_changes, interval=RATINGS_PUSH_INTERVAL_MS / 1000)
+
+
+@app.route("/api/ratings/<song_id>/stream")
+def ratings_stream(song_id):
+    """Push the song's live tally as Server-Sent Events, coalesced per interval"""
+    song_id = str(song_id)[:100]  # Sanitize input
+    if not stream_slots.try_acquire():
+        return streams_full_response()
+
+    try:
+        conn = get_db_connection()
+        song_ref = intern_song_id(conn, song_id)
+        version = 0
+        if song_ref is not None:
+            version = conn.execute(
+                "SELECT ratings_version FROM songs WHERE id = ?", (song_ref,)
+            ).fetchone()[0]
+        tally = get_song_tally(conn, song_ref)
+    except Exception:
+        stream_slots.release()
+        return jsonify({"error": "Internal server error"}), 500
+
+    ratings_hub.start()
+    broadcast = ratings_hub.subscribe(song_id, version, tally)
+    return event_stream_response(
+        broadcast, lambda: ratings_hub.unsubscribe(song_id)
+    )
+
+
 @app.route("/api/ratings/<song_id>", methods=["POST"])
 def rate_song(song_id):
     """Rate song with validation and cache invalidation"""
@@ -333,55 +920,39 @@ def rate_song(song_id):
                 400,
             )
 
-        user_fingerprint = generate_user_fingerprint(request)
+        user_fingerprint = get_listener_id(request)
         conn = get_db_connection()
+        song_ref = intern_song_id(conn, song_id, create=True)
+
+        existing = conn.execute(
+            "SELECT rating FROM song_ratings"
+            " WHERE song_id = ? AND user_fingerprint = ?",
+            (song_ref, user_fingerprint),
+        ).fetchone()
 
         # Use UPSERT for better performance
-        try:
-            conn.execute(
-                """
-                INSERT INTO song_ratings (song_id, user_fingerprint, rating)
-                VALUES (?, ?, ?)
-                ON CONFLICT(song_id, user_fingerprint) 
-                DO UPDATE SET rating = ?, created_at = CURRENT_TIMESTAMP
-                """,
-                (song_id, user_fingerprint, rating, rating),
-            )
-            conn.commit()
+        conn.execute(
+            """
+            INSERT INTO song_ratings (song_id, user_fingerprint, rating)
+            VALUES (?, ?, ?)
+            ON CONFLICT(song_id, user_fingerprint) 
+            DO UPDATE SET rating = excluded.rating, created_at = CURRENT_TIMESTAMP
+            """,
+            (song_ref, user_fingerprint, rating),
+        )
+        # Tells every worker's ratings_hub that this song's tally may have moved
+        conn.execute(
+            "UPDATE songs SET ratings_version = ratings_version + 1 WHERE id = ?",
+            (song_ref,),
+        )
+        conn.commit()
+        if existing:
+            message = "Rating updated successfully"
+        else:
             message = "Rating submitted successfully"
-        except sqlite3.OperationalError:
-            # Fallback for older SQLite versions
-            existing = conn.execute(
-                "SELECT id FROM song_ratings WHERE song_id = ? AND user_fingerprint = ?",
-                (song_id, user_fingerprint),
-            ).fetchone()
-
-            if existing:
-                conn.execute(
-                    """UPDATE song_ratings SET rating = ?, created_at = CURRENT_TIMESTAMP 
-                    WHERE song_id = ? AND user_fingerprint = ?""",
-                    (rating, song_id, user_fingerprint),
-                )
-                message = "Rating updated successfully"
-            else:
-                conn.execute(
-                    "INSERT INTO song_ratings (song_id, user_fingerprint, rating) VALUES (?, ?, ?)",
-                    (song_id, user_fingerprint, rating),
-                )
-                message = "Rating submitted successfully"
-
-            conn.commit()
 
         # Get updated ratings
-        ratings = conn.execute(
-            """
-            SELECT 
-                SUM(CASE WHEN rating = 1 THEN 1 ELSE 0 END) as thumbs_up,
-                SUM(CASE WHEN rating = -1 THEN 1 ELSE 0 END) as thumbs_down
-            FROM song_ratings WHERE song_id = ?
-            """,
-            (song_id,),
-        ).fetchone()
+        thumbs_up, thumbs_down = get_song_tally(conn, song_ref)
 
         # Clear cache for this song
         cache_key = get_cache_key("ratings", song_id)
@@ -391,8 +962,8 @@ def rate_song(song_id):
         result = {
             "message": message,
             "song_id": song_id,
-            "thumbs_up": ratings["thumbs_up"] or 0,
-            "thumbs_down": ratings["thumbs_down"] or 0,
+            "thumbs_up": thumbs_up,
+            "thumbs_down": thumbs_down,
             "user_rating": rating,
         }
 
@@ -404,74 +975,626 @@ def rate_song(song_id):
         return jsonify({"error": "Internal server error"}), 500
 
 
+ALBUM_ART_TYPES = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def album_art_mimetype(filename):
+    """Content type for album art based on file extension"""
+    if filename.endswith(".webp"):
+        return "image/webp"
+    elif filename.endswith(".png"):
+        return "image/png"
+    return "image/jpeg"  # default, also for .jpg/.jpeg
+
+
 @app.route("/album-art")
 @app.route("/album-art/")
 @app.route("/album-art/<filename>")
 @app.route("/album-art/<path:filename>")
 def serve_album_art(filename=None):
-    """Proxy album art from CloudFront with correct content-type"""
+    """Serve album art from the disk cache with correct content-type
+
+    ?w= and ?h= scale the cover down, and clients that list image/avif or
+    image/webp in Accept get that format instead of the original.
+    """
+    # Default to cover.jpg if no filename specified
+    if not filename:
+        filename = "cover.jpg"
+
+    # Only image names under the origin root
+    if ".." in filename.split("/") or not filename.endswith(ALBUM_ART_TYPES):
+        abort(404)
+
+    width = height = None
+    fmt = original_format = source_format(filename)
+    if album_art_variants.enabled:
+        width = snap_size(request.args.get("w"))
+        height = snap_size(request.args.get("h"))
+        fmt = album_art_variants.negotiate(request.accept_mimetypes, original_format)
+    wants_variant = bool(width or height) or fmt != original_format
+
+    if use_accel_redirect() and not wants_variant:
+        # nginx fetches and caches
+        response = accel_redirect(
+            ACCEL_ALBUM_ART_PREFIX + filename, album_art_mimetype(filename)
+        )
+        response.vary.add("Accept")
+        return add_cache_headers(response, max_age=CACHE_TIMEOUT)
+
     try:
-        import requests
-        
-        # Default to cover.jpg if no filename specified
-        if not filename:
-            filename = "cover.jpg"
-        
-        cloudfront_url = f"https://d3d4yli4hf5bmh.cloudfront.net/{filename}"
-        
-        # Fetch image from CloudFront
-        resp = requests.get(cloudfront_url, timeout=10)
-        resp.raise_for_status()
-        
-        # Create response with correct content type
-        response = make_response(resp.content)
-        
-        # Set correct content type based on file extension
-        if filename.endswith('.webp'):
-            response.headers['Content-Type'] = 'image/webp'
-        elif filename.endswith('.png'):
-            response.headers['Content-Type'] = 'image/png'
-        elif filename.endswith(('.jpg', '.jpeg')):
-            response.headers['Content-Type'] = 'image/jpeg'
-        else:
-            response.headers['Content-Type'] = 'image/jpeg'  # default
-        
+        entry = album_art_cache.get(filename)
+        mimetype = album_art_mimetype(filename)
+
+        if wants_variant:
+            try:
+                variant = album_art_variants.get(entry, fmt, width, height)
+            except Exception as e:
+                log.warning("Failed to render album art variant: %s", e)
+                variant = None
+            # A render still in progress is served as the original this time
+            if variant is not None:
+                entry, mimetype = variant, FORMAT_MIMETYPES[fmt]
+
+        response = make_entry_response(
+            entry,
+            request.environ,
+            mimetype,
+            response_class=app.response_class,
+        )
+        response.vary.add("Accept")
+
         # Add caching headers for images
         return add_cache_headers(response, max_age=CACHE_TIMEOUT)
-        
+
     except ImportError:
         # If requests is not available, redirect to original URL
-        from flask import redirect
-        cloudfront_url = f"https://d3d4yli4hf5bmh.cloudfront.net/{filename or 'cover.jpg'}"
+        cloudfront_url = f"{ALBUM_ART_ORIGIN}/{filename}"
         return redirect(cloudfront_url)
     except Exception as e:
-        print(f"Failed to fetch album art: {e}")
+        log.warning("Failed to fetch album art: %s", e)
         # Fallback to direct CloudFront URL
-        from flask import redirect
-        cloudfront_url = f"https://d3d4yli4hf5bmh.cloudfront.net/{filename or 'cover.jpg'}"
+        cloudfront_url = f"{ALBUM_ART_ORIGIN}/{filename}"
         return redirect(cloudfront_url)
 
 
-@app.route("/health")
-def health_check():
-    """Health check endpoint"""
+def parse_recently_played(metadata):
+    """Previous tracks from the prev_* metadata fields, newest first"""
+    tracks = []
+    for i in range(1, 6):
+        artist = metadata.get(f"prev_artist_{i}")
+        title = metadata.get(f"prev_title_{i}")
+        if artist and title:
+            tracks.append(
+                {
+                    "artist": artist,
+                    "title": title,
+                    "album": metadata.get(f"prev_album_{i}") or "",
+                }
+            )
+    return tracks
+
+
+def stream_url():
+    """HLS playlist URL for players: the local relay when enabled, else the origin"""
+    if hls_relay is not None:
+        return f"{hls_relay.prefix}{hls_relay.playlist_name}"
+    return HLS_ORIGIN_URL
+
+
+def build_bootstrap_shared(snapshot):
+    """Track-level part of /api/bootstrap, the same for every listener"""
+    album_art = {"url": f"/album-art/cover.jpg?v={snapshot.id}"}
+    if not use_accel_redirect():
+        try:
+            # cover.jpg is replaced upstream on every track change
+            entry = album_art_cache.get(
+                "cover.jpg", validated_after=snapshot.changed_at
+            )
+            album_art = {
+                "url": f"/album-art/cover.jpg?v={entry.etag[:16]}",
+                "etag": f'"{entry.etag}"',
+                "last_modified": http_date(entry.mtime),
+            }
+        except Exception as e:
+            log.warning("Failed to fetch album art for bootstrap: %s", e)
+
+    return {
+        "id": snapshot.id,
+        "stream_url": stream_url(),
+        "song_id": snapshot.song_id,
+        "metadata": snapshot.metadata,
+        "recently_played": parse_recently_played(snapshot.metadata),
+        "album_art": album_art,
+    }
+
+
+def get_bootstrap_shared(snapshot):
+    """Shared bootstrap part for snapshot, built once per track change
+
+    The build can wait on the album art origin, so it runs outside
+    bootstrap_lock on the first request to need it. Meanwhile other requests
+    get the previous track's part, or wait for the build if there is none.
+    """
+    with bootstrap_lock:
+        cached = bootstrap_cache.get(snapshot.id)
+        if cached is not None:
+            return cached[1]
+        pending = bootstrap_builds.get(snapshot.id)
+        owner = pending is None
+        if owner:
+            pending = bootstrap_builds[snapshot.id] = Future()
+        previous = next(iter(bootstrap_cache.values()), None)
+    if not owner:
+        if previous is not None:
+            return previous[1]
+        return pending.result()
+
     try:
+        shared = build_bootstrap_shared(snapshot)
+    except Exception as e:
+        with bootstrap_lock:
+            del bootstrap_builds[snapshot.id]
+        pending.set_exception(e)
+        raise
+
+    with bootstrap_lock:
+        del bootstrap_builds[snapshot.id]
+        # A slow build for an older track must not replace a newer one
+        latest = next(iter(bootstrap_cache.values()), None)
+        if latest is None or latest[0] <= snapshot.changed_at:
+            bootstrap_cache.clear()
+            bootstrap_cache[snapshot.id] = (snapshot.changed_at, shared)
+    pending.set_result(shared)
+    return shared
+
+
+@app.route("/api/bootstrap")
+def bootstrap():
+    """Everything the player needs for first paint in one response"""
+    now_playing.start()
+    snapshot = now_playing.current
+    if snapshot is None:
+        # Just started; the first poll is usually a moment away
+        now_playing.broadcast.wait(0, BOOTSTRAP_WAIT_SECONDS)
+        snapshot = now_playing.current
+    if snapshot is None:
+        response = jsonify({"error": "Now playing metadata unavailable"})
+        response.status_code = 503
+        response.headers["Retry-After"] = "2"
+        return response
+
+    try:
+        shared = get_bootstrap_shared(snapshot)
         conn = get_db_connection()
-        conn.execute("SELECT 1").fetchone()
+        song_ref = intern_song_id(conn, shared["song_id"])
+        tally, cache_status = get_cached_tally(conn, shared["song_id"], song_ref)
+        user_rating = get_user_rating(conn, song_ref, get_listener_id(request))
+    except Exception:
+        return jsonify({"error": "Internal server error"}), 500
 
-        # Determine database type based on connection
-        db_type = "postgresql" if DATABASE.startswith('postgresql://') else "sqlite"
+    # Flask-Compress appends ":gzip" or ":br" to the ETag it sends
+    etag = f"{shared['id']}-{tally[0]}-{tally[1]}-{user_rating or 0}"
+    seen = request.if_none_match.as_set(include_weak=True)
+    if any(tag.split(":")[0] == etag for tag in seen):
+        response = app.response_class(status=304)
+        response.set_etag(etag, weak=True)
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
+
+    result = dict(shared)
+    result["ratings"] = {
+        "song_id": shared["song_id"],
+        "thumbs_up": tally[0],
+        "thumbs_down": tally[1],
+        "user_rating": user_rating,
+    }
 
-        return jsonify(
-            {
-                "status": "healthy",
-                "timestamp": datetime.utcnow().isoformat(),
-                "database": db_type,
-                "cache_size": len(cache),
-            }
-        )
+    response = make_response(jsonify(result))
+    response.headers["X-Cache"] = cache_status
+    # Holds the caller's own vote, so only the browser may reuse it
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.set_etag(etag, weak=True)
+    return response
+
+
+@app.route("/hls/<path:name>")
+def serve_hls(name):
+    """Relay the HLS stream from memory when HLS_RELAY is enabled"""
+    mimetype = hls_mimetype(name)
+    if hls_relay is None or mimetype is None or ".." in name.split("/"):
+        abort(404)
+    name = hls_relay.resolve(name, request.query_string.decode())
+
+    try:
+        if is_playlist(name):
+            playlist = hls_relay.get_playlist(name)
+            entry, max_age, immutable = playlist.entry, int(playlist.ttl), False
+        else:
+            # Live segment names are never reused
+            entry = hls_relay.get_segment(name)
+            max_age, immutable = CACHE_TIMEOUT, True
+            count_listener()
     except Exception as e:
-        return jsonify({"status": "unhealthy", "error": str(e)}), 500
+        log.warning("Failed to relay %s: %s", name, e)
+        # Let the player go to the origin itself
+        return redirect(urljoin(hls_relay.base_url, name))
+
+    response = make_entry_response(
+        entry, request.environ, mimetype, response_class=app.response_class
+    )
+    return add_cache_headers(response, max_age=max_age, immutable=immutable)
+
+
+def count_listener():
+    """Count the caller as listening right now"""
+    try:
+        listener_counter.add(get_listener_id(request))
+    except Exception as e:
+        log.warning("Failed to count listener: %s", e)
+
+
+@app.route("/api/heartbeat", methods=["POST"])
+def heartbeat():
+    """Sent by the player every 30 seconds while it is playing"""
+    count_listener()
+    return "", 204
+
+
+@app.route("/api/listeners")
+def get_listeners():
+    """Approximate current and peak listener counts"""
+    cache_key = get_cache_key("listeners")
+    stats = get_cached_response(cache_key, max_age=5)
+    cache_status = "HIT" if stats else "MISS"
+    if not stats:
+        stats = listener_counter.stats()
+        set_cache(cache_key, stats)
+
+    response = make_response(jsonify(stats))
+    response.headers["X-Cache"] = cache_status
+    return add_cache_headers(response, max_age=5)
+
+
+def record_track_change(snapshot, is_leader):
+    """Add a new track to this worker's history; the poller leader also stores it"""
+    play = play_from_snapshot(snapshot)
+    if play_history.record(play) and is_leader:
+        store_play(get_background_db_connection(), play)
+
+
+def store_play(conn, play):
+    """Save a play and the song's metadata"""
+    conn.execute(
+        """
+        INSERT INTO songs (song_key, title, artist, album) VALUES (?, ?, ?, ?)
+        ON CONFLICT(song_key) DO UPDATE SET
+            title = excluded.title, artist = excluded.artist, album = excluded.album
+        """,
+        (play.song_id, play.title, play.artist, play.album),
+    )
+    song_ref = conn.execute(
+        "SELECT id FROM songs WHERE song_key = ?", (play.song_id,)
+    ).fetchone()[0]
+
+    # A worker taking over as leader mid-track sees the same track again
+    last = conn.execute("SELECT song_id FROM plays ORDER BY id DESC LIMIT 1").fetchone()
+    if last is None or last[0] != song_ref:
+        conn.execute(
+            "INSERT INTO plays (song_id, played_at) VALUES (?, ?)",
+            (song_ref, play.played_at),
+        )
+    conn.commit()
+
+
+def load_stored_plays(conn, limit):
+    """Up to limit stored plays, newest first"""
+    rows = conn.execute(
+        """
+        SELECT s.song_key, s.title, s.artist, s.album, p.played_at
+        FROM plays p JOIN songs s ON s.id = p.song_id
+        ORDER BY p.id DESC LIMIT ?
+        """,
+        (limit,),
+    ).fetchall()
+    return [Play(*row) for row in rows]
+
+
+@app.route("/api/history")
+def get_history():
+    """Recently played tracks, newest first, from the in-memory ring buffer"""
+    try:
+        limit = int(request.args.get("limit", HISTORY_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({"error": "Invalid limit value"}), 400
+    if not 1 <= limit <= HISTORY_MAX_LIMIT:
+        return (
+            jsonify({"error": f"Limit must be between 1 and {HISTORY_MAX_LIMIT}"}),
+            400,
+        )
+
+    # The poller feeds the buffer
+    now_playing.start()
+
+    try:
+        plays = play_history.recent(limit)
+        cache_status = "HIT"
+        if plays is None:
+            conn = get_db_connection()
+            cache_status = "MISS"
+            if not play_history.warmed:
+                # Once per worker, so plays from before it started are known
+                stored = load_stored_plays(conn, play_history.size)
+                play_history.warm(stored[::-1])
+                plays = play_history.recent(limit)
+            if plays is None:
+                plays = load_stored_plays(conn, limit)
+    except Exception:
+        return jsonify({"error": "Internal server error"}), 500
+
+    response = make_response(jsonify({"plays": [play.to_dict() for play in plays]}))
+    response.headers["X-Cache"] = cache_status
+    return add_cache_headers(response, max_age=10)
+
+
+def upstream_sessions():
+    """(pool name, requests.Session) for the HTTP pools this worker has opened"""
+    pools = [("album_art", album_art_cache), ("metadata", now_playing)]
+    if hls_relay is not None:
+        pools.append(("hls", hls_relay))
+    for pool, client in pools:
+        session = client.opened_session()
+        if session is not None:
+            yield pool, session
+
+
+def collect_gauges():
+    """Point-in-time gauges, read whenever this worker's metrics are written"""
+    yield "radiocalico_response_cache_entries", (), len(cache) + len(bootstrap_cache)
+    yield "radiocalico_sse_subscribers", (), stream_slots.count
+    for pool, session in upstream_sessions():
+        opened, sent, idle = http_pool_stats(session)
+        yield "radiocalico_upstream_pool_connections_opened", (pool,), opened
+        yield "radiocalico_upstream_pool_connections_idle", (pool,), idle
+        yield "radiocalico_upstream_pool_requests", (pool,), sent
+
+
+registry.add_collector(collect_gauges)
+
+
+@app.route("/metrics")
+def get_metrics():
+    """Prometheus metrics for every worker sharing RUNTIME_DIR"""
+    response = Response(registry.render(), content_type=METRICS_CONTENT_TYPE)
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+def admin_authorized():
+    """Whether the request carries ADMIN_TOKEN as a bearer token"""
+    supplied = request.headers.get("Authorization", "")
+    return hmac.compare_digest(supplied.encode(), f"Bearer {ADMIN_TOKEN}".encode())
+
+
+def admin_required(view):
+    """Refuse requests without the admin token; 404 when none is configured"""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({"error": "Not found"}), 404
+        if not admin_authorized():
+            return jsonify({"error": "Unauthorized"}), 401
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+# One CPU profile at a time per worker
+profiler_lock = threading.Lock()
+
+
+@app.route("/admin/profile/cpu")
+@admin_required
+def profile_cpu():
+    """Sample this worker's thread stacks for ?seconds= (default 10)
+
+    Returns collapsed stacks for flamegraph.pl or speedscope. Only the
+    worker that handles the request is profiled, and only its threads that
+    are handling requests unless ?threads=all.
+    """
+    try:
+        seconds = float(request.args.get("seconds", "10"))
+    except ValueError:
+        return jsonify({"error": "seconds must be a number"}), 400
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        return jsonify({"error": f"seconds must be 0-{PROFILE_MAX_SECONDS}"}), 400
+
+    if not profiler_lock.acquire(blocking=False):
+        return jsonify({"error": "A profile is already running"}), 409
+    try:
+        active = None if request.args.get("threads") == "all" else request_threads
+        stacks, samples = sample_stacks(seconds, active=active)
+    finally:
+        profiler_lock.release()
+
+    response = Response(format_collapsed(stacks), mimetype="text/plain")
+    response.headers["Content-Disposition"] = (
+        f'attachment; filename="cpu-{os.getpid()}.folded"'
+    )
+    response.headers["X-Profile-Samples"] = str(samples)
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+# tracemalloc snapshots of this worker, compared to find what keeps growing
+memory_snapshots = SnapshotStore()
+
+
+def memory_report_args():
+    """(group_by, limit) from the query string, or raise ValueError"""
+    group_by = request.args.get("group_by", "line")
+    if group_by not in MEMORY_GROUP_BY:
+        raise ValueError(f"group_by must be one of {', '.join(MEMORY_GROUP_BY)}")
+    limit = int(request.args.get("limit", "25"))
+    if not 0 < limit <= 500:
+        raise ValueError("limit must be 1-500")
+    return group_by, limit
+
+
+@app.route("/admin/memory")
+@admin_required
+def memory_status():
+    """Whether this worker is tracing, traced bytes and snapshot ids"""
+    return jsonify(memory_snapshots.status())
+
+
+@app.route("/admin/memory/start", methods=["POST"])
+@admin_required
+def start_memory_tracing():
+    """Start tracemalloc in this worker, recording ?frames= frames (default 1)"""
+    try:
+        frames = int(request.args.get("frames", "1"))
+    except ValueError:
+        frames = 0
+    if not 0 < frames <= 25:
+        return jsonify({"error": "frames must be 1-25"}), 400
+    memory_snapshots.start(frames)
+    return jsonify(memory_snapshots.status())
+
+
+@app.route("/admin/memory/stop", methods=["POST"])
+@admin_required
+def stop_memory_tracing():
+    """Stop tracemalloc and drop this worker's snapshots"""
+    memory_snapshots.stop()
+    return jsonify(memory_snapshots.status())
+
+
+@app.route("/admin/memory/snapshots", methods=["POST"])
+@admin_required
+def take_memory_snapshot():
+    """Take a snapshot and return its largest allocation sites"""
+    try:
+        group_by, limit = memory_report_args()
+        snapshot_id = memory_snapshots.take()
+    except (RuntimeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(memory_snapshots.top(snapshot_id, group_by, limit)), 201
+
+
+@app.route("/admin/memory/snapshots/<int:snapshot_id>")
+@admin_required
+def get_memory_snapshot(snapshot_id):
+    """Largest allocation sites of an earlier snapshot"""
+    try:
+        group_by, limit = memory_report_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        return jsonify(memory_snapshots.top(snapshot_id, group_by, limit))
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
+
+
+@app.route("/admin/memory/diff")
+@admin_required
+def diff_memory_snapshots():
+    """Allocation sites that changed most between ?from= and ?to= snapshots"""
+    try:
+        group_by, limit = memory_report_args()
+        old_id = int(request.args.get("from", ""))
+        new_id = int(request.args.get("to", ""))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        return jsonify(memory_snapshots.diff(old_id, new_id, group_by, limit))
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
+
+
+def probe_database():
+    """SELECT 1 on the prober thread's own long-lived connection"""
+    conn = get_background_db_connection()
+    try:
+        conn.execute("SELECT 1").fetchone()
+    except Exception:
+        # Reconnect next round rather than keep a broken connection
+        background_db.conn = None
+        conn.close()
+        raise
+    return {"type": "postgresql" if DATABASE.startswith("postgresql://") else "sqlite"}
+
+
+def probe_caches():
+    """The shared cache and runtime directories must be writable"""
+    for directory in (ALBUM_ART_CACHE_DIR, RUNTIME_DIR):
+        os.makedirs(directory, exist_ok=True)
+        if not os.access(directory, os.W_OK):
+            raise OSError(f"{directory} is not writable")
+    return {"response_cache_entries": len(cache)}
+
+
+def probe_album_art_origin():
+    """HEAD the current cover at the origin through the album art pool"""
+    resp = album_art_cache.session.head(
+        f"{album_art_cache.origin}/cover.jpg", timeout=HEALTH_PROBE_TIMEOUT
+    )
+    if resp.status_code >= 500:
+        raise RuntimeError(f"origin returned HTTP {resp.status_code}")
+    return {"http_status": resp.status_code}
+
+
+def health_saturation():
+    """How full this worker's request, stream and upstream pools are"""
+    in_flight = sum(
+        values[0]
+        for (name, _), values in registry.totals().items()
+        if name == IN_FLIGHT.name
+    )
+    pools = {}
+    for pool, session in upstream_sessions():
+        opened, _, idle = http_pool_stats(session)
+        pools[pool] = {"connections": opened, "idle": idle}
+    return {
+        "saturation": {
+            "requests_in_flight": int(in_flight),
+            "sse_subscribers": stream_slots.count,
+            "sse_max_subscribers": SSE_MAX_SUBSCRIBERS,
+            "upstream_pools": pools,
+        }
+    }
+
+
+health_prober = HealthProber(
+    {
+        "database": probe_database,
+        "caches": probe_caches,
+        "album_art_origin": probe_album_art_origin,
+    },
+    critical=("database", "caches"),
+    details=health_saturation,
+    interval=HEALTH_PROBE_INTERVAL,
+)
+
+
+def cached_health_response(status_and_body):
+    status, body = status_and_body
+    response = Response(body, status=status, mimetype="application/json")
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+@app.route("/health/live")
+def health_live():
+    """Liveness: this worker's heartbeat thread is still ticking"""
+    return cached_health_response(health_prober.live())
+
+
+@app.route("/health")
+@app.route("/health/ready")
+def health_check():
+    """Readiness from the last background probe round; never queries inline"""
+    return cached_health_response(health_prober.ready())
 
 
 # Error handlers
@@ -490,13 +1613,20 @@ def internal_error(error):
     return jsonify({"error": "Internal server error"}), 500
 
 
-# Initialize database when the module is imported (for WSGI servers)
+# Bring the schema up to date when the module is imported. Under gunicorn
+# the master has already done so (gunicorn.conf.py), so each worker only
+# reads the stored version
 try:
-    with app.app_context():
-        init_db()
-        print(f"Database initialized at {DATABASE}")
+    schema_started = time.perf_counter()
+    ensure_schema(DATABASE)
+    log.info(
+        "Database schema version %d checked in %.1f ms at %s",
+        SCHEMA_VERSION,
+        (time.perf_counter() - schema_started) * 1000,
+        DATABASE,
+    )
 except Exception as e:
-    print(f"Failed to initialize database: {e}")
+    log.error("Failed to initialize database: %s", e)
 
 if __name__ == "__main__":
     # Enable debug mode only in development
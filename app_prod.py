@@ -1,22 +1,47 @@
 import hashlib
 import logging
 import os
+import threading
+from collections import OrderedDict
 from datetime import datetime
 
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, g, jsonify, request, send_from_directory
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import text
-
-# Configure logging for production
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[logging.StreamHandler()],
+from sqlalchemy import inspect, text
+from sqlalchemy.dialects.postgresql import insert as postgres_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+
+from listener_identity import (
+    LISTENER_COOKIE_MAX_AGE,
+    LISTENER_COOKIE_NAME,
+    load_secret,
+    sign_listener_id,
+    verify_listener_cookie,
+)
+from request_profile import listen_sqlalchemy, profile_requests
+from schema import fingerprint_to_bytes
+from structured_logging import configure_logging, log_requests, parse_sample_rates
+
+# Configure logging for production: JSON lines written by a background
+# thread, dropping and counting records rather than blocking when it lags
+configure_logging(
+    os.getenv("LOG_LEVEL", "INFO").upper(),
+    queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
 )
 
 app = Flask(__name__)
 
+# Access log, sampled per URL rule; slow requests and errors always logged
+log_requests(
+    app,
+    logging.getLogger("radiocalico.access"),
+    float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "1")),
+    parse_sample_rates(os.getenv("ACCESS_LOG_ROUTE_RATES", "/health=0.01")),
+    float(os.getenv("LOG_SLOW_REQUEST_MS", "1000")),
+)
+
 # Configure CORS for production
 CORS(app, origins=os.getenv("ALLOWED_ORIGINS", "*").split(","))
 
@@ -33,8 +58,22 @@ else:
     USE_POSTGRES = False
 
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+# INSERT ... ON CONFLICT for the configured database
+upsert_insert = postgres_insert if USE_POSTGRES else sqlite_insert
 db = SQLAlchemy(app)
 
+# Per-request SQL timings in a Server-Timing header; off by default
+if os.getenv("REQUEST_PROFILE") == "1":
+    with app.app_context():
+        listen_sqlalchemy(db.engine)
+    profile_requests(
+        app,
+        float(os.getenv("REQUEST_PROFILE_SLOW_MS", "500")),
+        log=logging.warning,
+    )
+
+LISTENER_SECRET = load_secret(os.getenv("LISTENER_SECRET_FILE", ".listener_secret"))
+
 
 # Database Models
 class User(db.Model):
@@ -45,11 +84,24 @@ class User(db.Model):
     created_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
 
 
+class Song(db.Model):
+    __tablename__ = "songs"
+    id = db.Column(db.Integer, primary_key=True)
+    song_key = db.Column(db.String(100), unique=True, nullable=False)
+    ratings_version = db.Column(
+        db.Integer, nullable=False, default=0, server_default=text("0")
+    )
+    title = db.Column(db.String(500))
+    artist = db.Column(db.String(500))
+    album = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
+
+
 class SongRating(db.Model):
     __tablename__ = "song_ratings"
     id = db.Column(db.Integer, primary_key=True)
-    song_id = db.Column(db.String(100), nullable=False)
-    user_fingerprint = db.Column(db.String(32), nullable=False)
+    song_id = db.Column(db.Integer, db.ForeignKey("songs.id"), nullable=False)
+    user_fingerprint = db.Column(db.LargeBinary(16), nullable=False)
     rating = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
 
@@ -72,18 +124,108 @@ def init_db():
                 # For SQLite, ensure directory exists
                 db_path = os.getenv("DATABASE_PATH", "/app/data/database.db")
                 os.makedirs(os.path.dirname(db_path), exist_ok=True)
-                logging.info(f"SQLite database at {db_path}")
+                logging.info("SQLite database at %s", db_path)
 
             # Create tables
             db.create_all()
+            migrate_legacy_song_ratings()
             logging.info("Database tables created successfully")
     except Exception as e:
-        logging.error(f"Database initialization failed: {e}")
+        logging.error("Database initialization failed: %s", e)
         raise
 
 
+def migrate_legacy_song_ratings():
+    """Move text-keyed song_ratings onto songs ids and binary fingerprints"""
+    columns = {
+        column["name"]: column["type"]
+        for column in inspect(db.engine).get_columns("song_ratings")
+    }
+    if isinstance(columns["user_fingerprint"], db.LargeBinary):
+        return
+
+    logging.info("Migrating song_ratings to interned song ids")
+    db.session.execute(
+        text(
+            "INSERT INTO songs (song_key) SELECT DISTINCT song_id FROM song_ratings "
+            "WHERE true ON CONFLICT (song_key) DO NOTHING"
+        )
+    )
+
+    if USE_POSTGRES:
+        for statement in (
+            "ALTER TABLE song_ratings ADD COLUMN song_ref INTEGER",
+            "UPDATE song_ratings r SET song_ref = s.id FROM songs s "
+            "WHERE s.song_key = r.song_id",
+            "ALTER TABLE song_ratings DROP COLUMN song_id",
+            "ALTER TABLE song_ratings RENAME COLUMN song_ref TO song_id",
+            "ALTER TABLE song_ratings ALTER COLUMN song_id SET NOT NULL",
+            "ALTER TABLE song_ratings ADD FOREIGN KEY (song_id) REFERENCES songs(id)",
+            # Same packing as schema.fingerprint_to_bytes: hex to 16 bytes,
+            # anything else to its MD5, so no legacy row stops the migration
+            "ALTER TABLE song_ratings ALTER COLUMN user_fingerprint TYPE bytea "
+            "USING CASE WHEN user_fingerprint ~ '^([0-9a-fA-F]{2})*$' "
+            "THEN overlay(decode(repeat('00', 16), 'hex') placing "
+            "substring(decode(user_fingerprint, 'hex') from 1 for 16) from 1) "
+            "ELSE decode(md5(user_fingerprint), 'hex') END",
+            "ALTER TABLE song_ratings ADD UNIQUE (song_id, user_fingerprint)",
+        ):
+            db.session.execute(text(statement))
+    else:
+        # SQLite cannot change column types in place, so rebuild the table
+        db.session.execute(
+            text("ALTER TABLE song_ratings RENAME TO song_ratings_legacy")
+        )
+        db.session.commit()
+        SongRating.__table__.create(db.engine)
+        rows = db.session.execute(
+            text(
+                "SELECT s.id, l.user_fingerprint, l.rating, l.created_at "
+                "FROM song_ratings_legacy l JOIN songs s ON s.song_key = l.song_id"
+            )
+        ).fetchall()
+        if rows:
+            db.session.execute(
+                text(
+                    # Packed fingerprints may now coincide; keep the first
+                    "INSERT OR IGNORE INTO song_ratings "
+                    "(song_id, user_fingerprint, rating, created_at) "
+                    "VALUES (:song_id, :user_fingerprint, :rating, :created_at)"
+                ),
+                [
+                    {
+                        "song_id": song_ref,
+                        "user_fingerprint": fingerprint_to_bytes(fingerprint),
+                        "rating": rating,
+                        "created_at": created_at,
+                    }
+                    for song_ref, fingerprint, rating, created_at in rows
+                ],
+            )
+        db.session.execute(text("DROP TABLE song_ratings_legacy"))
+
+    db.session.commit()
+    logging.info("song_ratings migration complete")
+
+
+@app.after_request
+def issue_listener_cookie(response):
+    """Hand out a signed listener id the first time we had to derive one"""
+    if g.get("issue_listener_cookie"):
+        response.set_cookie(
+            LISTENER_COOKIE_NAME,
+            sign_listener_id(LISTENER_SECRET, g.listener_id),
+            max_age=LISTENER_COOKIE_MAX_AGE,
+            secure=request.is_secure,
+            httponly=True,
+            samesite="Lax",
+        )
+    return response
+
+
 @app.route("/")
 def home():
+    get_listener_id(request)
     return send_from_directory(".", "index.html")
 
 
@@ -115,7 +257,7 @@ def get_users():
             }
         )
     except Exception as e:
-        logging.error(f"Error fetching users: {e}")
+        logging.error("Error fetching users: %s", e)
         return jsonify({"error": "Internal server error"}), 500
 
 
@@ -148,12 +290,12 @@ def create_user():
         db.session.add(user)
         db.session.commit()
 
-        logging.info(f"User created: {user.id} - {email}")
+        logging.info("User created: %s - %s", user.id, email)
         return jsonify({"id": user.id, "message": "User created successfully"}), 201
 
     except Exception as e:
         db.session.rollback()
-        logging.error(f"Error creating user: {e}")
+        logging.error("Error creating user: %s", e)
         return jsonify({"error": "Internal server error"}), 500
 
 
@@ -168,20 +310,71 @@ def generate_user_fingerprint(request):
     return hashlib.md5(fingerprint_data.encode()).hexdigest()
 
 
+def get_listener_id(request):
+    """Return the caller's 16-byte listener id, preferring the signed cookie"""
+    listener_id = g.get("listener_id")
+    if listener_id is None:
+        listener_id = verify_listener_cookie(
+            LISTENER_SECRET, request.cookies.get(LISTENER_COOKIE_NAME)
+        )
+        if listener_id is None:
+            # Seed from the fingerprint so earlier votes stay with this listener
+            listener_id = bytes.fromhex(generate_user_fingerprint(request))
+            g.issue_listener_cookie = True
+        g.listener_id = listener_id
+    return listener_id
+
+
+# Intern cache mapping public song_id strings to integer songs.id values
+SONG_INTERN_CACHE_SIZE = 10000
+song_id_cache = OrderedDict()
+song_id_cache_lock = threading.Lock()
+
+
+def intern_song_id(song_id, create=False):
+    """Map a public song_id string to its songs.id, creating the row if asked"""
+    with song_id_cache_lock:
+        song_ref = song_id_cache.get(song_id)
+        if song_ref is not None:
+            song_id_cache.move_to_end(song_id)
+            return song_ref
+
+    song = Song.query.filter_by(song_key=song_id).first()
+    if song is None:
+        if not create:
+            return None
+        try:
+            # Committed on its own so the cached id never outlives a rollback
+            song = Song(song_key=song_id)
+            db.session.add(song)
+            db.session.commit()
+        except IntegrityError:
+            # Another worker interned the same song first
+            db.session.rollback()
+            song = Song.query.filter_by(song_key=song_id).first()
+
+    with song_id_cache_lock:
+        song_id_cache[song_id] = song.id
+        if len(song_id_cache) > SONG_INTERN_CACHE_SIZE:
+            song_id_cache.popitem(last=False)
+    return song.id
+
+
 @app.route("/api/ratings/<song_id>", methods=["GET"])
 def get_ratings(song_id):
     try:
         # Sanitize song_id
         song_id = str(song_id)[:100]
+        song_ref = intern_song_id(song_id)
 
         # Get rating counts
-        thumbs_up = SongRating.query.filter_by(song_id=song_id, rating=1).count()
-        thumbs_down = SongRating.query.filter_by(song_id=song_id, rating=-1).count()
+        thumbs_up = SongRating.query.filter_by(song_id=song_ref, rating=1).count()
+        thumbs_down = SongRating.query.filter_by(song_id=song_ref, rating=-1).count()
 
         # Get user's rating
-        user_fingerprint = generate_user_fingerprint(request)
+        user_fingerprint = get_listener_id(request)
         user_rating = SongRating.query.filter_by(
-            song_id=song_id, user_fingerprint=user_fingerprint
+            song_id=song_ref, user_fingerprint=user_fingerprint
         ).first()
 
         return jsonify(
@@ -193,7 +386,7 @@ def get_ratings(song_id):
             }
         )
     except Exception as e:
-        logging.error(f"Error fetching ratings for {song_id}: {e}")
+        logging.error("Error fetching ratings for %s: %s", song_id, e)
         return jsonify({"error": "Internal server error"}), 500
 
 
@@ -214,33 +407,47 @@ def rate_song(song_id):
                 400,
             )
 
-        user_fingerprint = generate_user_fingerprint(request)
+        user_fingerprint = get_listener_id(request)
+        song_ref = intern_song_id(song_id, create=True)
 
-        # Check if user already rated this song
+        # Only picks the message; the upsert below decides insert or update
         existing_rating = SongRating.query.filter_by(
-            song_id=song_id, user_fingerprint=user_fingerprint
+            song_id=song_ref, user_fingerprint=user_fingerprint
         ).first()
-
         if existing_rating:
-            # Update existing rating
-            existing_rating.rating = rating
-            existing_rating.created_at = datetime.utcnow()
             message = "Rating updated successfully"
         else:
-            # Create new rating
-            new_rating = SongRating(
-                song_id=song_id, user_fingerprint=user_fingerprint, rating=rating
-            )
-            db.session.add(new_rating)
             message = "Rating submitted successfully"
 
+        # A single upsert, so two first votes racing from the same listener
+        # (a double click, a client retry) cannot both try to insert
+        upsert = upsert_insert(SongRating).values(
+            song_id=song_ref,
+            user_fingerprint=user_fingerprint,
+            rating=rating,
+            created_at=datetime.utcnow(),
+        )
+        db.session.execute(
+            upsert.on_conflict_do_update(
+                index_elements=["song_id", "user_fingerprint"],
+                set_={
+                    "rating": upsert.excluded.rating,
+                    "created_at": upsert.excluded.created_at,
+                },
+            )
+        )
         db.session.commit()
 
         # Get updated rating counts
-        thumbs_up = SongRating.query.filter_by(song_id=song_id, rating=1).count()
-        thumbs_down = SongRating.query.filter_by(song_id=song_id, rating=-1).count()
-
-        logging.info(f"Rating submitted for {song_id}: {rating}")
+        thumbs_up = SongRating.query.filter_by(song_id=song_ref, rating=1).count()
+        thumbs_down = SongRating.query.filter_by(song_id=song_ref, rating=-1).count()
+
+        logging.info(
+            "Rating submitted for %s: %s",
+            song_id,
+            rating,
+            extra={"song_id": song_id, "rating": rating},
+        )
         return jsonify(
             {
                 "message": message,
@@ -255,7 +462,7 @@ def rate_song(song_id):
         return jsonify({"error": "Invalid rating value"}), 400
     except Exception as e:
         db.session.rollback()
-        logging.error(f"Error rating song {song_id}: {e}")
+        logging.error("Error rating song %s: %s", song_id, e)
         return jsonify({"error": "Internal server error"}), 500
 
 
@@ -276,7 +483,7 @@ def health_check():
             200,
         )
     except Exception as e:
-        logging.error(f"Health check failed: {e}")
+        logging.error("Health check failed: %s", e)
         return jsonify({"status": "unhealthy", "error": str(e)}), 500
 
 
@@ -288,7 +495,7 @@ def not_found(error):
 
 @app.errorhandler(500)
 def internal_error(error):
-    logging.error(f"Internal server error: {error}")
+    logging.error("Internal server error: %s", error)
     return jsonify({"error": "Internal server error"}), 500
 
 
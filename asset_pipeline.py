@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Static asset pipeline for Radio Russell
+Copies static assets to content-hashed filenames under static/dist/, writes a
+manifest, rewrites the references in index_optimized.html and the service
+worker, then precompresses the results
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+
+from precompress_assets import find_assets, precompress_file
+
+DIST_DIRNAME = "dist"
+MANIFEST_FILENAME = "manifest.json"
+HASH_LENGTH = 8
+
+# Assets referenced by the player page; HTML entry points and the service
+# worker keep stable URLs so browsers can always find the current build
+FINGERPRINT_EXTENSIONS = (".css", ".js", ".png", ".webp", ".svg", ".ico")
+STABLE_FILENAMES = ("sw.js",)
+
+
+def content_hash(path):
+    """Return a short hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def hashed_filename(filename, digest):
+    """script_optimized.js -> script_optimized.3f9a1c2b.js"""
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}.{digest}{ext}"
+
+
+def fingerprint_assets(static_dir="static"):
+    """Copy fingerprintable assets into static/dist/ and return the manifest
+
+    The manifest maps each logical name (relative to static/) to its hashed
+    name, which is also relative to static/.
+    """
+    dist_dir = os.path.join(static_dir, DIST_DIRNAME)
+    shutil.rmtree(dist_dir, ignore_errors=True)
+    os.makedirs(dist_dir)
+
+    manifest = {}
+    for name in sorted(os.listdir(static_dir)):
+        path = os.path.join(static_dir, name)
+        if (
+            not os.path.isfile(path)
+            or not name.endswith(FINGERPRINT_EXTENSIONS)
+            or name in STABLE_FILENAMES
+        ):
+            continue
+
+        hashed_name = hashed_filename(name, content_hash(path))
+        shutil.copy2(path, os.path.join(dist_dir, hashed_name))
+        manifest[name] = f"{DIST_DIRNAME}/{hashed_name}"
+
+    with open(os.path.join(dist_dir, MANIFEST_FILENAME), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    return manifest
+
+
+def rewrite_references(text, manifest):
+    """Point every static/<name> reference at its hashed filename"""
+    for name, hashed_name in manifest.items():
+        pattern = r"(?<![\w.-])static/" + re.escape(name) + r"(?=[\"'?#)\s])"
+        text = re.sub(pattern, f"static/{hashed_name}", text)
+    return text
+
+
+def build_version(manifest):
+    """Digest of the whole manifest, used to name the service worker cache"""
+    encoded = json.dumps(manifest, sort_keys=True).encode()
+    return hashlib.sha256(encoded).hexdigest()[:HASH_LENGTH]
+
+
+def rewrite_service_worker(text, manifest):
+    """Rewrite STATIC_ASSETS and bump CACHE_NAME so old caches are dropped"""
+    text = rewrite_references(text, manifest)
+    return re.sub(
+        r"const CACHE_NAME = '([\w-]+?)(-v\w+)?';",
+        lambda m: f"const CACHE_NAME = '{m.group(1)}-{build_version(manifest)}';",
+        text,
+        count=1,
+    )
+
+
+def write_rewritten(source_path, target_path, rewrite, manifest):
+    """Apply a rewrite function to source_path and save it as target_path"""
+    with open(source_path, encoding="utf-8") as f:
+        text = f.read()
+    with open(target_path, "w", encoding="utf-8") as f:
+        f.write(rewrite(text, manifest))
+
+
+def build(static_dir="static", root_dir="."):
+    """Run the whole pipeline and return the manifest"""
+    manifest = fingerprint_assets(static_dir)
+    dist_dir = os.path.join(static_dir, DIST_DIRNAME)
+
+    write_rewritten(
+        os.path.join(root_dir, "index_optimized.html"),
+        os.path.join(dist_dir, "index_optimized.html"),
+        rewrite_references,
+        manifest,
+    )
+    write_rewritten(
+        os.path.join(static_dir, "sw.js"),
+        os.path.join(dist_dir, "sw.js"),
+        rewrite_service_worker,
+        manifest,
+    )
+
+    for path in find_assets(static_dir, root_dir):
+        precompress_file(path, force=True)
+
+    return manifest
+
+
+def main():
+    """Main asset pipeline function"""
+    print("📦 Radio Russell Asset Pipeline")
+    print("=" * 40)
+
+    manifest = build()
+    for name, hashed_name in sorted(manifest.items()):
+        print(f"✅ {name} -> {hashed_name}")
+
+    print(f"\n🎉 Build {build_version(manifest)} complete!")
+    print(f"📝 Manifest written to static/{DIST_DIRNAME}/{MANIFEST_FILENAME}")
+
+
+if __name__ == "__main__":
+    main()
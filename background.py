@@ -0,0 +1,57 @@
+"""
+Per-process background threads for Radio Calico
+
+Pollers and probes are started lazily from request handlers, so they run
+in each gunicorn worker rather than in the master. A thread does not
+survive fork, and state inherited from the parent describes the parent,
+so start() checks the process id and starts a fresh thread, after
+resetting that state, the first time it is called in each process.
+"""
+
+import os
+import threading
+
+STOP_TIMEOUT = 5  # seconds stop() waits for the thread to finish
+
+
+class BackgroundThread:
+    """A daemon thread running target, started at most once per process
+
+    target should return soon after stopping is set, e.g. by waiting on it
+    between rounds. on_start, if given, is called before each new thread
+    starts, under the same lock, to drop state left over from a parent.
+    """
+
+    def __init__(self, target, name, on_start=None):
+        self.target = target
+        self.name = name
+        self.on_start = on_start
+        self.stopping = threading.Event()
+        self.pid = None  # process the current thread was started in
+
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def running(self):
+        return self.pid == os.getpid() and self._thread.is_alive()
+
+    def start(self):
+        """Start the thread unless it runs already; cheap to call per request"""
+        if self.running():
+            return
+        with self._lock:
+            if self.running():
+                return
+            if self.on_start is not None:
+                self.on_start()
+            self.stopping.clear()
+            self._thread = threading.Thread(
+                target=self.target, name=self.name, daemon=True
+            )
+            self.pid = os.getpid()
+            self._thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=STOP_TIMEOUT)
@@ -0,0 +1,42 @@
+"""
+Micro-benchmark tests, run explicitly: python -m pytest benchmarks/bench_micro.py
+The file name keeps them out of the default test run, where timing noise on
+shared CI machines would make them flaky
+"""
+
+import pytest
+
+from benchmarks import micro
+
+
+@pytest.fixture(scope="module")
+def bench_app(tmp_path_factory):
+    return micro.load_app(str(tmp_path_factory.mktemp("micro")))
+
+
+@pytest.fixture(scope="module")
+def timings(request):
+    """Timings from this run, stored as baselines afterwards if asked"""
+    results = {}
+    yield results
+    if request.config.getoption("update_baselines") and results:
+        micro.update_baselines(micro.results_document(results))
+
+
+@pytest.mark.parametrize("name", list(micro.CASES))
+def test_hot_path_within_baseline(name, bench_app, timings, request):
+    """Test each hot path is no slower than its baseline allows."""
+    timings[name] = micro.run_case(bench_app, name)
+    if request.config.getoption("update_baselines"):
+        return
+
+    current = micro.results_document({name: timings[name]})
+    entry = micro.compare(
+        current, micro.load_baselines(), request.config.getoption("tolerance")
+    )[name]
+    if entry["status"] == "new":
+        pytest.skip(f"no baseline for {name}; run with --update-baselines")
+    assert entry["status"] != "regressed", (
+        f"{name} took {entry['ns']:.0f} ns, {entry['ratio']}x its baseline "
+        f"of {entry['baseline_ns']:.0f} ns"
+    )
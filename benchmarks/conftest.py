@@ -0,0 +1,21 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.micro import TOLERANCE
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("micro-benchmarks")
+    group.addoption(
+        "--update-baselines",
+        action="store_true",
+        help="store this run's timings as the committed micro-benchmark baselines",
+    )
+    group.addoption(
+        "--tolerance",
+        type=float,
+        default=TOLERANCE,
+        help="allowed slowdown against a baseline, as a fraction",
+    )
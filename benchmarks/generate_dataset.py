@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+"""
+Synthetic dataset generator for Radio Calico scale testing
+Fills a SQLite file or PostgreSQL database with users, songs and ratings in
+the current schema: song popularity follows a Zipf distribution, a minority
+of listeners casts most of the votes, and votes arrive after each song's
+first play with more of them in the evening. Rows are bulk loaded (batched
+executemany on SQLite, COPY on PostgreSQL) with the secondary indexes built
+afterwards, so tens of millions of votes take minutes
+"""
+
+import argparse
+import bisect
+import hashlib
+import io
+import itertools
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import ROOT_DIR
+from now_playing import song_id_for
+
+BATCH_ROWS = 100_000
+DENSE_SHARE = 0.5  # beyond this share of listeners, sample uniformly
+# Relative vote volume per hour of the day, UTC, from midnight
+HOURLY_WEIGHTS = tuple(
+    map(int, "2 1 1 1 1 2 4 6 7 6 5 5 6 5 5 6 7 9 11 12 12 10 7 4".split())
+)
+
+# Rebuilt after loading rather than maintained row by row
+SECONDARY_INDEXES = {
+    "sqlite": {
+        "idx_song_ratings_fingerprint": "song_ratings(user_fingerprint)",
+    },
+    "postgresql": {
+        "idx_song_ratings_user_fingerprint": "song_ratings(user_fingerprint)",
+        "idx_song_ratings_created_at": "song_ratings(created_at DESC)",
+    },
+}
+
+
+def zipf_weights(count, exponent):
+    return [1 / rank**exponent for rank in range(1, count + 1)]
+
+
+def song_vote_counts(songs, ratings, listeners, exponent):
+    """Votes per song by popularity rank, summing to ratings
+
+    No song can have more votes than there are listeners; what a capped
+    song's Zipf share would exceed that by is spread over the rest.
+    """
+    weights = zipf_weights(songs, exponent)
+    remaining, total, capped = min(ratings, songs * listeners), sum(weights), 0
+    while capped < songs and remaining * weights[capped] / total > listeners:
+        remaining -= listeners
+        total -= weights[capped]
+        capped += 1
+    if capped == songs:
+        return [listeners] * songs
+
+    shares = [remaining * w / total for w in weights[capped:]]
+    counts = [int(share) for share in shares]
+    # Largest remainders get the votes lost to rounding down
+    by_remainder = sorted(range(len(shares)), key=lambda i: counts[i] - shares[i])
+    for i in by_remainder[: remaining - sum(counts)]:
+        counts[i] += 1
+    return [listeners] * capped + counts
+
+
+def listener_fingerprint(listener):
+    """16-byte id, shaped like fingerprint_to_bytes(md5 hex) in the apps"""
+    return hashlib.md5(f"synthetic-listener-{listener}".encode()).digest()
+
+
+class VoteSampler:
+    """Picks which listeners vote on a song and when
+
+    Listener activity is Zipf-distributed too, so the same fingerprints
+    recur across many songs while most listeners vote only a few times.
+    """
+
+    def __init__(self, rng, listeners, listener_exponent, days, day_texts):
+        self.rng = rng
+        self.listeners = listeners
+        self.cum_weights = list(
+            itertools.accumulate(zipf_weights(listeners, listener_exponent))
+        )
+        self.days = days
+        self.day_texts = day_texts
+        self.fingerprints = [listener_fingerprint(i) for i in range(listeners)]
+        self.cum_hours = list(itertools.accumulate(HOURLY_WEIGHTS))
+        self.minute_texts = [f"{m // 60:02d}:{m % 60:02d}" for m in range(24 * 60)]
+
+    def listeners_for(self, count):
+        """count distinct listener ids, favouring the active ones"""
+        rng = self.rng
+        if count > self.listeners * DENSE_SHARE:
+            # Most listeners vote anyway; weighted draws would mostly repeat
+            return rng.sample(range(self.listeners), count)
+        chosen = set()
+        for _ in range(4):
+            missing = count - len(chosen)
+            chosen.update(
+                rng.choices(
+                    range(self.listeners),
+                    cum_weights=self.cum_weights,
+                    k=missing + missing // 2 + 8,
+                )
+            )
+            if len(chosen) >= count:
+                break
+        while len(chosen) < count:
+            chosen.add(rng.randrange(self.listeners))
+        return list(chosen)[:count]
+
+    def vote_time(self, first_played_day, decay_days):
+        """A moment after first play, most often within decay_days of it"""
+        rng = self.rng
+        day = first_played_day + int(rng.expovariate(1 / decay_days))
+        if day >= self.days:
+            day = rng.randrange(first_played_day, self.days)
+        hour = bisect.bisect(self.cum_hours, rng.random() * self.cum_hours[-1])
+        minute = self.minute_texts[hour * 60 + int(rng.random() * 60)]
+        return f"{self.day_texts[day]} {minute}:{int(rng.random() * 60):02d}"
+
+
+def timestamp_text(moment):
+    """UTC timestamp in the form CURRENT_TIMESTAMP stores on SQLite"""
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def generate_rows(
+    songs,
+    ratings,
+    listeners,
+    users,
+    song_exponent,
+    listener_exponent,
+    days,
+    decay_days,
+    seed,
+):
+    """(table, columns, row iterator) for each table, in load order"""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    # Day 0 is days ago; formatting each timestamp in full is the slow part
+    day_texts = [
+        (now - timedelta(days=days - day)).strftime("%Y-%m-%d") for day in range(days)
+    ]
+    sampler = VoteSampler(rng, listeners, listener_exponent, days, day_texts)
+    counts = song_vote_counts(songs, ratings, listeners, song_exponent)
+    first_played = [rng.randrange(days) for _ in range(songs)]
+    artists = max(1, songs // 12)
+
+    def song_rows():
+        for index in range(songs):
+            metadata = {
+                "artist": f"Synthetic Artist {index % artists}",
+                "title": f"Track {index}",
+            }
+            yield (
+                index + 1,
+                song_id_for(metadata),
+                counts[index],  # ratings_version is bumped once per vote
+                metadata["title"],
+                metadata["artist"],
+                f"Album {index // 10}",
+                f"{day_texts[first_played[index]]} 00:00:00",
+            )
+
+    def rating_rows():
+        row_id = itertools.count(1)
+        for index, count in enumerate(counts):
+            # Some songs are loved, some are not
+            approval = rng.betavariate(4, 2)
+            fingerprints = sorted(
+                sampler.fingerprints[listener]
+                for listener in sampler.listeners_for(count)
+            )
+            for fingerprint in fingerprints:
+                yield (
+                    next(row_id),
+                    index + 1,
+                    fingerprint,
+                    1 if rng.random() < approval else -1,
+                    sampler.vote_time(first_played[index], decay_days),
+                )
+
+    def user_rows():
+        for index in range(users):
+            joined = now - timedelta(seconds=rng.randrange(days * 86400))
+            yield (
+                index + 1,
+                f"Listener {index}",
+                f"listener{index}@example.com",
+                timestamp_text(joined),
+            )
+
+    return [
+        (
+            "songs",
+            (
+                "id",
+                "song_key",
+                "ratings_version",
+                "title",
+                "artist",
+                "album",
+                "created_at",
+            ),
+            song_rows(),
+        ),
+        (
+            "song_ratings",
+            ("id", "song_id", "user_fingerprint", "rating", "created_at"),
+            rating_rows(),
+        ),
+        ("users", ("id", "name", "email", "created_at"), user_rows()),
+    ]
+
+
+class SqliteLoader:
+    kind = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+
+    def create_schema(self):
+        # app_optimized creates its tables when imported
+        subprocess.run(
+            [sys.executable, "-c", "import app_optimized"],
+            cwd=ROOT_DIR,
+            env=dict(os.environ, DATABASE_PATH=self.path, LOG_LEVEL="WARNING"),
+            stdout=subprocess.DEVNULL,
+            check=True,
+        )
+        self.conn = sqlite3.connect(self.path, isolation_level=None)
+        # Durability is pointless for a scratch dataset being built
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute("PRAGMA cache_size=-262144")
+
+    def row_count(self, table):
+        return self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def execute(self, sql):
+        self.conn.execute(sql)
+
+    def load(self, table, columns, rows):
+        sql = (
+            f"INSERT INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))})"
+        )
+        loaded = 0
+        while True:
+            batch = list(itertools.islice(rows, BATCH_ROWS))
+            if not batch:
+                return loaded
+            self.conn.execute("BEGIN")
+            self.conn.executemany(sql, batch)
+            self.conn.execute("COMMIT")
+            loaded += len(batch)
+
+    def finish(self):
+        self.conn.execute("ANALYZE")
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.close()
+
+
+class CopyStream(io.RawIOBase):
+    """File-like view of rows in COPY text format, read by copy_expert"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.buffer = b""
+        self.count = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while len(self.buffer) < len(target):
+            lines = [
+                "\t".join(copy_value(value) for value in row)
+                for row in itertools.islice(self.rows, 10000)
+            ]
+            if not lines:
+                break
+            self.count += len(lines)
+            self.buffer += ("\n".join(lines) + "\n").encode()
+        size = min(len(target), len(self.buffer))
+        target[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+
+def copy_value(value):
+    if isinstance(value, bytes):
+        return "\\\\x" + value.hex()
+    if isinstance(value, str):
+        return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+    return str(value)
+
+
+class PostgresLoader:
+    kind = "postgresql"
+
+    def __init__(self, url):
+        self.url = url
+
+    def create_schema(self):
+        import psycopg2
+
+        self.conn = psycopg2.connect(self.url)
+        self.conn.autocommit = True
+        # Generated timestamps are UTC, like CURRENT_TIMESTAMP on SQLite
+        self.execute("SET TIME ZONE 'UTC'")
+        # The same DDL the PostgreSQL container runs on first start, minus
+        # psql meta-commands and grants to the container's role
+        with open(os.path.join(ROOT_DIR, "init-db.sql")) as f:
+            script = "".join(
+                line for line in f if not line.lstrip().startswith(("\\", "--"))
+            )
+        with self.conn.cursor() as cur:
+            for statement in filter(None, (s.strip() for s in script.split(";"))):
+                if not statement.upper().startswith("GRANT"):
+                    cur.execute(statement)
+
+    def row_count(self, table):
+        with self.conn.cursor() as cur:
+            cur.execute(f"SELECT COUNT(*) FROM {table}")
+            return cur.fetchone()[0]
+
+    def execute(self, sql):
+        with self.conn.cursor() as cur:
+            cur.execute(sql)
+
+    def load(self, table, columns, rows):
+        stream = CopyStream(rows)
+        with self.conn.cursor() as cur:
+            cur.copy_expert(
+                f"COPY {table} ({', '.join(columns)}) FROM STDIN", stream, 1 << 20
+            )
+            # Explicit ids were loaded, so move the SERIAL sequence past them
+            cur.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"GREATEST((SELECT MAX(id) FROM {table}), 1))"
+            )
+        return stream.count
+
+    def finish(self):
+        self.execute("ANALYZE")
+        self.conn.close()
+
+
+def loader_for(database):
+    if database.startswith("postgresql://"):
+        return PostgresLoader(database)
+    return SqliteLoader(database)
+
+
+def generate(
+    database,
+    songs=50_000,
+    ratings=10_000_000,
+    listeners=1_000_000,
+    users=100_000,
+    song_exponent=1.1,
+    listener_exponent=0.9,
+    days=365,
+    decay_days=14,
+    seed=1,
+):
+    """Fill an empty database and return a report dict"""
+    loader = loader_for(database)
+    started = time.monotonic()
+    loader.create_schema()
+    if loader.row_count("song_ratings") or loader.row_count("songs"):
+        raise RuntimeError(f"{database} already has songs or ratings")
+
+    indexes = SECONDARY_INDEXES[loader.kind]
+    for name in indexes:
+        loader.execute(f"DROP INDEX IF EXISTS {name}")
+
+    report = {"database": loader.kind, "seed": seed, "tables": {}}
+    tables = generate_rows(
+        songs,
+        ratings,
+        listeners,
+        users,
+        song_exponent,
+        listener_exponent,
+        days,
+        decay_days,
+        seed,
+    )
+    for table, columns, rows in tables:
+        table_started = time.monotonic()
+        loaded = loader.load(table, columns, rows)
+        elapsed = time.monotonic() - table_started
+        report["tables"][table] = {
+            "rows": loaded,
+            "seconds": round(elapsed, 1),
+            "rows_per_s": round(loaded / elapsed) if elapsed else None,
+        }
+
+    index_started = time.monotonic()
+    for name, target in indexes.items():
+        loader.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+    loader.finish()
+    report["index_seconds"] = round(time.monotonic() - index_started, 1)
+    report["total_seconds"] = round(time.monotonic() - started, 1)
+
+    counts = song_vote_counts(songs, ratings, listeners, song_exponent)
+    loaded_ratings = report["tables"]["song_ratings"]["rows"]
+    report["popularity"] = {
+        "top_song_votes": counts[0] if counts else 0,
+        "top_1pct_songs_vote_share": (
+            round(sum(counts[: max(1, songs // 100)]) / loaded_ratings, 3)
+            if loaded_ratings
+            else None
+        ),
+        "songs_without_votes": counts.count(0),
+    }
+    return report
+
+
+def main():
+    """Main generator function"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "database", help="SQLite file path or postgresql:// URL; must be empty"
+    )
+    parser.add_argument("--songs", type=int, default=50_000)
+    parser.add_argument("--ratings", type=int, default=10_000_000)
+    parser.add_argument("--listeners", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument(
+        "--song-exponent", type=float, default=1.1, help="Zipf skew of song popularity"
+    )
+    parser.add_argument(
+        "--listener-exponent",
+        type=float,
+        default=0.9,
+        help="Zipf skew of how many votes each listener casts",
+    )
+    parser.add_argument("--days", type=int, default=365, help="history to spread over")
+    parser.add_argument(
+        "--decay-days",
+        type=float,
+        default=14,
+        help="mean days between a song's first play and a vote on it",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    report = generate(
+        args.database,
+        args.songs,
+        args.ratings,
+        args.listeners,
+        args.users,
+        args.song_exponent,
+        args.listener_exponent,
+        args.days,
+        args.decay_days,
+        args.seed,
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Shared helpers for the Radio Calico benchmarks: free ports, gunicorn
+process control, /proc readings and percentiles
+"""
+
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_kb(pid):
+    """Resident set size of a process in KB, from /proc"""
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def cpu_seconds(pid):
+    """User plus system CPU time a process has used, from /proc"""
+    with open(f"/proc/{pid}/stat") as f:
+        # The command name may contain spaces, so split after its parenthesis
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def worker_pids(master_pid, count=1, timeout=10):
+    deadline = time.monotonic() + timeout
+    path = f"/proc/{master_pid}/task/{master_pid}/children"
+    while time.monotonic() < deadline:
+        with open(path) as f:
+            children = [int(pid) for pid in f.read().split()]
+        if len(children) >= count:
+            return children
+        time.sleep(0.05)
+    raise RuntimeError("gunicorn workers did not start")
+
+
+def worker_pid(master_pid, timeout=10):
+    return worker_pids(master_pid, 1, timeout)[0]
+
+
+def wait_for_health(port, timeout=15, path="/health"):
+    deadline = time.monotonic() + timeout
+    request = f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode()
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1) as sock:
+                sock.sendall(request)
+                if sock.recv(64).startswith(b"HTTP/1.1 200"):
+                    return
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError("app did not become healthy")
+
+
+def start_gunicorn(app, port, env, workers=1, threads=None, extra_args=()):
+    """Start gunicorn serving app ("module:app") from the repository root"""
+    args = [
+        sys.executable,
+        "-m",
+        "gunicorn",
+        "--bind",
+        f"127.0.0.1:{port}",
+        "--workers",
+        str(workers),
+        "--log-level",
+        "warning",
+    ]
+    if threads:
+        args += [
+            "--worker-class",
+            "gthread",
+            "--threads",
+            str(threads),
+            "--worker-connections",
+            str(threads + 16),
+        ]
+    args += list(extra_args) + [app]
+    return subprocess.Popen(
+        args, cwd=ROOT_DIR, env=dict(os.environ, **env), stdout=subprocess.DEVNULL
+    )
+
+
+def stop_gunicorn(server, worker_pids=()):
+    """Stop gunicorn without waiting for long-running requests to finish"""
+    # Even gunicorn's quick shutdown waits for streaming threads, so stop
+    # the master first and then kill the workers outright
+    server.send_signal(signal.SIGINT)
+    for pid in worker_pids:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    try:
+        server.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def latency_summary(seconds, pcts=(50, 95, 99)):
+    """Percentiles of a list of durations, in milliseconds"""
+    return {
+        f"p{pct}": round(percentile(seconds, pct) * 1000, 2) if seconds else None
+        for pct in pcts
+    }
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+HLS relay concurrent listener benchmark for Radio Calico
+Runs app_optimized with HLS_RELAY=1 in one gunicorn gthread worker against a
+local live HLS origin, lets N listeners follow the stream the way hls.js does
+(reload the playlist, fetch each new segment), then reports latency, origin
+traffic and how many listeners one CPU core can carry
+"""
+
+import argparse
+import http.client
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import (
+    cpu_seconds,
+    free_port,
+    latency_summary,
+    rss_kb,
+    start_gunicorn,
+    stop_gunicorn,
+    wait_for_health,
+    worker_pid,
+)
+
+PLAYLIST_LENGTH = 6
+
+
+class LiveHlsOrigin:
+    """A live HLS origin that adds one segment every segment_seconds"""
+
+    def __init__(self, segment_seconds=1.0, segment_bytes=32 * 1024):
+        self.segment_seconds = segment_seconds
+        self.segment_body = os.urandom(segment_bytes)
+        self.started = time.monotonic()
+        self.requests = {"playlist": 0, "segment": 0}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_port}/hls/live.m3u8"
+
+    def sequence(self):
+        return int((time.monotonic() - self.started) / self.segment_seconds)
+
+    def playlist(self):
+        newest = self.sequence()
+        first = max(0, newest - PLAYLIST_LENGTH + 1)
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{max(1, round(self.segment_seconds))}",
+            f"#EXT-X-MEDIA-SEQUENCE:{first}",
+        ]
+        for number in range(first, newest + 1):
+            lines += [f"#EXTINF:{self.segment_seconds:.3f},", f"segment{number}.aac"]
+        return ("\n".join(lines) + "\n").encode()
+
+    def _handler(self):
+        origin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if self.path.endswith(".m3u8"):
+                    kind, body = "playlist", origin.playlist()
+                else:
+                    kind, body = "segment", origin.segment_body
+                with origin._lock:
+                    origin.requests[kind] += 1
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Listener(threading.Thread):
+    """Follows the live playlist over one keep-alive connection"""
+
+    def __init__(self, port, reload_seconds, deadline):
+        super().__init__(daemon=True)
+        self.port = port
+        self.reload_seconds = reload_seconds
+        self.deadline = deadline
+        self.playlist_latencies = []
+        self.segment_latencies = []
+        self.bytes = 0
+        self.errors = 0
+
+    def get(self, conn, path):
+        started = time.monotonic()
+        conn.request("GET", path)
+        resp = conn.getresponse()
+        body = resp.read()
+        if resp.status != 200:
+            raise RuntimeError(f"{path}: HTTP {resp.status}")
+        return body, time.monotonic() - started
+
+    def run(self):
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=10)
+        seen = set()
+        while time.monotonic() < self.deadline:
+            try:
+                body, latency = self.get(conn, "/hls/live.m3u8")
+                self.playlist_latencies.append(latency)
+                for line in body.decode().splitlines():
+                    if line and not line.startswith("#") and line not in seen:
+                        seen.add(line)
+                        segment, latency = self.get(conn, line)
+                        self.segment_latencies.append(latency)
+                        self.bytes += len(segment)
+            except Exception:
+                self.errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=10)
+            time.sleep(self.reload_seconds)
+        conn.close()
+
+
+def run(listeners=200, duration=10, segment_seconds=1.0, segment_bytes=32 * 1024):
+    """Run the benchmark and return a report dict"""
+    origin = LiveHlsOrigin(segment_seconds, segment_bytes)
+    origin.start()
+    state_dir = tempfile.mkdtemp(prefix="hls-relay-")
+    port = free_port()
+
+    env = dict(
+        DATABASE_PATH=os.path.join(state_dir, "relay.db"),
+        LISTENER_ID_SECRET="load-test",
+        RUNTIME_DIR=state_dir,
+        HLS_RELAY="1",
+        HLS_ORIGIN_URL=origin.url,
+    )
+    server = start_gunicorn("app_optimized:app", port, env, threads=listeners + 16)
+
+    pid = None
+    try:
+        wait_for_health(port)
+        pid = worker_pid(server.pid)
+
+        cpu_before = cpu_seconds(pid)
+        started = time.monotonic()
+        deadline = started + duration
+        clients = [
+            Listener(port, segment_seconds / 2, deadline) for _ in range(listeners)
+        ]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = time.monotonic() - started
+        cpu_used = cpu_seconds(pid) - cpu_before
+        worker_rss_kb = rss_kb(pid)
+    finally:
+        stop_gunicorn(server, [pid] if pid is not None else [])
+        origin.stop()
+
+    playlist_latencies = [l for c in clients for l in c.playlist_latencies]
+    segment_latencies = [l for c in clients for l in c.segment_latencies]
+    cores = cpu_used / elapsed
+    return {
+        "listeners": listeners,
+        "duration_s": round(elapsed, 2),
+        "segment_seconds": segment_seconds,
+        "segment_bytes": segment_bytes,
+        "playlist_requests": len(playlist_latencies),
+        "segment_requests": len(segment_latencies),
+        "errors": sum(c.errors for c in clients),
+        "bytes_served": sum(c.bytes for c in clients),
+        "origin_requests": dict(origin.requests),
+        "playlist_latency_ms": latency_summary(playlist_latencies),
+        "segment_latency_ms": latency_summary(segment_latencies),
+        "worker_rss_kb": worker_rss_kb,
+        "worker_cpu_s": round(cpu_used, 2),
+        "cpu_cores_used": round(cores, 3),
+        # Listeners one fully busy core could keep up with at this load
+        "listeners_per_core": round(listeners / cores) if cores else None,
+    }
+
+
+def main():
+    """Main benchmark function"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--listeners", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--segment-seconds", type=float, default=1.0)
+    parser.add_argument("--segment-bytes", type=int, default=32 * 1024)
+    args = parser.parse_args()
+
+    report = run(
+        args.listeners, args.duration, args.segment_seconds, args.segment_bytes
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,541 @@
+#!/usr/bin/env python3
+"""
+HTTP load test comparing the Radio Calico app variants
+Boots app.py, app_optimized.py and app_prod.py one at a time under the same
+gunicorn configuration (SQLite, plus PostgreSQL when --postgres-url is given),
+drives each through the same request mixes against a local fake CloudFront,
+and reports throughput and p50/p95/p99 latency per endpoint as JSON
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import (
+    ROOT_DIR,
+    cpu_seconds,
+    free_port,
+    latency_summary,
+    start_gunicorn,
+    stop_gunicorn,
+    wait_for_health,
+    worker_pids,
+)
+
+STATIC_ASSETS = (
+    "/static/styles.css",
+    "/static/script.js",
+    "/static/RadioCalicoLogoTM.png",
+)
+BROWSER_HEADERS = {"Accept-Encoding": "gzip, deflate, br"}
+SEED_VOTES = 5  # votes cast on each read song before the timed runs
+
+
+@dataclass(frozen=True)
+class Variant:
+    module: str
+    health_path: str
+    postgres: bool  # whether it can run against DATABASE_URL
+    album_art: bool  # whether it serves /album-art/ itself
+    init_db: bool  # whether init_db() must be run before gunicorn starts
+    own_cwd: bool  # whether it keeps files relative to the working directory
+
+
+VARIANTS = {
+    # app.py hardcodes database.db in the working directory
+    "app": Variant("app", "/", False, False, True, True),
+    "app_optimized": Variant("app_optimized", "/health", True, True, False, False),
+    "app_prod": Variant("app_prod", "/health", True, False, True, False),
+}
+
+
+class FakeCloudFront:
+    """Serves cover art and stream metadata the way the CloudFront origin does"""
+
+    def __init__(self, cover_bytes=48 * 1024):
+        self.files = {
+            "cover.jpg": b"\xff\xd8" + os.urandom(cover_bytes),
+            "metadatav2.json": json.dumps(
+                {"artist": "Load Test", "title": "Track 0", "album": "Benchmarks"}
+            ).encode(),
+        }
+        self.requests = 0  # GETs only; app_optimized's health probe sends HEADs
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def _handler(self):
+        origin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def respond(self, send_body):
+                if send_body:
+                    with origin._lock:
+                        origin.requests += 1
+                body = origin.files.get(self.path.lstrip("/"))
+                if body is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", f'"{len(body)}"')
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                self.respond(True)
+
+            def do_HEAD(self):
+                self.respond(False)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Workload:
+    """Builds the requests a listener sends; shared by all client threads
+
+    Votes go to the current track, which changes every track_seconds, so
+    each change starts a storm of first votes on a new song. Listeners are
+    told apart by User-Agent, which every variant fingerprints.
+    """
+
+    def __init__(self, listeners, songs, track_seconds):
+        self.listeners = listeners
+        self.track_seconds = track_seconds
+        self.run_tag = uuid.uuid4().hex[:8]  # keeps shared databases separate
+        self.read_songs = [f"load-{self.run_tag}-song-{i}" for i in range(songs)]
+        self.started = time.monotonic()
+
+    def listener_headers(self, rng):
+        return {"User-Agent": f"load-test listener {rng.randrange(self.listeners)}"}
+
+    def current_track(self):
+        track = int((time.monotonic() - self.started) / self.track_seconds)
+        return f"load-{self.run_tag}-track-{track}"
+
+    def vote(self, rng):
+        body = json.dumps({"rating": rng.choice((1, -1))})
+        headers = dict(
+            self.listener_headers(rng), **{"Content-Type": "application/json"}
+        )
+        path = f"/api/ratings/{self.current_track()}"
+        return "POST /api/ratings/<song_id>", "POST", path, body, headers
+
+    def read_rating(self, rng):
+        path = f"/api/ratings/{rng.choice(self.read_songs)}"
+        return (
+            "GET /api/ratings/<song_id>",
+            "GET",
+            path,
+            None,
+            self.listener_headers(rng),
+        )
+
+    def page(self, rng):
+        return "GET /", "GET", "/", None, BROWSER_HEADERS
+
+    def static_asset(self, rng):
+        path = rng.choice(STATIC_ASSETS)
+        return "GET /static/<path:filename>", "GET", path, None, BROWSER_HEADERS
+
+    def album_art(self, rng):
+        return "GET /album-art/<filename>", "GET", "/album-art/cover.jpg", None, {}
+
+
+# Scenario name -> [(weight, Workload method name)]
+SCENARIOS = {
+    "vote_storm": [(1, "vote")],
+    "rating_reads": [(1, "read_rating")],
+    "static": [(1, "page"), (4, "static_asset")],
+    "album_art": [(1, "album_art")],
+    "mixed": [
+        (50, "read_rating"),
+        (10, "vote"),
+        (5, "page"),
+        (20, "static_asset"),
+        (15, "album_art"),
+    ],
+}
+
+
+def scenario_requests(scenario, variant):
+    """The scenario's (weights, request builders) this variant can serve"""
+    entries = [
+        (weight, name)
+        for weight, name in SCENARIOS[scenario]
+        if name != "album_art" or variant.album_art
+    ]
+    return [weight for weight, _ in entries], [name for _, name in entries]
+
+
+class Client(threading.Thread):
+    """Sends requests back to back over one keep-alive connection"""
+
+    def __init__(self, port, workload, weights, builders, deadline, seed):
+        super().__init__(daemon=True)
+        self.port = port
+        self.builders = [getattr(workload, name) for name in builders]
+        self.weights = weights
+        self.deadline = deadline
+        self.rng = random.Random(seed)
+        self.latencies = {}  # endpoint -> [seconds]
+        self.statuses = {}  # endpoint -> {status: count}
+
+    def connect(self):
+        return http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+
+    def run(self):
+        conn = self.connect()
+        while time.monotonic() < self.deadline:
+            build = self.rng.choices(self.builders, self.weights)[0]
+            endpoint, method, path, body, headers = build(self.rng)
+            started = time.monotonic()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+                resp.read()
+                status = resp.status
+            except Exception:
+                status = "failed"
+                conn.close()
+                conn = self.connect()
+            self.latencies.setdefault(endpoint, []).append(time.monotonic() - started)
+            counts = self.statuses.setdefault(endpoint, {})
+            counts[status] = counts.get(status, 0) + 1
+        conn.close()
+
+
+def drive(port, workload, weights, builders, clients, duration):
+    """Run clients for duration seconds; returns (elapsed, [Client])"""
+    started = time.monotonic()
+    deadline = started + duration
+    threads = [
+        Client(port, workload, weights, builders, deadline, seed)
+        for seed in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.monotonic() - started, threads
+
+
+def summarize(elapsed, threads):
+    endpoints = {}
+    for endpoint in sorted({e for t in threads for e in t.latencies}):
+        latencies = [l for t in threads for l in t.latencies.get(endpoint, ())]
+        statuses = {}
+        for thread in threads:
+            for status, count in thread.statuses.get(endpoint, {}).items():
+                statuses[str(status)] = statuses.get(str(status), 0) + count
+        endpoints[endpoint] = {
+            "requests": len(latencies),
+            # Connection failures and 4xx/5xx responses
+            "errors": sum(
+                count
+                for status, count in statuses.items()
+                if not status.isdigit() or int(status) >= 400
+            ),
+            "rps": round(len(latencies) / elapsed, 1),
+            "latency_ms": latency_summary(latencies),
+            "status_codes": statuses,
+        }
+    latencies = [l for t in threads for values in t.latencies.values() for l in values]
+    return {
+        "duration_s": round(elapsed, 2),
+        "requests": len(latencies),
+        "errors": sum(e["errors"] for e in endpoints.values()),
+        "rps": round(len(latencies) / elapsed, 1),
+        "latency_ms": latency_summary(latencies),
+        "endpoints": endpoints,
+    }
+
+
+def variant_env(variant, state_dir, database_url, origin):
+    env = dict(
+        LISTENER_ID_SECRET="load-test",
+        LISTENER_SECRET_FILE=os.path.join(state_dir, "listener_secret"),
+        RUNTIME_DIR=os.path.join(state_dir, "runtime"),
+        ALBUM_ART_CACHE_DIR=os.path.join(state_dir, "album-art"),
+        ALBUM_ART_ORIGIN=origin.url,
+        METADATA_URL=f"{origin.url}/metadatav2.json",
+        PYTHONPATH=ROOT_DIR,
+    )
+    if database_url:
+        env["DATABASE_URL"] = database_url
+    else:
+        env["DATABASE_PATH"] = os.path.join(state_dir, "load.db")
+    return env
+
+
+def seed(port, workload):
+    """Give every read song a few votes so reads return real tallies"""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    for song in workload.read_songs:
+        for listener in range(SEED_VOTES):
+            conn.request(
+                "POST",
+                f"/api/ratings/{song}",
+                body=json.dumps({"rating": 1 if listener % 3 else -1}),
+                headers={
+                    "Content-Type": "application/json",
+                    "User-Agent": f"load-test seed {listener}",
+                },
+            )
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status != 200:
+                raise RuntimeError(f"seeding {song}: HTTP {resp.status}")
+    conn.close()
+
+
+def start_variant(name, state_dir, env, workers, threads):
+    """Initialise a variant's database and start it; returns (server, port)"""
+    variant = VARIANTS[name]
+    cwd = state_dir if variant.own_cwd else ROOT_DIR
+    if variant.init_db:
+        subprocess.run(
+            [sys.executable, "-c", f"import {name}; {name}.init_db()"],
+            cwd=cwd,
+            env=dict(os.environ, **env),
+            stdout=subprocess.DEVNULL,
+            check=True,
+        )
+
+    port = free_port()
+    extra_args = ("--chdir", cwd, "--pythonpath", ROOT_DIR)
+    server = start_gunicorn(f"{name}:app", port, env, workers, threads, extra_args)
+    return server, port
+
+
+def run_variant(
+    name,
+    database_url,
+    origin,
+    scenarios,
+    clients,
+    duration,
+    warmup,
+    workers,
+    threads,
+    listeners,
+    songs,
+    track_seconds,
+):
+    """Boot one variant, run every scenario against it; returns report entries"""
+    variant = VARIANTS[name]
+    state_dir = tempfile.mkdtemp(prefix=f"load-{name}-")
+    env = variant_env(variant, state_dir, database_url, origin)
+    server, port = start_variant(name, state_dir, env, workers, threads)
+    pids = []
+    results = []
+    try:
+        wait_for_health(port, timeout=30, path=variant.health_path)
+        pids = worker_pids(server.pid, workers)
+        workload = Workload(listeners, songs, track_seconds)
+        seed(port, workload)
+
+        for scenario in scenarios:
+            weights, builders = scenario_requests(scenario, variant)
+            entry = {
+                "variant": name,
+                "database": "postgresql" if database_url else "sqlite",
+                "scenario": scenario,
+            }
+            if not builders:
+                entry["skipped"] = f"{name} does not serve these endpoints"
+                results.append(entry)
+                continue
+            if warmup:
+                drive(port, workload, weights, builders, clients, warmup)
+
+            cpu_before = sum(cpu_seconds(pid) for pid in pids)
+            client_before = resource.getrusage(resource.RUSAGE_SELF)
+            origin_before = origin.requests
+            elapsed, done = drive(port, workload, weights, builders, clients, duration)
+            client_after = resource.getrusage(resource.RUSAGE_SELF)
+
+            entry.update(summarize(elapsed, done))
+            entry["server_cpu_s"] = round(
+                sum(cpu_seconds(pid) for pid in pids) - cpu_before, 2
+            )
+            # Near 1.0 means the Python client, not the server, was the limit
+            entry["client_cpu_cores"] = round(
+                (
+                    client_after.ru_utime
+                    + client_after.ru_stime
+                    - client_before.ru_utime
+                    - client_before.ru_stime
+                )
+                / elapsed,
+                2,
+            )
+            entry["origin_requests"] = origin.requests - origin_before
+            results.append(entry)
+    finally:
+        stop_gunicorn(server, pids)
+    return results
+
+
+def compare(runs, baseline):
+    """Each variant's throughput and p95 relative to baseline, per scenario"""
+    by_key = {
+        (r["database"], r["scenario"], r["variant"]): r
+        for r in runs
+        if "skipped" not in r
+    }
+    comparison = {}
+    for (database, scenario, variant), run in by_key.items():
+        base = by_key.get((database, scenario, baseline))
+        if base is None or variant == baseline:
+            continue
+        entry = {
+            "rps_ratio": round(run["rps"] / base["rps"], 2) if base["rps"] else None
+        }
+        base_p95 = base["latency_ms"]["p95"]
+        if base_p95 and run["latency_ms"]["p95"] is not None:
+            entry["p95_ratio"] = round(run["latency_ms"]["p95"] / base_p95, 2)
+        comparison.setdefault(database, {}).setdefault(scenario, {})[variant] = entry
+    return comparison
+
+
+def run(
+    variants=tuple(VARIANTS),
+    scenarios=tuple(SCENARIOS),
+    clients=32,
+    duration=10,
+    warmup=1,
+    workers=2,
+    threads=16,
+    listeners=1000,
+    songs=50,
+    track_seconds=5,
+    postgres_url=None,
+):
+    """Run the load test and return a report dict"""
+    origin = FakeCloudFront()
+    origin.start()
+    databases = [None] + ([postgres_url] if postgres_url else [])
+    runs = []
+    try:
+        for database_url in databases:
+            for name in variants:
+                if database_url and not VARIANTS[name].postgres:
+                    continue
+                runs += run_variant(
+                    name,
+                    database_url,
+                    origin,
+                    scenarios,
+                    clients,
+                    duration,
+                    warmup,
+                    workers,
+                    threads,
+                    listeners,
+                    songs,
+                    track_seconds,
+                )
+    finally:
+        origin.stop()
+
+    return {
+        "config": {
+            "variants": list(variants),
+            "scenarios": {name: dict(SCENARIOS[name]) for name in scenarios},
+            "clients": clients,
+            "duration_s": duration,
+            "warmup_s": warmup,
+            "gunicorn_workers": workers,
+            "gunicorn_threads": threads,
+            "listeners": listeners,
+            "read_songs": songs,
+            "track_seconds": track_seconds,
+            "postgresql": bool(postgres_url),
+        },
+        "runs": runs,
+        "comparison": compare(runs, variants[0]),
+    }
+
+
+def main():
+    """Main benchmark function"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--variants", default=",".join(VARIANTS), help="first one is the baseline"
+    )
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--warmup", type=float, default=1)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--listeners", type=int, default=1000)
+    parser.add_argument("--songs", type=int, default=50)
+    parser.add_argument("--track-seconds", type=float, default=5)
+    parser.add_argument(
+        "--postgres-url",
+        default=os.getenv("LOAD_TEST_POSTGRES_URL"),
+        help="also run the PostgreSQL-capable variants against this database",
+    )
+    parser.add_argument("--output", help="write the report here instead of stdout")
+    args = parser.parse_args()
+
+    variants = tuple(v for v in args.variants.split(",") if v)
+    scenarios = tuple(s for s in args.scenarios.split(",") if s)
+    unknown = (set(variants) - set(VARIANTS)) | (set(scenarios) - set(SCENARIOS))
+    if unknown:
+        parser.error(f"unknown variant or scenario: {', '.join(sorted(unknown))}")
+
+    report = run(
+        variants,
+        scenarios,
+        args.clients,
+        args.duration,
+        args.warmup,
+        args.workers,
+        args.threads,
+        args.listeners,
+        args.songs,
+        args.track_seconds,
+        args.postgres_url,
+    )
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for Radio Calico's per-request hot paths
+Times the helpers app_optimized runs on every API call (cache keys, the
+response cache, listener fingerprints, cache headers, JSON bodies) and whole
+requests dispatched through Flask's test client, then compares each against
+the baselines committed in benchmarks/baselines/micro.json
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import timeit
+from contextlib import contextmanager
+
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import ROOT_DIR
+
+BASELINE_PATH = os.path.join(ROOT_DIR, "benchmarks", "baselines", "micro.json")
+TOLERANCE = 0.5  # allowed slowdown against the baseline, as a fraction
+REPEAT = 7
+
+RATINGS_RESULT = {
+    "song_id": "U3ludGhldGljIEFydGlzdCAwLVRyYWNrIDA",
+    "thumbs_up": 1234,
+    "thumbs_down": 56,
+    "user_rating": 1,
+}
+LISTENER_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 "
+        "(KHTML, like Gecko) Version/17.4 Safari/605.1.15"
+    ),
+    "X-Forwarded-For": "203.0.113.7, 10.0.0.2",
+}
+
+
+def reference_work():
+    """Fixed pure-Python workload; timings are stored relative to it so
+    baselines recorded on one machine still apply on a faster or slower one"""
+    body = json.dumps(RATINGS_RESULT, sort_keys=True)
+    return hashlib.md5(body.encode()).hexdigest()
+
+
+def measure(func, repeat=REPEAT):
+    """Best per-call time of func in nanoseconds over repeat timed runs"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number * 1e9
+
+
+def load_app(state_dir):
+    """Import app_optimized against a scratch database in state_dir"""
+    database = os.path.join(state_dir, "micro.db")
+    # Read at import time, so they must be set before app_optimized loads
+    os.environ.update(
+        DATABASE_PATH=database,
+        RUNTIME_DIR=os.path.join(state_dir, "runtime"),
+        ALBUM_ART_CACHE_DIR=os.path.join(state_dir, "album-art"),
+        LISTENER_ID_SECRET="micro-benchmark",
+        LOG_LEVEL="WARNING",
+    )
+    import app_optimized
+
+    app_optimized.DATABASE = database
+    app_optimized.app.config["TESTING"] = True
+    with app_optimized.app.app_context():
+        app_optimized.init_db()
+    return app_optimized
+
+
+@contextmanager
+def get_cache_key(app):
+    yield lambda: app.get_cache_key("ratings", RATINGS_RESULT["song_id"])
+
+
+@contextmanager
+def set_cache(app):
+    key = app.get_cache_key("ratings", "set-cache")
+    app.cache.clear()
+    yield lambda: app.set_cache(key, RATINGS_RESULT)
+    app.cache.clear()
+
+
+@contextmanager
+def set_cache_full(app):
+    """Every insert into a full cache evicts the oldest entry"""
+    app.cache.clear()
+    for i in range(app.RESPONSE_CACHE_MAX_ENTRIES):
+        app.set_cache(app.get_cache_key("ratings", i), RATINGS_RESULT)
+    keys = (f"set-cache-full-{i}" for i in itertools.count())
+    yield lambda: app.set_cache(next(keys), RATINGS_RESULT)
+    app.cache.clear()
+
+
+@contextmanager
+def get_cached_response(app):
+    key = app.get_cache_key("ratings", "cached")
+    app.cache.clear()
+    app.set_cache(key, RATINGS_RESULT)
+    yield lambda: app.get_cached_response(key)
+    app.cache.clear()
+
+
+@contextmanager
+def generate_user_fingerprint(app):
+    from flask import request
+
+    with app.app.test_request_context("/api/ratings/x", headers=LISTENER_HEADERS):
+        yield lambda: app.generate_user_fingerprint(request)
+
+
+@contextmanager
+def add_cache_headers(app):
+    with app.app.test_request_context("/api/ratings/x"):
+        response = app.make_response(app.jsonify(RATINGS_RESULT))
+
+        def add_headers():
+            # The ETag is only computed for responses that have none yet
+            response.headers.pop("ETag", None)
+            app.add_cache_headers(response, max_age=30)
+
+        yield add_headers
+
+
+@contextmanager
+def ratings_json(app):
+    """The body and response object every ratings call builds"""
+    with app.app.test_request_context("/api/ratings/x"):
+        yield lambda: app.make_response(app.jsonify(RATINGS_RESULT))
+
+
+@contextmanager
+def dispatch_get_ratings(app):
+    client = app.app.test_client()
+    client.post("/api/ratings/micro-song", json={"rating": 1})
+    yield lambda: client.get("/api/ratings/micro-song", headers=LISTENER_HEADERS)
+
+
+@contextmanager
+def dispatch_post_rating(app):
+    client = app.app.test_client()
+    # Alternate so every vote rewrites the listener's row
+    ratings = itertools.cycle(({"rating": 1}, {"rating": -1}))
+    yield lambda: client.post(
+        "/api/ratings/micro-vote", json=next(ratings), headers=LISTENER_HEADERS
+    )
+
+
+@contextmanager
+def dispatch_static(app):
+    client = app.app.test_client()
+    headers = {"Accept-Encoding": "gzip, br"}
+    yield lambda: client.get("/static/styles.css", headers=headers).close()
+
+
+# Case name -> context manager yielding the zero-argument callable to time
+CASES = {
+    case.__name__: case
+    for case in (
+        get_cache_key,
+        set_cache,
+        set_cache_full,
+        get_cached_response,
+        generate_user_fingerprint,
+        add_cache_headers,
+        ratings_json,
+        dispatch_get_ratings,
+        dispatch_post_rating,
+        dispatch_static,
+    )
+}
+
+
+def run_case(app, name, repeat=REPEAT):
+    """(ns per call, calibration ns measured alongside it)
+
+    Timed runs of the case alternate with runs of reference_work, so the
+    machine speeding up or slowing down part way through affects both.
+    """
+    with CASES[name](app) as func:
+        case, reference = timeit.Timer(func), timeit.Timer(reference_work)
+        case_number, _ = case.autorange()
+        reference_number, _ = reference.autorange()
+        case_best = reference_best = float("inf")
+        for _ in range(repeat):
+            case_best = min(case_best, case.timeit(case_number) / case_number)
+            reference_best = min(
+                reference_best, reference.timeit(reference_number) / reference_number
+            )
+    return case_best * 1e9, reference_best * 1e9
+
+
+def results_document(timings):
+    """{name: (ns, calibration ns)} in the form stored as a baseline"""
+    return {
+        "python": platform.python_version(),
+        "calibration_ns": round(min(cal for _, cal in timings.values()), 1),
+        "cases": {
+            name: {"ns": round(ns, 1), "relative": round(ns / cal, 4)}
+            for name, (ns, cal) in timings.items()
+        },
+    }
+
+
+def load_baselines(path=BASELINE_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"cases": {}}
+
+
+def save_baselines(document, path=BASELINE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def update_baselines(current, path=BASELINE_PATH):
+    """Store current's cases as baselines, keeping those it did not run"""
+    baseline = load_baselines(path)
+    baseline.update(current, cases={**baseline["cases"], **current["cases"]})
+    save_baselines(baseline, path)
+
+
+def compare(current, baseline, tolerance=TOLERANCE):
+    """Per case: how current relates to baseline, relative to calibration
+
+    ratio is current / baseline; above 1 + tolerance is a regression.
+    """
+    report = {}
+    for name, timing in current["cases"].items():
+        base = baseline["cases"].get(name)
+        if base is None:
+            report[name] = {"ns": timing["ns"], "status": "new"}
+            continue
+        ratio = timing["relative"] / base["relative"]
+        if ratio > 1 + tolerance:
+            status = "regressed"
+        elif ratio < 1 - tolerance:
+            status = "improved"
+        else:
+            status = "ok"
+        report[name] = {
+            "ns": timing["ns"],
+            # What the baseline would take on this machine right now
+            "baseline_ns": round(timing["ns"] / ratio, 1),
+            "ratio": round(ratio, 2),
+            "status": status,
+        }
+    return report
+
+
+def main():
+    """Main benchmark function"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("cases", nargs="*", help="case names; default all")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument(
+        "--update", action="store_true", help="store the results as the baselines"
+    )
+    args = parser.parse_args()
+
+    unknown = set(args.cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown case: {', '.join(sorted(unknown))}")
+
+    app = load_app(tempfile.mkdtemp(prefix="micro-"))
+    timings = {name: run_case(app, name, args.repeat) for name in args.cases or CASES}
+    current = results_document(timings)
+
+    if args.update:
+        update_baselines(current)
+        print(json.dumps(current, indent=2))
+        return
+
+    report = compare(current, load_baselines(), args.tolerance)
+    print(json.dumps(report, indent=2))
+    if any(entry["status"] == "regressed" for entry in report.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Idle SSE subscriber load test for Radio Calico
+Runs app_optimized in one gunicorn gthread worker against a local metadata
+origin, opens N idle /api/now-playing/stream connections, then reports the
+worker's memory per subscriber and how long one track change takes to reach
+every subscriber
+"""
+
+import argparse
+import json
+import os
+import selectors
+import socket
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import (
+    free_port,
+    percentile,
+    rss_kb,
+    start_gunicorn,
+    stop_gunicorn,
+    wait_for_health,
+    worker_pid,
+)
+
+
+class MetadataOrigin:
+    """Serves a mutable metadatav2.json the way CloudFront does"""
+
+    def __init__(self):
+        self.metadata = {"artist": "Load Test", "title": "Track 0"}
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_port}/metadatav2.json"
+
+    def _handler(self):
+        origin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(origin.metadata).encode()
+                etag = f'"{hash(body)}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def open_subscribers(port, count):
+    request = b"GET /api/now-playing/stream HTTP/1.1\r\nHost: localhost\r\n\r\n"
+    sockets = []
+    for _ in range(count):
+        sock = socket.create_connection(("127.0.0.1", port))
+        sock.sendall(request)
+        sockets.append(sock)
+    return sockets
+
+
+def read_until(sockets, marker, timeout):
+    """Read every socket until it has received marker; return per-socket latency"""
+    selector = selectors.DefaultSelector()
+    buffers = {}
+    for sock in sockets:
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ)
+        buffers[sock] = b""
+
+    started = time.monotonic()
+    latencies = {}
+    while len(latencies) < len(sockets) and time.monotonic() - started < timeout:
+        for key, _ in selector.select(timeout=0.5):
+            sock = key.fileobj
+            try:
+                chunk = sock.recv(65536)
+            except BlockingIOError:
+                continue
+            buffers[sock] += chunk
+            if marker in buffers[sock] and sock not in latencies:
+                latencies[sock] = time.monotonic() - started
+                buffers[sock] = b""
+                selector.unregister(sock)
+            elif not chunk:
+                selector.unregister(sock)
+    selector.close()
+    return list(latencies.values())
+
+
+def run(subscribers=500, threads=None, timeout=30):
+    """Run the load test and return a report dict"""
+    threads = threads or subscribers + 16
+    origin = MetadataOrigin()
+    origin.start()
+    state_dir = tempfile.mkdtemp(prefix="sse-load-")
+    port = free_port()
+
+    env = dict(
+        DATABASE_PATH=os.path.join(state_dir, "load.db"),
+        LISTENER_ID_SECRET="load-test",
+        METADATA_URL=origin.url,
+        RUNTIME_DIR=state_dir,
+        SSE_MAX_SUBSCRIBERS=str(subscribers),
+    )
+    server = start_gunicorn("app_optimized:app", port, env, threads=threads)
+
+    sockets = []
+    pid = None
+    try:
+        wait_for_health(port)
+        pid = worker_pid(server.pid)
+        baseline_kb = rss_kb(pid)
+
+        sockets = open_subscribers(port, subscribers)
+        connected = read_until(sockets, b"Track 0", timeout)
+        loaded_kb = rss_kb(pid)
+
+        origin.metadata = {"artist": "Load Test", "title": "Track 1"}
+        changed = read_until(sockets, b"Track 1", timeout)
+    finally:
+        for sock in sockets:
+            sock.close()
+        stop_gunicorn(server, [pid] if pid is not None else [])
+        origin.stop()
+
+    # The first delivery includes the poll interval; the spread after it is
+    # the cost of fanning one change out to every subscriber
+    first = min(changed) if changed else 0
+    fanout = [latency - first for latency in changed]
+    return {
+        "subscribers": subscribers,
+        "threads": threads,
+        "connected": len(connected),
+        "received_change": len(changed),
+        "worker_rss_baseline_kb": baseline_kb,
+        "worker_rss_loaded_kb": loaded_kb,
+        "kb_per_subscriber": round(
+            (loaded_kb - baseline_kb) / max(1, len(connected)), 1
+        ),
+        "change_detected_ms": round(first * 1000, 1),
+        "fanout_ms": {
+            f"p{pct}": round(percentile(fanout, pct) * 1000, 1) if fanout else None
+            for pct in (50, 95, 99, 100)
+        },
+    }
+
+
+def main():
+    """Main load test function"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--subscribers", type=int, default=500)
+    parser.add_argument("--threads", type=int, help="gthread threads (default N+16)")
+    parser.add_argument("--timeout", type=float, default=30)
+    args = parser.parse_args()
+
+    report = run(args.subscribers, args.threads, args.timeout)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
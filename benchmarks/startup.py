@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Worker startup benchmark for Radio Calico
+Measures how long app_optimized takes to import in a fresh interpreter and
+which of its imports dominate (from python -X importtime), what the schema
+check costs on a new and on an up-to-date database, and how long gunicorn
+workers take from fork to ready, both at boot and when one is replaced,
+and reports it all as JSON
+"""
+
+import argparse
+import json
+import os
+import re
+import signal
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import (
+    ROOT_DIR,
+    free_port,
+    start_gunicorn,
+    stop_gunicorn,
+    wait_for_health,
+    worker_pids,
+)
+from schema import create_schema, ensure_schema
+
+# Left to first use, so a worker that never needs them never loads them
+DEFERRED_MODULES = ("psycopg2", "PIL", "requests")
+TOP_IMPORTS = 10
+BOOT_TIMEOUT = 30
+
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app_optimized
+print(json.dumps({
+    "ms": (time.perf_counter() - started) * 1000,
+    "loaded": [name for name in sys.argv[1:] if name in sys.modules],
+}))
+"""
+BOOTED_LINE = re.compile(r"Worker (\d+) booted in ([\d.]+) ms")
+SCHEMA_LINE = re.compile(r"Database schema version \d+ (\w+) in ([\d.]+) ms")
+
+
+def app_env(state_dir):
+    # Nothing listens on the origin port, so probes and polls fail fast
+    origin = f"http://127.0.0.1:{free_port()}"
+    return dict(
+        DATABASE_PATH=os.path.join(state_dir, "startup.db"),
+        RUNTIME_DIR=os.path.join(state_dir, "runtime"),
+        ALBUM_ART_CACHE_DIR=os.path.join(state_dir, "album-art"),
+        ALBUM_ART_ORIGIN=origin,
+        METADATA_URL=f"{origin}/metadatav2.json",
+        LISTENER_ID_SECRET="startup-benchmark",
+        LOG_LEVEL="WARNING",
+        PYTHONPATH=ROOT_DIR,
+    )
+
+
+def summary(values):
+    return {
+        "median": round(statistics.median(values), 2),
+        "min": round(min(values), 2),
+    }
+
+
+def import_children(importtime_output, module):
+    """[(name, cumulative ms)] for the modules module imported directly"""
+    children = []
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            if name.strip() == module:
+                return children
+            children = []  # belonged to an earlier top-level import
+        elif depth == 1:
+            children.append((name.strip(), int(cumulative) / 1000))
+    return []
+
+
+def measure_import(state_dir, repeat):
+    """Fresh-interpreter import times of app_optimized and its heaviest imports"""
+    env = dict(os.environ, **app_env(state_dir))
+    command = [sys.executable, "-c", IMPORT_PROBE, *DEFERRED_MODULES]
+    # The first import also creates the schema and writes bytecode caches
+    subprocess.run(command, cwd=state_dir, env=env, capture_output=True, check=True)
+
+    runs = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            command, cwd=state_dir, env=env, capture_output=True, check=True
+        )
+        runs.append(json.loads(result.stdout.decode().splitlines()[-1]))
+
+    traced = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app_optimized"],
+        cwd=state_dir,
+        env=env,
+        capture_output=True,
+        check=True,
+    )
+    children = import_children(traced.stderr.decode(), "app_optimized")
+    heaviest = sorted(children, key=lambda child: child[1], reverse=True)
+    return {
+        "ms": summary([run["ms"] for run in runs]),
+        "deferred_loaded": sorted({name for run in runs for name in run["loaded"]}),
+        "top_imports_ms": {name: round(ms, 2) for name, ms in heaviest[:TOP_IMPORTS]},
+    }
+
+
+def timed_ms(func):
+    started = time.perf_counter()
+    func()
+    return (time.perf_counter() - started) * 1000
+
+
+def rerun_schema(database):
+    """What every worker used to do on boot: the full schema pass"""
+    conn = sqlite3.connect(database)
+    try:
+        create_schema(conn)
+    finally:
+        conn.close()
+
+
+def measure_schema(state_dir, repeat):
+    """ensure_schema on new databases, and on an up-to-date one"""
+    fresh = [
+        timed_ms(lambda: ensure_schema(os.path.join(state_dir, f"fresh-{i}.db")))
+        for i in range(repeat)
+    ]
+    current = os.path.join(state_dir, "fresh-0.db")
+    return {
+        "fresh_ms": summary(fresh),
+        "check_ms": summary(
+            [timed_ms(lambda: ensure_schema(current)) for _ in range(repeat)]
+        ),
+        "full_pass_ms": summary(
+            [timed_ms(lambda: rerun_schema(current)) for _ in range(repeat)]
+        ),
+    }
+
+
+def read_log(path):
+    with open(path) as f:
+        return f.read()
+
+
+def booted(log):
+    """{pid: boot ms} from the post_worker_init lines in gunicorn.conf.py"""
+    return {int(pid): float(ms) for pid, ms in BOOTED_LINE.findall(log)}
+
+
+def wait_for_boots(log_path, count):
+    deadline = time.monotonic() + BOOT_TIMEOUT
+    while time.monotonic() < deadline:
+        boots = booted(read_log(log_path))
+        if len(boots) >= count:
+            return boots
+        time.sleep(0.01)
+    raise RuntimeError("gunicorn workers did not log their boot")
+
+
+def measure_boot(state_dir, workers):
+    """Time to a first healthy response, then to replacing a killed worker"""
+    boot_dir = os.path.join(state_dir, "boot")
+    os.makedirs(boot_dir)
+    log_path = os.path.join(boot_dir, "gunicorn.log")
+    port = free_port()
+    extra_args = ("--log-level", "info", "--error-logfile", log_path)
+    started = time.monotonic()
+    server = start_gunicorn(
+        "app_optimized:app", port, app_env(boot_dir), workers, extra_args=extra_args
+    )
+    pids = []
+    try:
+        wait_for_health(port, timeout=BOOT_TIMEOUT, path="/health/live")
+        ready_s = time.monotonic() - started
+        pids = worker_pids(server.pid, workers)
+        initial = wait_for_boots(log_path, workers)
+
+        killed = pids[0]
+        os.kill(killed, signal.SIGKILL)
+        killed_at = time.monotonic()
+        respawn_ms = respawn_boot_ms = None
+        while time.monotonic() - killed_at < BOOT_TIMEOUT:
+            replacements = {
+                pid: ms
+                for pid, ms in booted(read_log(log_path)).items()
+                if pid not in initial
+            }
+            if replacements:
+                respawn_ms = (time.monotonic() - killed_at) * 1000
+                respawn_boot_ms = next(iter(replacements.values()))
+                break
+            time.sleep(0.01)
+        pids = worker_pids(server.pid, workers)
+    finally:
+        stop_gunicorn(server, pids)
+
+    schema = SCHEMA_LINE.search(read_log(log_path))
+    return {
+        "workers": workers,
+        "ready_s": round(ready_s, 3),
+        "master_schema": (
+            {"action": schema.group(1), "ms": float(schema.group(2))}
+            if schema
+            else None
+        ),
+        "worker_boot_ms": sorted(initial.values()),
+        # Until the replacement logged itself booted, polled every 10 ms
+        "respawn_ms": round(respawn_ms, 1) if respawn_ms is not None else None,
+        "respawn_boot_ms": respawn_boot_ms,
+    }
+
+
+def run(workers=2, repeat=5):
+    """Measure imports, schema checks and gunicorn boots; returns a report"""
+    state_dir = tempfile.mkdtemp(prefix="startup-")
+    return {
+        "config": {"workers": workers, "repeat": repeat},
+        "import": measure_import(state_dir, repeat),
+        "schema": measure_schema(state_dir, repeat),
+        "boot": measure_boot(state_dir, workers),
+    }
+
+
+def main():
+    """Main benchmark function"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    report = run(args.workers, args.repeat)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+"""
+Concurrent vote storm against the Radio Calico rating endpoint
+Boots app_optimized.py and app_prod.py one at a time under gunicorn (SQLite,
+plus PostgreSQL when --postgres-url is given) and has many client processes
+vote at once: every listener votes on every storm song, some change their
+vote and some send it twice at once the way a double click or a client
+retry does. Afterwards the tallies in the database must match the votes the
+clients saw acknowledged exactly. Reports votes/s, retries, errors and the
+time votes spent waiting on database locks as JSON
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import (
+    latency_summary,
+    stop_gunicorn,
+    wait_for_health,
+    worker_pids,
+)
+from benchmarks.load_test import VARIANTS, FakeCloudFront, start_variant, variant_env
+
+STORM_VARIANTS = ("app_optimized", "app_prod")
+MAX_RETRIES = 5
+RETRY_BACKOFF = 0.05  # seconds before the first retry, doubling after that
+REQUEST_TIMEOUT = 30
+CALIBRATION_VOTES = 50  # sequential votes that set the uncontended db time
+LOCK_WAIT_MIN_MS = 1.0  # db time over uncontended below this is noise
+MAX_REPORTED_MISMATCHES = 10
+
+TALLY_SQL = (
+    "SELECT s.song_key, "
+    "SUM(CASE WHEN r.rating = 1 THEN 1 ELSE 0 END), "
+    "SUM(CASE WHEN r.rating = -1 THEN 1 ELSE 0 END) "
+    "FROM song_ratings r JOIN songs s ON s.id = r.song_id "
+    "WHERE s.song_key LIKE '{prefix}%' GROUP BY s.song_key"
+)
+
+
+@dataclass(frozen=True)
+class Vote:
+    song: str
+    listener: str
+    rating: int
+    duplicate: bool  # sent on two connections at once
+
+
+@dataclass(frozen=True)
+class Storm:
+    """What every client votes on; slot k of slots owns listeners k, k + slots..."""
+
+    tag: str
+    songs: int
+    listeners: int
+    slots: int
+    revote_rate: float
+    duplicate_rate: float
+    seed: int
+
+    @property
+    def prefix(self):
+        return f"vote-storm-{self.tag}-"
+
+    def song_keys(self):
+        return [f"{self.prefix}song-{i}" for i in range(self.songs)]
+
+    def votes(self, slot):
+        """One slot's votes, song by song so all clients pile onto each in turn"""
+        rng = random.Random(f"{self.seed}-{slot}")
+        own = range(slot, self.listeners, self.slots)
+        for song in self.song_keys():
+            for listener in own:
+                name = f"{self.prefix}listener-{listener}"
+                rating = rng.choice((1, -1))
+                yield Vote(song, name, rating, rng.random() < self.duplicate_rate)
+                if rng.random() < self.revote_rate:
+                    yield Vote(song, name, -rating, False)
+
+
+class Voter(threading.Thread):
+    """Casts votes, one connection per request, retrying failed ones
+
+    outcomes maps (song, listener) to the ratings the database may hold for
+    it: just the last acknowledged one, or, when a vote was never
+    acknowledged, that vote's rating as well as whatever was there before.
+    """
+
+    def __init__(self, port, votes=(), go=None):
+        super().__init__(daemon=True)
+        self.port = port
+        self.pending = votes
+        self.go = go
+        self.outcomes = {}
+        self.status_codes = Counter()
+        self.latencies = []  # seconds per response
+        self.db_ms = []  # Server-Timing db time per response
+        self.votes = self.acknowledged = self.failed = 0
+        self.retries = self.errors = 0
+        self.finished = None
+
+    def run(self):
+        if self.go is not None:
+            self.go.wait()
+        for vote in self.pending:
+            self.cast(vote)
+        self.finished = time.monotonic()
+
+    def send(self, vote):
+        conn = http.client.HTTPConnection(
+            "127.0.0.1", self.port, timeout=REQUEST_TIMEOUT
+        )
+        conn.request(
+            "POST",
+            f"/api/ratings/{vote.song}",
+            body=json.dumps({"rating": vote.rating}),
+            headers={
+                "Content-Type": "application/json",
+                "User-Agent": vote.listener,
+                # Idle keep-alive connections would hold gunicorn's
+                # connection slots and stall other clients for seconds
+                "Connection": "close",
+            },
+        )
+        return conn
+
+    def receive(self, conn, started):
+        try:
+            resp = conn.getresponse()
+            resp.read()
+        finally:
+            conn.close()
+        self.latencies.append(time.perf_counter() - started)
+        self.status_codes[str(resp.status)] += 1
+        if resp.status >= 500:
+            self.errors += 1
+        db_ms = server_timing_db_ms(resp.getheader("Server-Timing"))
+        if db_ms is not None:
+            self.db_ms.append(db_ms)
+        return resp.status
+
+    def attempt(self, vote, copies):
+        """Statuses of one try; empty when the connection failed"""
+        started = time.perf_counter()
+        conns = []
+        try:
+            for _ in range(copies):
+                conns.append(self.send(vote))
+            return [self.receive(conn, started) for conn in conns]
+        except (OSError, http.client.HTTPException):
+            self.errors += 1
+            for conn in conns:
+                conn.close()
+            return []
+
+    def cast(self, vote):
+        key = (vote.song, vote.listener)
+        self.votes += 1
+        for attempt in range(MAX_RETRIES + 1):
+            if attempt:
+                self.retries += 1
+                time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+            statuses = self.attempt(vote, 2 if vote.duplicate and not attempt else 1)
+            if 200 in statuses:
+                self.acknowledged += 1
+                self.outcomes[key] = {vote.rating}
+                return
+            if statuses and all(400 <= status < 500 for status in statuses):
+                break  # the request itself is wrong; retrying cannot help
+        self.failed += 1
+        self.outcomes[key] = self.outcomes.get(key, {None}) | {vote.rating}
+
+
+def server_timing_db_ms(header):
+    """The db duration from a Server-Timing header, or None"""
+    for metric in (header or "").split(","):
+        name, *params = metric.strip().split(";")
+        if name == "db":
+            for param in params:
+                if param.startswith("dur="):
+                    return float(param[4:])
+    return None
+
+
+def client_process(port, storm, first_slot, threads, barrier, results):
+    """Run threads voters; reports back once they all finish"""
+    go = threading.Event()
+    voters = [Voter(port, storm.votes(first_slot + i), go) for i in range(threads)]
+    for voter in voters:
+        voter.start()
+    barrier.wait()
+    go.set()
+    for voter in voters:
+        voter.join()
+
+    result = {
+        "outcomes": {},
+        "status_codes": Counter(),
+        "latencies": [],
+        "db_ms": [],
+        "finished": max(voter.finished for voter in voters),
+    }
+    for voter in voters:
+        result["outcomes"].update(voter.outcomes)
+        result["status_codes"].update(voter.status_codes)
+        result["latencies"] += voter.latencies
+        result["db_ms"] += voter.db_ms
+        for field in ("votes", "acknowledged", "failed", "retries", "errors"):
+            result[field] = result.get(field, 0) + getattr(voter, field)
+    results.put(result)
+
+
+def storm_votes(port, storm, processes, threads):
+    """Fire the storm from processes x threads clients; returns merged results"""
+    context = multiprocessing.get_context("fork")
+    barrier = context.Barrier(processes + 1)
+    results = context.Queue()
+    clients = [
+        context.Process(
+            target=client_process,
+            args=(port, storm, p * threads, threads, barrier, results),
+            daemon=True,
+        )
+        for p in range(processes)
+    ]
+    for client in clients:
+        client.start()
+    barrier.wait()
+    started = time.monotonic()
+
+    # Drain the queue before joining, or large results block the clients
+    parts = [results.get() for _ in clients]
+    for client in clients:
+        client.join()
+
+    merged = {
+        "outcomes": {},
+        "status_codes": Counter(),
+        "latencies": [],
+        "db_ms": [],
+        # CLOCK_MONOTONIC is system-wide, so the clients' readings compare
+        "elapsed": max(part["finished"] for part in parts) - started,
+    }
+    for part in parts:
+        merged["outcomes"].update(part["outcomes"])
+        merged["status_codes"].update(part["status_codes"])
+        merged["latencies"] += part["latencies"]
+        merged["db_ms"] += part["db_ms"]
+        for field in ("votes", "acknowledged", "failed", "retries", "errors"):
+            merged[field] = merged.get(field, 0) + part[field]
+    return merged
+
+
+def calibrate(port, storm):
+    """Median db ms of a vote with nothing else running"""
+    song = f"{storm.prefix}calibration"
+    voter = Voter(port)
+    for i in range(CALIBRATION_VOTES):
+        voter.cast(Vote(song, f"{storm.prefix}calibration-{i}", 1, False))
+    return statistics.median(voter.db_ms) if voter.db_ms else None
+
+
+def lock_waits(db_ms, uncontended_ms):
+    """Database time beyond the uncontended median, taken as waiting on locks
+
+    Under contention the statements themselves cost about what they do
+    alone; the rest is SQLite's busy handler sleeping or PostgreSQL
+    waiting on row locks.
+    """
+    if uncontended_ms is None or not db_ms:
+        return None
+    excess = [ms - uncontended_ms for ms in db_ms]
+    waited = [ms for ms in excess if ms >= LOCK_WAIT_MIN_MS]
+    return {
+        "uncontended_db_ms": round(uncontended_ms, 2),
+        "total_s": round(sum(waited) / 1000, 3),
+        "responses_waited": len(waited),
+        "max_ms": round(max(waited), 2) if waited else 0.0,
+    }
+
+
+def database_tallies(database, prefix):
+    """{song_key: (thumbs up, thumbs down)} read straight from the database"""
+    if database.startswith("postgresql://"):
+        import psycopg2
+
+        conn = psycopg2.connect(database)
+    else:
+        conn = sqlite3.connect(database)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(TALLY_SQL.format(prefix=prefix))
+        return {key: (int(up), int(down)) for key, up, down in cursor.fetchall()}
+    finally:
+        conn.close()
+
+
+def api_tallies(port, songs):
+    """{song_key: (thumbs up, thumbs down)} as the app reports them"""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=REQUEST_TIMEOUT)
+    tallies = {}
+    for song in songs:
+        conn.request("GET", f"/api/ratings/{song}")
+        resp = conn.getresponse()
+        body = json.loads(resp.read())
+        tallies[song] = (body["thumbs_up"], body["thumbs_down"])
+    conn.close()
+    return tallies
+
+
+def check_tallies(outcomes, songs, stored, reported):
+    """Compare the database and the API with what the clients were told
+
+    Votes that were never acknowledged may or may not have been stored,
+    so they widen the expected range instead of failing the check.
+    """
+    expected = {song: [0, 0, 0, 0] for song in songs}  # up/down min, up/down max
+    for (song, _), possible in outcomes.items():
+        bounds = expected[song]
+        for offset, rating in enumerate((1, -1)):
+            bounds[offset] += possible == {rating}
+            bounds[offset + 2] += rating in possible
+
+    mismatches = []
+    for song, (up_min, down_min, up_max, down_max) in expected.items():
+        up, down = stored.get(song, (0, 0))
+        if not (up_min <= up <= up_max and down_min <= down <= down_max):
+            mismatches.append(
+                {
+                    "song_id": song,
+                    "expected": [[up_min, up_max], [down_min, down_max]],
+                    "database": [up, down],
+                }
+            )
+    api_mismatches = [
+        {"song_id": song, "database": list(stored.get(song, (0, 0))), "api": list(api)}
+        for song, api in reported.items()
+        if api != stored.get(song, (0, 0))
+    ]
+    return {
+        "correct": not mismatches and not api_mismatches,
+        "exact": all(b[0] == b[2] and b[1] == b[3] for b in expected.values()),
+        "songs": len(expected),
+        "mismatches": mismatches[:MAX_REPORTED_MISMATCHES],
+        "api_mismatches": api_mismatches[:MAX_REPORTED_MISMATCHES],
+    }
+
+
+def run_variant(
+    name, database_url, origin, storm, processes, threads, workers, gunicorn_threads
+):
+    """Boot one variant and storm it; returns its report entry"""
+    state_dir = tempfile.mkdtemp(prefix=f"storm-{name}-")
+    env = variant_env(VARIANTS[name], state_dir, database_url, origin)
+    # Server-Timing carries each request's db time, which is how lock
+    # waits are measured; the slow-request log would only add load
+    env.update(
+        REQUEST_PROFILE="1", REQUEST_PROFILE_SLOW_MS="600000", LOG_LEVEL="WARNING"
+    )
+    server, port = start_variant(name, state_dir, env, workers, gunicorn_threads)
+    pids = []
+    try:
+        wait_for_health(port, timeout=30, path=VARIANTS[name].health_path)
+        pids = worker_pids(server.pid, workers)
+        uncontended_ms = calibrate(port, storm)
+        result = storm_votes(port, storm, processes, threads)
+        songs = storm.song_keys()
+        stored = database_tallies(database_url or env["DATABASE_PATH"], storm.prefix)
+        tallies = check_tallies(
+            result["outcomes"], songs, stored, api_tallies(port, songs)
+        )
+    finally:
+        stop_gunicorn(server, pids)
+
+    elapsed = result["elapsed"]
+    return {
+        "variant": name,
+        "database": "postgresql" if database_url else "sqlite",
+        "votes": result["votes"],
+        "acknowledged": result["acknowledged"],
+        "failed_votes": result["failed"],
+        "retries": result["retries"],
+        "errors": result["errors"],
+        "status_codes": dict(result["status_codes"]),
+        "elapsed_s": round(elapsed, 2),
+        "votes_per_s": round(result["acknowledged"] / elapsed, 1) if elapsed else None,
+        "latency_ms": latency_summary(result["latencies"]),
+        "db_ms": latency_summary([ms / 1000 for ms in result["db_ms"]]),
+        "lock_waits": lock_waits(result["db_ms"], uncontended_ms),
+        "tallies": tallies,
+    }
+
+
+def run(
+    variants=STORM_VARIANTS,
+    processes=8,
+    threads=16,
+    listeners=1024,
+    songs=5,
+    revote_rate=0.2,
+    duplicate_rate=0.1,
+    workers=4,
+    gunicorn_threads=16,
+    postgres_url=None,
+    seed=0,
+):
+    """Run the vote storm against each variant and backend; returns a report"""
+    storm = Storm(
+        tag=uuid.uuid4().hex[:8],  # keeps runs apart in a shared database
+        songs=songs,
+        listeners=listeners,
+        slots=processes * threads,
+        revote_rate=revote_rate,
+        duplicate_rate=duplicate_rate,
+        seed=seed,
+    )
+    origin = FakeCloudFront()
+    origin.start()
+    databases = [None] + ([postgres_url] if postgres_url else [])
+    runs = []
+    try:
+        for database_url in databases:
+            for name in variants:
+                runs.append(
+                    run_variant(
+                        name,
+                        database_url,
+                        origin,
+                        storm,
+                        processes,
+                        threads,
+                        workers,
+                        gunicorn_threads,
+                    )
+                )
+    finally:
+        origin.stop()
+
+    return {
+        "config": {
+            "variants": list(variants),
+            "client_processes": processes,
+            "threads_per_process": threads,
+            "listeners": listeners,
+            "songs": songs,
+            "revote_rate": revote_rate,
+            "duplicate_rate": duplicate_rate,
+            "gunicorn_workers": workers,
+            "gunicorn_threads": gunicorn_threads,
+            "postgresql": bool(postgres_url),
+            "seed": seed,
+        },
+        "runs": runs,
+    }
+
+
+def main():
+    """Main benchmark function"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--variants", default=",".join(STORM_VARIANTS))
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=16, help="per process")
+    parser.add_argument("--listeners", type=int, default=1024)
+    parser.add_argument("--songs", type=int, default=5)
+    parser.add_argument("--revote-rate", type=float, default=0.2)
+    parser.add_argument("--duplicate-rate", type=float, default=0.1)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--gunicorn-threads", type=int, default=16)
+    parser.add_argument(
+        "--postgres-url",
+        default=os.getenv("LOAD_TEST_POSTGRES_URL"),
+        help="also storm each variant against this database",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report here instead of stdout")
+    args = parser.parse_args()
+
+    variants = tuple(v for v in args.variants.split(",") if v)
+    unknown = set(variants) - set(STORM_VARIANTS)
+    if unknown:
+        parser.error(f"unknown variant: {', '.join(sorted(unknown))}")
+
+    report = run(
+        variants,
+        args.processes,
+        args.threads,
+        args.listeners,
+        args.songs,
+        args.revote_rate,
+        args.duplicate_rate,
+        args.workers,
+        args.gunicorn_threads,
+        args.postgres_url,
+        args.seed,
+    )
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    # Wrong tallies are a bug, not a slow run
+    if not all(entry["tallies"]["correct"] for entry in report["runs"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
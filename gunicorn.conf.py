@@ -0,0 +1,39 @@
+"""
+gunicorn hooks for Radio Calico, loaded from the working directory
+
+For app_optimized the master brings the database schema up to date once,
+before any worker forks, so workers only read the stored schema version.
+Every worker logs how long it took from fork to being ready to serve.
+"""
+
+import os
+import time
+
+
+def on_starting(server):
+    if not (server.app.app_uri or "").startswith("app_optimized:"):
+        return
+    from schema import SCHEMA_VERSION, ensure_schema
+
+    # Same lookup as app_optimized, relative to the directory it will run in
+    database = os.getenv("DATABASE_PATH") or os.getenv("DATABASE_URL") or "database.db"
+    started = time.perf_counter()
+    migrated = ensure_schema(database)
+    server.log.info(
+        "Database schema version %d %s in %.1f ms",
+        SCHEMA_VERSION,
+        "applied" if migrated else "checked",
+        (time.perf_counter() - started) * 1000,
+    )
+
+
+def post_fork(server, worker):
+    worker.boot_started = time.perf_counter()
+
+
+def post_worker_init(worker):
+    worker.log.info(
+        "Worker %s booted in %.1f ms",
+        worker.pid,
+        (time.perf_counter() - worker.boot_started) * 1000,
+    )
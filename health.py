@@ -0,0 +1,249 @@
+"""
+Background health probing for Radio Calico
+
+Health endpoints are hit constantly by Docker, nginx and load balancers,
+and used to query the database on every call, which piles load onto the
+database exactly when it is struggling. Instead, one thread per worker
+runs the probes (database, caches, album art origin) on an interval and
+encodes the results once; /health/live and /health/ready hand out those
+bytes without touching anything else.
+
+Liveness only says the worker is responsive: a heartbeat thread that
+touches nothing else is still ticking, so a hung database or origin never
+gets a healthy container restarted. Each probe runs on its own thread with
+a timeout, and one that hangs only fails its own check. Readiness requires
+every critical probe to have passed in the last round. A failing
+non-critical probe, such as the album art origin, reports "degraded" but
+stays ready, since the app can fall back.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from background import BackgroundThread
+
+PROBE_INTERVAL = 5.0  # seconds between probe rounds
+PROBE_TIMEOUT = 3.0  # seconds a round waits for each probe
+HEARTBEAT_INTERVAL = 1.0  # seconds between liveness heartbeats
+STALE_ROUNDS = 3  # rounds or beats missed before the worker is considered wedged
+FIRST_ROUND_WAIT = 3.0  # seconds the first health request waits for results
+
+
+def iso_time(timestamp):
+    moment = datetime.fromtimestamp(timestamp, timezone.utc)
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+class ProbeRunner:
+    """Calls one probe on its own long-lived thread when triggered
+
+    The thread is kept between rounds so probes can hold thread-local
+    resources such as a database connection.
+    """
+
+    def __init__(self, name, check, stop):
+        self.name = name
+        self.check = check
+        self.result = None
+        self._stop = stop
+        self._due = threading.Event()
+        self._done = threading.Event()
+        self._done.set()
+        self._thread = threading.Thread(
+            target=self._run, name=f"health-probe-{name}", daemon=True
+        )
+        self._thread.start()
+
+    def trigger(self):
+        """Start a call; False if the previous one is still running"""
+        if not self._done.is_set():
+            return False
+        self._done.clear()
+        self._due.set()
+        return True
+
+    def wait(self, timeout):
+        return self._done.wait(timeout)
+
+    def wake(self):
+        self._due.set()
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def _run(self):
+        while True:
+            self._due.wait()
+            self._due.clear()
+            if self._stop.is_set():
+                return
+            started = time.perf_counter()
+            try:
+                result = {"ok": True, **(self.check() or {})}
+            except Exception as e:
+                result = {"ok": False, "error": str(e) or type(e).__name__}
+            result["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            self.result = result
+            self._done.set()
+
+
+class HealthProber:
+    """Runs named probes on a thread and caches encoded health responses
+
+    probes maps a name to a callable that raises on failure and may return
+    a dict of details to report. details is called once per round for
+    point-in-time figures such as pool saturation. A probe that takes
+    longer than timeout seconds is reported as failed for that round.
+    """
+
+    def __init__(
+        self,
+        probes,
+        critical=(),
+        details=None,
+        interval=PROBE_INTERVAL,
+        timeout=PROBE_TIMEOUT,
+    ):
+        self.probes = probes
+        self.critical = set(critical)
+        self.details = details
+        self.interval = interval
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._prober = BackgroundThread(
+            self._run, "health-prober", on_start=self._reset
+        )
+        self._heart = BackgroundThread(
+            self._run_heartbeat, "health-heartbeat", on_start=self._beat
+        )
+        self._stop = self._prober.stopping
+        self._runners = None
+        self._runners_pid = None
+        self._first_round = threading.Event()
+        self._last_round = None  # monotonic time the last round finished
+        self._heartbeat = None  # monotonic time of the last liveness beat
+        self._ready = None  # (status code, encoded body)
+        self._live = None
+
+    def start(self):
+        self._prober.start()
+        self._heart.start()
+
+    def _reset(self):
+        # Results inherited across fork describe the parent
+        self._first_round.clear()
+        self._last_round = self._ready = None
+
+    def stop(self):
+        self._stop.set()
+        for runner in (self._runners or {}).values():
+            runner.wake()
+        self._prober.stop()
+        self._heart.stop()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.probe()
+            self._stop.wait(self.interval)
+
+    def _run_heartbeat(self):
+        while not self._heart.stopping.wait(HEARTBEAT_INTERVAL):
+            self._beat()
+
+    def _beat(self):
+        live = {
+            "status": "alive",
+            "pid": os.getpid(),
+            "checked_at": iso_time(time.time()),
+        }
+        self._live = (200, json.dumps(live).encode())
+        self._heartbeat = time.monotonic()
+
+    def _probe_runners(self):
+        """This process's ProbeRunner per probe; threads do not survive fork"""
+        if not self._runners_current():
+            with self._lock:
+                if not self._runners_current():
+                    self._runners = {
+                        name: ProbeRunner(name, check, self._stop)
+                        for name, check in self.probes.items()
+                    }
+                    self._runners_pid = os.getpid()
+        return self._runners
+
+    def _runners_current(self):
+        return self._runners_pid == os.getpid() and all(
+            runner.is_alive() for runner in self._runners.values()
+        )
+
+    def probe(self):
+        """Run every probe once, in parallel, and cache the encoded results"""
+        runners = self._probe_runners()
+        started = time.perf_counter()
+        triggered = {name: runner.trigger() for name, runner in runners.items()}
+        deadline = time.monotonic() + self.timeout
+
+        checks = {}
+        for name, runner in runners.items():
+            if not triggered[name]:
+                result = {"ok": False, "error": "still running from an earlier round"}
+            elif runner.wait(max(0, deadline - time.monotonic())):
+                result = dict(runner.result)
+            else:
+                result = {"ok": False, "error": f"timed out after {self.timeout}s"}
+            if "latency_ms" not in result:
+                elapsed = time.perf_counter() - started
+                result["latency_ms"] = round(elapsed * 1000, 2)
+            result["critical"] = name in self.critical
+            checks[name] = result
+
+        if any(not c["ok"] for c in checks.values() if c["critical"]):
+            status, code = "unhealthy", 503
+        elif any(not c["ok"] for c in checks.values()):
+            status, code = "degraded", 200
+        else:
+            status, code = "healthy", 200
+
+        body = {
+            "status": status,
+            "pid": os.getpid(),
+            "checked_at": iso_time(time.time()),
+            "checks": checks,
+        }
+        if self.details is not None:
+            try:
+                body.update(self.details())
+            except Exception as e:
+                body["details_error"] = str(e)
+
+        self._ready = (code, json.dumps(body).encode())
+        self._last_round = time.monotonic()
+        self._first_round.set()
+
+    def _stale(self, last, every):
+        """Encoded 503 if last is missing or more than a few periods old"""
+        if last is None:
+            status = "starting"
+        elif time.monotonic() - last > every * STALE_ROUNDS:
+            status = "stale"
+        else:
+            return None
+        return 503, json.dumps({"status": status, "pid": os.getpid()}).encode()
+
+    def live(self):
+        """(status code, JSON body) for liveness; never waits on a probe"""
+        self.start()
+        return self._stale(self._heartbeat, HEARTBEAT_INTERVAL) or self._live
+
+    def ready(self):
+        """(status code, JSON body) for readiness"""
+        self.start()
+        if not self._first_round.is_set():
+            self._first_round.wait(FIRST_ROUND_WAIT)
+        # A round lasts up to timeout on top of the interval
+        every = self.interval + self.timeout
+        return self._stale(self._last_round, every) or self._ready
@@ -0,0 +1,331 @@
+"""
+HLS edge relay for Radio Calico
+
+In relay mode the app sits between local listeners and the HLS origin, for
+on-prem venues and edge boxes where many listeners share one uplink. Each
+playlist is fetched from the origin at most once per refresh interval and
+each segment exactly once, however many listeners ask for it. Segments are
+kept in a bounded in-memory ring, newly listed ones are prefetched, and
+playlist URIs are rewritten to point back at the relay. A listener's query
+string is only kept when a relayed playlist lists that exact URI, so made-up
+queries cannot add cache entries or force origin fetches.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from urllib.parse import urljoin
+
+from static_index import StaticEntry
+
+SEGMENT_RING_SIZE = 32  # segments kept in memory, across every rendition
+MAX_PLAYLISTS = 16  # playlists kept; the least recently refreshed goes first
+MAX_SEGMENT_BYTES = 16 * 1024 * 1024  # refuse to relay anything larger
+PLAYLIST_TTL = 1.0  # seconds; used when a playlist has no target duration
+MASTER_PLAYLIST_TTL = 30.0  # seconds; master playlists rarely change
+UPSTREAM_TIMEOUT = 10
+POOL_MAXSIZE = 16
+PREFETCH_WORKERS = 2
+
+HLS_MIMETYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts": "video/mp2t",
+    ".aac": "audio/aac",
+    ".m4a": "audio/mp4",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4",
+    ".vtt": "text/vtt",
+    ".key": "application/octet-stream",
+}
+
+URI_ATTRIBUTE = re.compile(r'URI="([^"]*)"')
+TARGET_DURATION = re.compile(r"^#EXT-X-TARGETDURATION:(\d+(?:\.\d+)?)", re.MULTILINE)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RelayedPlaylist:
+    entry: StaticEntry
+    segments: tuple
+    resources: tuple  # every relay name listed, variant playlists included
+    ttl: float
+    fetched_at: float
+    upstream_etag: str
+
+
+def hls_mimetype(name):
+    """Content type for an HLS resource name, or None if it is not one"""
+    path = name.split("?", 1)[0]
+    for suffix, mimetype in HLS_MIMETYPES.items():
+        if path.endswith(suffix):
+            return mimetype
+    return None
+
+
+def is_playlist(name):
+    return name.split("?", 1)[0].endswith(".m3u8")
+
+
+def memory_entry(name, body, mtime=None):
+    """StaticEntry holding body in memory, with a strong content-hash ETag"""
+    mtime = time.time() if mtime is None else mtime
+    return StaticEntry(
+        path=name,
+        size=len(body),
+        mtime=mtime,
+        mtime_ns=int(mtime * 1e9),
+        etag=hashlib.sha256(body).hexdigest()[:32],
+        data=body,
+    )
+
+
+class HlsRelay:
+    """Fetch-once relay of an HLS origin, keyed by path relative to the origin"""
+
+    def __init__(
+        self,
+        origin_url,
+        prefix="/hls/",
+        ring_size=SEGMENT_RING_SIZE,
+        max_playlists=MAX_PLAYLISTS,
+        playlist_ttl=PLAYLIST_TTL,
+        timeout=UPSTREAM_TIMEOUT,
+        pool_maxsize=POOL_MAXSIZE,
+    ):
+        self.base_url = origin_url.rsplit("/", 1)[0] + "/"
+        self.playlist_name = origin_url.rsplit("/", 1)[1]
+        self.prefix = prefix
+        self.ring_size = ring_size
+        self.max_playlists = max_playlists
+        self.playlist_ttl = playlist_ttl
+        self.timeout = timeout
+        self.pool_maxsize = pool_maxsize
+
+        self._playlists = {}
+        self._segments = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._session = None
+        self._executor = None
+        self._pid = None
+
+    def _per_process(self):
+        """Pooled session and prefetch pool, recreated after fork"""
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=1, pool_maxsize=self.pool_maxsize
+                    )
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=PREFETCH_WORKERS, thread_name_prefix="hls-prefetch"
+                    )
+                    self._pid = pid
+        return self._session, self._executor
+
+    def opened_session(self):
+        """This process's origin session, or None if it has not relayed yet"""
+        if self._pid == os.getpid():
+            return self._session
+        return None
+
+    def _coalesced(self, key, fetch):
+        """Run fetch once for concurrent callers asking for the same key"""
+        with self._lock:
+            pending = self._inflight.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._inflight[key] = Future()
+        if not owner:
+            return pending.result(timeout=self.timeout * 2)
+
+        try:
+            result = fetch()
+        except Exception as e:
+            pending.set_exception(e)
+            raise
+        else:
+            pending.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def _fetch(self, name, headers=None):
+        session, _ = self._per_process()
+        resp = session.get(
+            urljoin(self.base_url, name),
+            headers=headers or {},
+            timeout=self.timeout,
+            stream=True,
+        )
+        if resp.status_code == 304:
+            resp.close()
+            return resp, None
+        resp.raise_for_status()
+
+        length = resp.headers.get("Content-Length")
+        if length and int(length) > MAX_SEGMENT_BYTES:
+            resp.close()
+            raise ValueError(f"{name} is larger than {MAX_SEGMENT_BYTES} bytes")
+        body = bytearray()
+        for chunk in resp.iter_content(64 * 1024):
+            body += chunk
+            if len(body) > MAX_SEGMENT_BYTES:
+                resp.close()
+                raise ValueError(f"{name} is larger than {MAX_SEGMENT_BYTES} bytes")
+        return resp, bytes(body)
+
+    def local_uri(self, uri, playlist_name):
+        """URI for a listener: relay path for origin resources, else unchanged"""
+        absolute = urljoin(urljoin(self.base_url, playlist_name), uri)
+        if absolute.startswith(self.base_url):
+            return self.prefix + absolute[len(self.base_url) :]
+        return uri
+
+    def rewrite_playlist(self, body, name):
+        """Return (rewritten body, relay names of the listed media resources)"""
+        lines = []
+        resources = []
+        for line in body.decode("utf-8").splitlines():
+            if line.startswith("#"):
+                line = URI_ATTRIBUTE.sub(
+                    lambda m: f'URI="{self.local_uri(m.group(1), name)}"', line
+                )
+            elif line.strip():
+                line = self.local_uri(line.strip(), name)
+                if line.startswith(self.prefix):
+                    resources.append(line[len(self.prefix) :])
+            lines.append(line)
+        return ("\n".join(lines) + "\n").encode("utf-8"), tuple(resources)
+
+    def _playlist_ttl(self, body):
+        match = TARGET_DURATION.search(body.decode("utf-8", "replace"))
+        if match:
+            # Refresh twice per target duration so new segments show up early
+            return float(match.group(1)) / 2
+        if b"#EXT-X-STREAM-INF" in body:
+            return MASTER_PLAYLIST_TTL
+        return self.playlist_ttl
+
+    def resolve(self, path, query=""):
+        """Relay name for a request path and query string
+
+        The query string is kept only when a relayed playlist lists that
+        exact URI, e.g. an origin token on a segment; otherwise it is dropped.
+        """
+        if query:
+            name = f"{path}?{query}"
+            for playlist in list(self._playlists.values()):
+                if name in playlist.resources:
+                    return name
+        return path
+
+    def get_playlist(self, name):
+        """Return the rewritten RelayedPlaylist for name, refreshing if due
+
+        A stale copy is served if the origin fails; with nothing cached the
+        origin error is raised.
+        """
+        cached = self._playlists.get(name)
+        if cached is not None and time.time() - cached.fetched_at < cached.ttl:
+            return cached
+        if cached is not None and ("playlist", name) in self._inflight:
+            # Another listener is already refreshing it; don't queue behind them
+            return cached
+        try:
+            return self._coalesced(("playlist", name), lambda: self._refresh(name))
+        except Exception:
+            if cached is None:
+                raise
+            logger.warning("HLS playlist refresh failed, serving stale %s", name)
+            return cached
+
+    def _refresh(self, name):
+        cached = self._playlists.get(name)
+        headers = {}
+        if cached is not None and cached.upstream_etag:
+            headers["If-None-Match"] = cached.upstream_etag
+        resp, body = self._fetch(name, headers)
+
+        now = time.time()
+        if body is None:
+            playlist = replace(cached, fetched_at=now)
+        else:
+            rewritten, resources = self.rewrite_playlist(body, name)
+            # Variant playlists in a master playlist are fetched when asked for
+            segments = tuple(r for r in resources if not is_playlist(r))
+            if cached is not None and cached.entry.data == rewritten:
+                # Keep Last-Modified and the ETag stable for listeners
+                entry = cached.entry
+            else:
+                entry = memory_entry(name, rewritten, now)
+            playlist = RelayedPlaylist(
+                entry,
+                segments,
+                resources,
+                self._playlist_ttl(body),
+                now,
+                resp.headers.get("ETag"),
+            )
+        with self._lock:
+            self._playlists[name] = playlist
+            while len(self._playlists) > self.max_playlists:
+                oldest = min(
+                    self._playlists, key=lambda n: self._playlists[n].fetched_at
+                )
+                del self._playlists[oldest]
+        self._prefetch(playlist.segments[-self.ring_size :])
+        return playlist
+
+    def _prefetch(self, names):
+        _, executor = self._per_process()
+        for name in names:
+            if name not in self._segments and ("segment", name) not in self._inflight:
+                executor.submit(self._prefetch_one, name)
+
+    def _prefetch_one(self, name):
+        try:
+            self.get_segment(name)
+        except Exception as e:
+            logger.warning("HLS segment prefetch failed for %s: %s", name, e)
+
+    def get_segment(self, name):
+        """Return a StaticEntry for a segment, fetching it once from the origin"""
+        entry = self._segments.get(name)
+        if entry is not None:
+            return entry
+        return self._coalesced(("segment", name), lambda: self._load_segment(name))
+
+    def _load_segment(self, name):
+        entry = self._segments.get(name)
+        if entry is not None:
+            return entry
+        _, body = self._fetch(name)
+        entry = memory_entry(name, body)
+        with self._lock:
+            self._segments[name] = entry
+            while len(self._segments) > self.ring_size:
+                self._segments.popitem(last=False)
+        return entry
+
+    def memory_bytes(self):
+        """Bytes of segments and playlists currently held in memory"""
+        segments = sum(entry.size for entry in list(self._segments.values()))
+        playlists = sum(p.entry.size for p in list(self._playlists.values()))
+        return segments + playlists
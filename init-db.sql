@@ -12,18 +12,44 @@ CREATE TABLE IF NOT EXISTS users (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Create songs dictionary table (public song_id strings -> compact integer ids)
+CREATE TABLE IF NOT EXISTS songs (
+    id SERIAL PRIMARY KEY,
+    song_key VARCHAR(100) UNIQUE NOT NULL,
+    ratings_version INTEGER NOT NULL DEFAULT 0,
+    title VARCHAR(500),
+    artist VARCHAR(500),
+    album VARCHAR(500),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Bumped on every vote so live tally streams can poll one column per song
+ALTER TABLE songs ADD COLUMN IF NOT EXISTS ratings_version INTEGER NOT NULL DEFAULT 0;
+
+-- Track metadata, filled in from the stream metadata when a song is played
+ALTER TABLE songs ADD COLUMN IF NOT EXISTS title VARCHAR(500);
+ALTER TABLE songs ADD COLUMN IF NOT EXISTS artist VARCHAR(500);
+ALTER TABLE songs ADD COLUMN IF NOT EXISTS album VARCHAR(500);
+
+-- Create plays table (one row per track change, written by the poller leader)
+CREATE TABLE IF NOT EXISTS plays (
+    id SERIAL PRIMARY KEY,
+    song_id INTEGER NOT NULL REFERENCES songs(id),
+    played_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
 -- Create song_ratings table
 CREATE TABLE IF NOT EXISTS song_ratings (
     id SERIAL PRIMARY KEY,
-    song_id VARCHAR(100) NOT NULL,
-    user_fingerprint VARCHAR(32) NOT NULL,
+    song_id INTEGER NOT NULL REFERENCES songs(id),
+    user_fingerprint BYTEA NOT NULL CHECK(octet_length(user_fingerprint) = 16),
     rating INTEGER NOT NULL CHECK(rating IN (1, -1)),
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     UNIQUE(song_id, user_fingerprint)
 );
 
 -- Create indexes for better performance
-CREATE INDEX IF NOT EXISTS idx_song_ratings_song_id ON song_ratings(song_id);
+-- (lookups by song_id are covered by the UNIQUE(song_id, user_fingerprint) index)
 CREATE INDEX IF NOT EXISTS idx_song_ratings_user_fingerprint ON song_ratings(user_fingerprint);
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
 CREATE INDEX IF NOT EXISTS idx_users_created_at ON users(created_at DESC);
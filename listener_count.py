@@ -0,0 +1,228 @@
+"""
+Approximate concurrent-listener counting for Radio Calico
+
+Every heartbeat or segment request adds the listener id to a HyperLogLog
+sketch for the current minute. A sketch is 4 KB however many listeners it
+has seen and estimates the distinct count to within about 1.6%, and two
+sketches merge by taking the larger of each register. Each worker keeps
+the last hour of per-minute sketches, a background thread writes them to a
+file in the shared runtime directory every few seconds while they change,
+and the other workers' files are merged in when a count is asked for.
+"""
+
+import glob
+import hashlib
+import logging
+import math
+import os
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+
+from background import BackgroundThread
+
+PRECISION = 12  # 4096 registers; standard error 1.04 / sqrt(4096)
+WINDOW_MINUTES = 60  # per-minute sketches kept, and the span of "peak"
+CURRENT_MINUTES = 2  # "current" is everyone seen in this many latest minutes
+FLUSH_INTERVAL = 5.0  # seconds between writes of this worker's sketches
+
+FILE_MAGIC = b"HLL1"
+
+logger = logging.getLogger(__name__)
+
+
+class HyperLogLog:
+    """Distinct-count sketch with 2**precision one-byte registers"""
+
+    def __init__(self, precision=PRECISION, registers=None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers or self.size)
+
+    def add(self, key):
+        """Add a bytes key"""
+        value = int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big")
+        index = value >> (64 - self.precision)
+        rest = value & ((1 << (64 - self.precision)) - 1)
+        # Position of the first 1 bit in the remaining 64 - precision bits
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """Fold other into this sketch"""
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        """Estimated number of distinct keys added"""
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0**-r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate while most registers are empty
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+class ListenerCounter:
+    """Per-minute listener sketches for this worker, merged with the others'"""
+
+    def __init__(
+        self,
+        state_dir,
+        precision=PRECISION,
+        window_minutes=WINDOW_MINUTES,
+        current_minutes=CURRENT_MINUTES,
+        flush_interval=FLUSH_INTERVAL,
+        clock=time.time,
+    ):
+        self.state_dir = state_dir
+        self.precision = precision
+        self.window_minutes = window_minutes
+        self.current_minutes = current_minutes
+        self.flush_interval = flush_interval
+        self.clock = clock
+
+        self._sketches = {}  # minute number -> HyperLogLog
+        self._final_counts = {}  # merged counts of minutes no longer changing
+        self._lock = threading.Lock()
+        self._dirty = False  # added to since the last flush
+        self._flusher = BackgroundThread(self._run, "listener-flush")
+
+    def _minute(self):
+        return int(self.clock() // 60)
+
+    def _path(self, pid=None):
+        return os.path.join(self.state_dir, f"{pid or os.getpid()}.hll")
+
+    def add(self, listener_id):
+        """Record that listener_id (bytes) is listening now"""
+        minute = self._minute()
+        with self._lock:
+            sketch = self._sketches.get(minute)
+            if sketch is None:
+                sketch = self._sketches[minute] = HyperLogLog(self.precision)
+                for old in [
+                    m for m in self._sketches if m <= minute - self.window_minutes
+                ]:
+                    del self._sketches[old]
+            sketch.add(listener_id)
+            self._dirty = True
+        self._flusher.start()
+
+    def stop(self):
+        self._flusher.stop()
+
+    def _run(self):
+        # Timed rather than triggered by add(), so the last adds of a minute
+        # reach disk before other workers treat that minute as settled
+        while not self._flusher.stopping.wait(self.flush_interval):
+            with self._lock:
+                due, self._dirty = self._dirty, False
+            if not due:
+                continue
+            try:
+                self.flush()
+            except OSError as e:
+                logger.warning("Failed to write listener sketches: %s", e)
+
+    def flush(self):
+        """Write this worker's sketches for the other workers to merge"""
+        with self._lock:
+            items = [(m, bytes(s.registers)) for m, s in self._sketches.items()]
+        os.makedirs(self.state_dir, exist_ok=True)
+        path = self._path()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(FILE_MAGIC + struct.pack(">BH", self.precision, len(items)))
+            for minute, registers in items:
+                f.write(struct.pack(">Q", minute) + registers)
+        os.replace(tmp_path, path)
+
+    def _read(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if data[:4] != FILE_MAGIC:
+            return {}
+        precision, items = struct.unpack(">BH", data[4:7])
+        if precision != self.precision:
+            return {}
+        size = 1 << precision
+        sketches = {}
+        offset = 7
+        for _ in range(items):
+            (minute,) = struct.unpack(">Q", data[offset : offset + 8])
+            registers = data[offset + 8 : offset + 8 + size]
+            sketches[minute] = HyperLogLog(precision, registers)
+            offset += 8 + size
+        return sketches
+
+    def _merged(self, oldest):
+        """Per-minute sketches from oldest on, merged across every worker"""
+        merged = {}
+        with self._lock:
+            for minute, sketch in self._sketches.items():
+                if minute >= oldest:
+                    merged[minute] = HyperLogLog(self.precision, sketch.registers)
+
+        stale_before = self.clock() - self.window_minutes * 60
+        for path in glob.glob(os.path.join(self.state_dir, "*.hll")):
+            if path == self._path():
+                continue  # our own sketches are fresher in memory
+            try:
+                if os.path.getmtime(path) < stale_before:
+                    # Left by a worker that stopped more than a window ago
+                    os.unlink(path)
+                    continue
+                sketches = self._read(path)
+            except (OSError, struct.error):
+                continue
+            for minute, sketch in sketches.items():
+                if minute < oldest:
+                    continue
+                if minute in merged:
+                    merged[minute].merge(sketch)
+                else:
+                    merged[minute] = sketch
+        return merged
+
+    def stats(self):
+        """Current and peak listener counts across every worker"""
+        now = self._minute()
+        window_start = now - self.window_minutes + 1
+        # Minutes that ended more than a flush ago no longer change, so their
+        # counts are kept and only the latest few are merged on every call.
+        # The kept counts are never changed in place: each call builds a new
+        # dict and swaps it in, so concurrent calls never see one mid-update.
+        final_counts = self._final_counts
+        settled_before = now - 1 - math.ceil(self.flush_interval / 60)
+        unsettled = [m for m in range(window_start, now + 1) if m not in final_counts]
+        merged = self._merged(min(unsettled + [now - self.current_minutes + 1]))
+
+        counts = dict(final_counts)
+        for minute, sketch in merged.items():
+            if minute not in counts:
+                counts[minute] = sketch.count()
+        self._final_counts = {
+            minute: counts.get(minute, 0)
+            for minute in range(window_start, settled_before)
+        }
+
+        current = HyperLogLog(self.precision)
+        for minute in range(now - self.current_minutes + 1, now + 1):
+            if minute in merged:
+                current.merge(merged[minute])
+
+        listening = current.count()
+        in_window = {m: c for m, c in counts.items() if m >= window_start}
+        in_window[now] = max(in_window.get(now, 0), listening)
+        peak_minute = max(in_window, key=in_window.get)
+        peak_at = datetime.fromtimestamp(peak_minute * 60, timezone.utc)
+        return {
+            "current": listening,
+            "peak": in_window[peak_minute],
+            "peak_at": peak_at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "window_minutes": self.window_minutes,
+        }
@@ -0,0 +1,89 @@
+"""
+Signed listener-id cookies for Radio Calico
+
+The ratings API identifies listeners by a 16-byte id. On first contact the
+server derives that id from the User-Agent/IP fingerprint and hands it back as
+a compact HMAC-signed cookie, so later requests cost one HMAC check and keep
+the same identity when a listener changes networks.
+"""
+
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+
+LISTENER_COOKIE_NAME = "rc_lid"
+LISTENER_COOKIE_MAX_AGE = 86400 * 365  # 1 year
+LISTENER_ID_BYTES = 16
+SIGNATURE_BYTES = 8
+
+logger = logging.getLogger(__name__)
+
+
+def load_secret(secret_file):
+    """Return the signing secret from LISTENER_ID_SECRET or a shared secret file
+
+    Every gunicorn worker must sign with the same key, so when no secret is
+    configured the first worker to start writes a random one to secret_file
+    and the others read it back.
+    """
+    configured = os.getenv("LISTENER_ID_SECRET")
+    if configured:
+        return configured.encode()
+
+    try:
+        with open(secret_file, "rb") as f:
+            secret = f.read().strip()
+        if secret:
+            return secret
+    except FileNotFoundError:
+        pass
+
+    secret = secrets.token_hex(32).encode()
+    tmp_file = f"{secret_file}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, "wb") as f:
+            f.write(secret)
+        os.chmod(tmp_file, 0o600)
+        # link() fails if another worker won the race; use its secret instead
+        os.link(tmp_file, secret_file)
+    except FileExistsError:
+        with open(secret_file, "rb") as f:
+            secret = f.read().strip()
+    except OSError as e:
+        logger.warning(
+            "Listener id secret not persisted (%s); cookies are per-process", e
+        )
+    finally:
+        try:
+            os.unlink(tmp_file)
+        except OSError:
+            pass
+    return secret
+
+
+def _signature(secret, listener_id):
+    return hmac.new(secret, listener_id, hashlib.sha256).digest()[:SIGNATURE_BYTES]
+
+
+def sign_listener_id(secret, listener_id):
+    """Encode a 16-byte listener id and its signature as a 32-char cookie value"""
+    token = listener_id + _signature(secret, listener_id)
+    return base64.urlsafe_b64encode(token).decode()
+
+
+def verify_listener_cookie(secret, value):
+    """Return the listener id from a cookie value, or None if it is not genuine"""
+    if not value or len(value) != 32:
+        return None
+    try:
+        token = base64.urlsafe_b64decode(value)
+    except (ValueError, TypeError):
+        return None
+
+    listener_id, signature = token[:LISTENER_ID_BYTES], token[LISTENER_ID_BYTES:]
+    if not hmac.compare_digest(signature, _signature(secret, listener_id)):
+        return None
+    return listener_id
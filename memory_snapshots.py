@@ -0,0 +1,123 @@
+"""
+tracemalloc snapshots for Radio Calico
+
+Tracing is started on demand in a running worker, snapshots are kept in
+memory under increasing ids, and any two can be compared to show which
+allocation sites grew in between. Sites are grouped by module (file) or
+by line. Tracing slows allocation down and every snapshot holds a copy
+of the traces, so only a few snapshots are kept and tracing should be
+stopped once a leak has been pinned down.
+"""
+
+import os
+import threading
+import tracemalloc
+from collections import OrderedDict
+
+MAX_SNAPSHOTS = 4
+TRACE_FRAMES = 1  # stack depth recorded per allocation
+GROUP_BY = {"module": "filename", "line": "lineno"}
+
+# Allocations made by tracemalloc and the import system are noise
+IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def site_label(traceback, group_by):
+    frame = traceback[0]
+    if group_by == "module":
+        return frame.filename
+    return f"{frame.filename}:{frame.lineno}"
+
+
+class SnapshotStore:
+    """This process's tracemalloc snapshots, oldest dropped first"""
+
+    def __init__(self, max_snapshots=MAX_SNAPSHOTS):
+        self.max_snapshots = max_snapshots
+        self._snapshots = OrderedDict()  # id -> tracemalloc.Snapshot
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def status(self):
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "pid": os.getpid(),
+            "tracing": tracemalloc.is_tracing(),
+            "traced_bytes": current,
+            "peak_traced_bytes": peak,
+            "snapshots": list(self._snapshots),
+        }
+
+    def start(self, frames=TRACE_FRAMES):
+        """Start tracing; allocations made before now are not seen"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def stop(self):
+        """Stop tracing and free the traces and snapshots"""
+        tracemalloc.stop()
+        with self._lock:
+            self._snapshots.clear()
+
+    def take(self):
+        """Snapshot the current traces; returns its id"""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not tracing")
+        snapshot = tracemalloc.take_snapshot().filter_traces(IGNORED)
+        with self._lock:
+            snapshot_id = self._next_id
+            self._next_id += 1
+            self._snapshots[snapshot_id] = snapshot
+            while len(self._snapshots) > self.max_snapshots:
+                self._snapshots.popitem(last=False)
+        return snapshot_id
+
+    def _get(self, snapshot_id):
+        snapshot = self._snapshots.get(snapshot_id)
+        if snapshot is None:
+            raise KeyError(f"No snapshot {snapshot_id} in worker {os.getpid()}")
+        return snapshot
+
+    def top(self, snapshot_id, group_by="line", limit=25):
+        """Largest allocation sites in a snapshot; KeyError if unknown"""
+        snapshot = self._get(snapshot_id)
+        stats = snapshot.statistics(GROUP_BY[group_by])
+        return {
+            "pid": os.getpid(),
+            "id": snapshot_id,
+            "total_bytes": sum(stat.size for stat in stats),
+            "top": [
+                {
+                    "site": site_label(stat.traceback, group_by),
+                    "bytes": stat.size,
+                    "count": stat.count,
+                }
+                for stat in stats[:limit]
+            ],
+        }
+
+    def diff(self, old_id, new_id, group_by="line", limit=25):
+        """Sites whose allocations changed most between two snapshots"""
+        old, new = self._get(old_id), self._get(new_id)
+        stats = new.compare_to(old, GROUP_BY[group_by])
+        return {
+            "pid": os.getpid(),
+            "from": old_id,
+            "to": new_id,
+            "total_bytes_diff": sum(stat.size_diff for stat in stats),
+            "top": [
+                {
+                    "site": site_label(stat.traceback, group_by),
+                    "bytes_diff": stat.size_diff,
+                    "count_diff": stat.count_diff,
+                    "bytes": stat.size,
+                    "count": stat.count,
+                }
+                for stat in stats[:limit]
+            ],
+        }
@@ -0,0 +1,343 @@
+"""
+Prometheus metrics for Radio Calico
+
+Recording is lock-free: every thread updates its own shard of plain Python
+numbers, and shards are only summed when metrics are collected. When a
+thread exits its shard is folded into a per-process total of retired
+shards, so a thread per request does not grow the list being summed. Each
+gunicorn worker writes its totals to a file in a shared directory every few
+seconds, and /metrics merges those files, so whichever worker answers the
+scrape reports the whole deployment. Counters and histograms of workers
+that have exited are folded into an archive file so they never go
+backwards; their gauges are dropped.
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+
+try:
+    import fcntl
+
+    FLOCK_AVAILABLE = True
+except ImportError:
+    FLOCK_AVAILABLE = False
+
+FLUSH_INTERVAL = 5.0  # seconds between writes of this worker's totals
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+ARCHIVE_FILE = "archive.json"
+
+logger = logging.getLogger(__name__)
+
+
+class Metric:
+    """A named family of samples, one per combination of label values"""
+
+    def __init__(self, registry, kind, name, help_text, labels=(), buckets=None):
+        self.registry = registry
+        self.kind = kind
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) if buckets else None
+
+    def _values(self, label_values):
+        shard = self.registry.shard()
+        key = (self.name, label_values)
+        values = shard.get(key)
+        if values is None:
+            # Histograms hold one count per bucket plus +Inf, then sum, count
+            size = len(self.buckets) + 3 if self.buckets else 1
+            values = shard[key] = [0.0] * size
+        return values
+
+    def inc(self, *label_values, amount=1):
+        self._values(label_values)[0] += amount
+
+    def dec(self, *label_values, amount=1):
+        self._values(label_values)[0] -= amount
+
+    def observe(self, value, *label_values):
+        """Record one histogram observation: its bucket, sum and count"""
+        values = self._values(label_values)
+        values[bisect_left(self.buckets, value)] += 1
+        values[-2] += value
+        values[-1] += 1
+
+
+class _ShardHolder:
+    """Kept in thread-local storage; collected when its thread exits"""
+
+    def __init__(self, shard):
+        self.shard = shard
+
+
+class Registry:
+    """Metric definitions plus the per-thread shards holding their values"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self.state_dir = None
+        self.flush_interval = FLUSH_INTERVAL
+
+        self._shards = {}  # id -> shard, for threads still running
+        self._retired = {}  # values of threads that have exited
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._flusher_pid = None
+
+    def _define(self, kind, name, help_text, labels=(), buckets=None):
+        metric = Metric(self, kind, name, help_text, labels, buckets)
+        self.metrics[name] = metric
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._define("counter", name, help_text, labels)
+
+    def gauge(self, name, help_text, labels=()):
+        """Gauge summed over threads and live workers, e.g. requests in flight"""
+        return self._define("gauge", name, help_text, labels)
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self._define("histogram", name, help_text, labels, buckets)
+
+    def add_collector(self, collect):
+        """Register collect() -> [(gauge name, label values, value)], run at flush"""
+        self.collectors.append(collect)
+
+    def shard(self):
+        """This thread's values, created on first use in each process"""
+        holder = getattr(self._local, "holder", None)
+        if holder is not None and self._local.pid == os.getpid():
+            return holder.shard
+        holder = _ShardHolder({})
+        with self._lock:
+            if self._pid != os.getpid():
+                # Values recorded before fork belong to the parent
+                self._shards = {}
+                self._retired = {}
+                self._pid = os.getpid()
+            self._shards[id(holder.shard)] = holder.shard
+            if self.state_dir is not None and self._flusher_pid != os.getpid():
+                self._start_flusher()
+        weakref.finalize(holder, self._retire, holder.shard, os.getpid())
+        self._local.holder, self._local.pid = holder, os.getpid()
+        return holder.shard
+
+    def _retire(self, shard, pid):
+        """Fold an exited thread's shard into the retired totals"""
+        with self._lock:
+            if pid != self._pid:
+                return
+            self._shards.pop(id(shard), None)
+            _merge_into(self._retired, shard)
+
+    def totals(self):
+        """This worker's values summed over threads, plus collector gauges"""
+        with self._lock:
+            shards = list(self._shards.values())
+            totals = {key: list(values) for key, values in self._retired.items()}
+        for shard in shards:
+            for key, values in list(shard.items()):
+                total = totals.get(key)
+                if total is None:
+                    totals[key] = list(values)
+                else:
+                    for i, value in enumerate(values):
+                        total[i] += value
+        for collect in self.collectors:
+            try:
+                for name, label_values, value in collect():
+                    totals[(name, tuple(label_values))] = [float(value)]
+            except Exception as e:
+                logger.warning("Metrics collector failed: %s", e)
+        return totals
+
+    def _path(self):
+        return os.path.join(self.state_dir, f"{os.getpid()}.json")
+
+    def _start_flusher(self):
+        """Write this worker's totals every flush_interval, and once at exit"""
+        self._flusher_pid = os.getpid()
+        threading.Thread(
+            target=self._flush_loop, name="metrics-flush", daemon=True
+        ).start()
+        atexit.register(self._flush_quietly)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self._flush_quietly()
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except OSError as e:
+            logger.warning("Failed to write metrics: %s", e)
+
+    def flush(self):
+        os.makedirs(self.state_dir, exist_ok=True)
+        _write_samples(self._path(), self.totals())
+
+    def collect(self):
+        """Totals for the whole deployment: this worker, the others, the exited"""
+        merged = self.totals()
+        if self.state_dir is None or not os.path.isdir(self.state_dir):
+            return merged
+
+        for name in os.listdir(self.state_dir):
+            pid_text, _, suffix = name.partition(".")
+            if suffix != "json" or not pid_text.isdigit():
+                continue
+            pid = int(pid_text)
+            if pid == os.getpid():
+                continue  # ours are fresher in memory
+            path = os.path.join(self.state_dir, name)
+            if not _pid_alive(pid):
+                self._archive(path)
+                continue
+            _merge_into(merged, _read_samples(path))
+
+        archived = _read_samples(os.path.join(self.state_dir, ARCHIVE_FILE))
+        _merge_into(merged, self._without_gauges(archived))
+        return merged
+
+    def _without_gauges(self, samples):
+        return {
+            key: values
+            for key, values in samples.items()
+            if key[0] in self.metrics and self.metrics[key[0]].kind != "gauge"
+        }
+
+    def _archive(self, path):
+        """Fold an exited worker's counters and histograms into the archive"""
+        archive_path = os.path.join(self.state_dir, ARCHIVE_FILE)
+        with open(os.path.join(self.state_dir, "archive.lock"), "a") as lock_file:
+            if FLOCK_AVAILABLE:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if not os.path.exists(path):
+                return  # another worker archived it first
+            archived = _read_samples(archive_path)
+            _merge_into(archived, self._without_gauges(_read_samples(path)))
+            _write_samples(archive_path, archived)
+            os.unlink(path)
+
+    def render(self):
+        """Prometheus text exposition of collect()"""
+        samples = self.collect()
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            keys = sorted(k for k in samples if k[0] == name)
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key in keys:
+                values = samples[key]
+                labels = list(zip(metric.labels, key[1]))
+                if metric.kind != "histogram":
+                    lines.append(f"{name}{_labels(labels)} {_number(values[0])}")
+                    continue
+                cumulative = 0
+                bounds = [_number(float(b)) for b in metric.buckets] + ["+Inf"]
+                for bound, count in zip(bounds, values):
+                    cumulative += count
+                    le = labels + [("le", bound)]
+                    lines.append(f"{name}_bucket{_labels(le)} {_number(cumulative)}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(values[-2])}")
+                lines.append(f"{name}_count{_labels(labels)} {_number(values[-1])}")
+        return "\n".join(lines) + "\n"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge_into(merged, samples):
+    for key, values in samples.items():
+        total = merged.get(key)
+        if total is None or len(total) != len(values):
+            merged[key] = list(values)
+        else:
+            for i, value in enumerate(values):
+                total[i] += value
+
+
+def _read_samples(path):
+    try:
+        with open(path) as f:
+            rows = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {(name, tuple(labels)): values for name, labels, values in rows}
+
+
+def _write_samples(path, samples):
+    rows = [[name, list(labels), values] for (name, labels), values in samples.items()]
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(rows, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _number(value):
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def http_pool_stats(session):
+    """(connections opened, requests sent, idle connections) over a session's pools"""
+    opened = requests_sent = idle = 0
+    if session is None:
+        return opened, requests_sent, idle
+    for adapter in session.adapters.values():
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue  # evicted since keys() was taken
+            opened += pool.num_connections
+            requests_sent += pool.num_requests
+            idle += pool.pool.qsize() if pool.pool is not None else 0
+    return opened, requests_sent, idle
+
+
+registry = Registry()
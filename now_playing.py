@@ -0,0 +1,215 @@
+"""
+Now-playing metadata fan-out for Radio Calico
+
+One worker per deployment holds a lock file and polls the stream metadata
+upstream, writing each new version to a shared snapshot file. The other
+workers only watch that file. Every worker publishes changes to its own
+Broadcast, which the Server-Sent Events endpoint streams to subscribers.
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass
+
+from background import BackgroundThread
+from sse import Broadcast, sse_event
+
+try:
+    import fcntl
+
+    FLOCK_AVAILABLE = True
+except ImportError:
+    FLOCK_AVAILABLE = False
+
+METADATA_URL = "https://d3d4yli4hf5bmh.cloudfront.net/metadatav2.json"
+POLL_INTERVAL = 2.0  # seconds between upstream polls by the leader
+FOLLOW_INTERVAL = 0.5  # seconds between snapshot checks by other workers
+UPSTREAM_TIMEOUT = 5
+
+logger = logging.getLogger(__name__)
+
+
+def song_id_for(metadata):
+    """Song id as the player derives it: base64("artist-title"), alphanumerics only"""
+    artist = metadata.get("artist") or "Unknown"
+    title = metadata.get("title") or "Unknown"
+    key = f"{artist}-{title}"
+    try:
+        raw = key.encode("latin-1")
+    except UnicodeEncodeError:
+        raw = key.encode("utf-8")
+    return re.sub(r"[^a-zA-Z0-9]", "", base64.b64encode(raw).decode())
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    id: str
+    song_id: str
+    metadata: dict
+    changed_at: float
+    event: bytes
+
+
+class NowPlayingPoller:
+    """Leader-elected metadata poller feeding a per-worker Broadcast"""
+
+    def __init__(
+        self,
+        state_dir,
+        url=METADATA_URL,
+        poll_interval=POLL_INTERVAL,
+        follow_interval=FOLLOW_INTERVAL,
+        timeout=UPSTREAM_TIMEOUT,
+        on_change=None,
+    ):
+        self.state_dir = state_dir
+        self.url = url
+        self.poll_interval = poll_interval
+        self.follow_interval = follow_interval
+        self.timeout = timeout
+        # Called as on_change(snapshot, is_leader) after each new snapshot
+        self.on_change = on_change
+        self.snapshot_path = os.path.join(state_dir, "now_playing.json")
+        self.broadcast = Broadcast()
+
+        self._background = BackgroundThread(
+            self._run, "now-playing-poller", on_start=self._reset
+        )
+        self._stop = self._background.stopping
+        self._leader_file = None
+        self._session = None
+        self._upstream_etag = None
+        self._snapshot_mtime_ns = None
+
+    @property
+    def is_leader(self):
+        return self._leader_file is not None
+
+    @property
+    def current(self):
+        """Latest Snapshot seen by this worker, or None before the first poll"""
+        return self.broadcast.latest[1]
+
+    def start(self):
+        self._background.start()
+
+    def opened_session(self):
+        """This process's upstream session, or None if it has not polled yet"""
+        if self._background.pid == os.getpid():
+            return self._session
+        return None
+
+    def _reset(self):
+        # A leader lock or session inherited across fork is not ours
+        self._leader_file = None
+        self._session = None
+        os.makedirs(self.state_dir, exist_ok=True)
+
+    def stop(self):
+        self._background.stop()
+        if self._leader_file not in (None, True):
+            self._leader_file.close()
+        self._leader_file = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.is_leader or self._try_lead():
+                    self._poll_upstream()
+                    interval = self.poll_interval
+                else:
+                    self._follow_snapshot()
+                    interval = self.follow_interval
+            except Exception as e:
+                logger.warning("Now playing update failed: %s", e)
+                interval = self.poll_interval
+            self._stop.wait(interval)
+
+    def _try_lead(self):
+        """Take the deployment-wide poller lock if no other worker holds it
+
+        The lock is held for the life of the process, and the kernel releases
+        it if the process dies, so another worker takes over on its next tick.
+        """
+        if not FLOCK_AVAILABLE:
+            self._leader_file = True
+            return True
+
+        lock_file = open(os.path.join(self.state_dir, "now_playing.lock"), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._leader_file = lock_file
+        return True
+
+    def _poll_upstream(self):
+        if self._session is None:
+            import requests
+
+            self._session = requests.Session()
+
+        headers = {}
+        if self._upstream_etag:
+            headers["If-None-Match"] = self._upstream_etag
+        resp = self._session.get(self.url, headers=headers, timeout=self.timeout)
+        if resp.status_code == 304:
+            return
+        resp.raise_for_status()
+        self._upstream_etag = resp.headers.get("ETag")
+
+        metadata = resp.json()
+        if self._update(metadata):
+            self._write_snapshot(metadata)
+
+    def _write_snapshot(self, metadata):
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(metadata, f)
+        os.replace(tmp_path, self.snapshot_path)
+
+    def _follow_snapshot(self):
+        try:
+            mtime_ns = os.stat(self.snapshot_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime_ns == self._snapshot_mtime_ns:
+            return
+        with open(self.snapshot_path) as f:
+            metadata = json.load(f)
+        self._snapshot_mtime_ns = mtime_ns
+        self._update(metadata)
+
+    def _update(self, metadata):
+        """Publish metadata if it differs from the current snapshot"""
+        body = json.dumps(metadata, sort_keys=True, separators=(",", ":"))
+        snapshot_id = hashlib.sha256(body.encode()).hexdigest()[:16]
+        current = self.current
+        if current is not None and current.id == snapshot_id:
+            return False
+
+        song_id = song_id_for(metadata)
+        data = json.dumps(
+            {"id": snapshot_id, "song_id": song_id, "metadata": metadata},
+            separators=(",", ":"),
+        )
+        snapshot = Snapshot(
+            id=snapshot_id,
+            song_id=song_id,
+            metadata=metadata,
+            changed_at=time.time(),
+            event=sse_event("now-playing", data, event_id=snapshot_id),
+        )
+        self.broadcast.publish(snapshot)
+        if self.on_change is not None:
+            try:
+                self.on_change(snapshot, self.is_leader)
+            except Exception:
+                logger.exception("Now playing change handler failed")
+        return True
@@ -2,27 +2,77 @@
 """
 Image optimization script for Radio Russell
 Converts images to WebP format and optimizes PNG files
+The helpers below are also used by the app to render album art variants
 """
 
+import io
 import os
 
 from PIL import Image
 
 
+def flatten_to_rgb(img):
+    """Composite transparent images onto white; other modes are unchanged"""
+    if img.mode in ("RGBA", "LA", "P"):
+        # Create a white background
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        if img.mode in ("P", "LA"):
+            img = img.convert("RGBA")
+        background.paste(img, mask=img.split()[-1])
+        return background
+    return img
+
+
+def resize_to_fit(img, width=None, height=None):
+    """Scale down to fit within width x height, keeping the aspect ratio
+
+    Either bound may be None; images are never scaled up.
+    """
+    src_width, src_height = img.size
+    scale = min(
+        width / src_width if width else 1,
+        height / src_height if height else 1,
+        1,
+    )
+    if scale >= 1:
+        return img
+
+    size = (max(1, round(src_width * scale)), max(1, round(src_height * scale)))
+    # Let the JPEG decoder do most of the downscaling for free
+    img.draft(img.mode, size)
+    return img.resize(size, Image.LANCZOS)
+
+
+def encode_image(img, fmt, quality=80):
+    """Encode a PIL image as JPEG, PNG, WEBP or AVIF bytes"""
+    buffer = io.BytesIO()
+    if fmt == "JPEG":
+        img = flatten_to_rgb(img)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        img.save(buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+    elif fmt == "PNG":
+        img.save(buffer, "PNG", optimize=True)
+    elif fmt == "WEBP":
+        if img.mode == "P":
+            img = img.convert("RGBA")
+        # method=4 trades a little size for much faster on-the-fly encoding
+        img.save(buffer, "WebP", quality=quality, method=4, lossless=False)
+    elif fmt == "AVIF":
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA")
+        img.save(buffer, "AVIF", quality=quality)
+    else:
+        raise ValueError(f"Unsupported image format: {fmt}")
+    return buffer.getvalue()
+
+
 def optimize_png(input_path, output_path, quality=85):
     """Optimize PNG image by reducing file size while maintaining quality"""
     try:
         with Image.open(input_path) as img:
             # Convert RGBA to RGB if needed (for smaller file size)
-            if img.mode in ("RGBA", "LA", "P"):
-                # Create a white background
-                background = Image.new("RGB", img.size, (255, 255, 255))
-                if img.mode == "P":
-                    img = img.convert("RGBA")
-                background.paste(
-                    img, mask=img.split()[-1] if img.mode == "RGBA" else None
-                )
-                img = background
+            img = flatten_to_rgb(img)
 
             # Save optimized PNG
             img.save(output_path, "PNG", optimize=True, quality=quality)
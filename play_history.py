@@ -0,0 +1,93 @@
+"""
+Recently played history for Radio Calico
+
+Every worker sees each track change through its now-playing poller and
+appends it to a fixed-size ring buffer, so reading recent plays never needs
+the database. Only the poller leader writes plays to the database, which is
+read once per worker to warm the buffer and for requests that reach further
+back than the buffer holds.
+"""
+
+import threading
+from collections import deque
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+
+BUFFER_SIZE = 50
+
+
+@dataclass(frozen=True)
+class Play:
+    song_id: str
+    title: str
+    artist: str
+    album: str
+    played_at: str  # ISO 8601, UTC
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def play_from_snapshot(snapshot):
+    """Play for a now-playing Snapshot"""
+    metadata = snapshot.metadata
+    played_at = datetime.fromtimestamp(snapshot.changed_at, timezone.utc)
+    return Play(
+        song_id=snapshot.song_id,
+        title=metadata.get("title") or "Unknown Title",
+        artist=metadata.get("artist") or "Unknown Artist",
+        album=metadata.get("album") or "",
+        played_at=played_at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+    )
+
+
+class PlayHistory:
+    """Per-worker ring buffer of the most recent plays, newest last"""
+
+    def __init__(self, size=BUFFER_SIZE):
+        self.size = size
+        self._plays = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._warmed = False
+        # True once the buffer is known to hold every play there has been
+        self._complete = False
+
+    @property
+    def warmed(self):
+        return self._warmed
+
+    def record(self, play):
+        """Append play unless it repeats the newest; return whether it was added"""
+        with self._lock:
+            if self._plays and self._plays[-1].song_id == play.song_id:
+                return False
+            if self._complete and len(self._plays) == self.size:
+                self._complete = False
+            self._plays.append(play)
+            return True
+
+    def warm(self, stored):
+        """Put plays read from the database, oldest first, ahead of the buffer
+
+        Plays this worker recorded since it started stay newest; the stored
+        copy of a play already in the buffer is dropped.
+        """
+        with self._lock:
+            if self._warmed:
+                return
+            merged = []
+            for play in list(stored) + list(self._plays):
+                if merged and merged[-1].song_id == play.song_id:
+                    continue
+                merged.append(play)
+            self._complete = len(stored) < self.size
+            self._plays = deque(merged, maxlen=self.size)
+            self._warmed = True
+
+    def recent(self, limit):
+        """Up to limit plays, newest first, or None if the buffer cannot say"""
+        with self._lock:
+            if limit > len(self._plays) and not self._complete:
+                return None
+            plays = list(self._plays)
+        return plays[::-1][:limit]
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Static asset precompression script for Radio Russell
+Writes .br and .gz siblings for text assets so the app can serve them
+without compressing on every request
+"""
+
+import gzip
+import os
+import sys
+
+try:
+    import brotli
+
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# Formats that are already compressed gain nothing from another pass
+COMPRESSIBLE_EXTENSIONS = (".html", ".css", ".js", ".json", ".svg", ".txt", ".xml")
+MIN_SIZE = 256  # bytes; smaller files are not worth a second request variant
+
+
+def find_assets(static_dir="static", root_dir="."):
+    """List every compressible file under static/ plus the root HTML files"""
+    assets = []
+    for dirpath, _dirnames, filenames in os.walk(static_dir):
+        for name in filenames:
+            if name.endswith(COMPRESSIBLE_EXTENSIONS):
+                assets.append(os.path.join(dirpath, name))
+
+    for name in os.listdir(root_dir):
+        if name.endswith(".html"):
+            assets.append(os.path.join(root_dir, name))
+
+    return sorted(assets)
+
+
+def is_up_to_date(source_path, variant_path):
+    """Check whether a compressed variant is newer than its source"""
+    try:
+        return os.path.getmtime(variant_path) >= os.path.getmtime(source_path)
+    except OSError:
+        return False
+
+
+def precompress_file(path, force=False):
+    """Write .gz (and .br when available) siblings for one file
+
+    Returns the list of variant paths that were written.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    if len(data) < MIN_SIZE:
+        return []
+
+    encoders = [(".gz", lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+    if BROTLI_AVAILABLE:
+        encoders.append((".br", lambda d: brotli.compress(d, quality=11)))
+
+    written = []
+    for suffix, encode in encoders:
+        variant_path = path + suffix
+        if not force and is_up_to_date(path, variant_path):
+            continue
+
+        compressed = encode(data)
+        if len(compressed) >= len(data):
+            # Never serve a variant that is bigger than the original
+            if os.path.exists(variant_path):
+                os.remove(variant_path)
+            continue
+
+        tmp_path = f"{variant_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(compressed)
+        os.replace(tmp_path, variant_path)
+        written.append(variant_path)
+
+    return written
+
+
+def main():
+    """Main precompression function"""
+    force = "--force" in sys.argv[1:]
+
+    print("🗜️  Radio Russell Asset Precompressor")
+    print("=" * 40)
+    if not BROTLI_AVAILABLE:
+        print("⚠️  Warning: brotli not installed, writing .gz variants only")
+
+    total_written = 0
+    for path in find_assets():
+        written = precompress_file(path, force=force)
+        for variant_path in written:
+            ratio = os.path.getsize(variant_path) / os.path.getsize(path) * 100
+            print(f"✅ {variant_path} ({ratio:.0f}% of original)")
+        total_written += len(written)
+
+    print(f"\n🎉 Precompression complete! {total_written} variant(s) written")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Live rating tallies for Radio Calico
+
+Listeners watching a song subscribe to its tally. Each worker keeps one
+Broadcast per watched song, plus a background thread that reads the
+ratings_version of every watched song in one query per interval and
+re-aggregates only the songs whose version moved. However many listeners
+watch a song and however fast votes arrive, a worker runs at most one
+aggregation and pushes at most one update per song per interval. Because
+the version lives in the database, votes cast through any worker are seen.
+"""
+
+import json
+import logging
+import threading
+from dataclasses import dataclass
+
+from background import BackgroundThread
+from sse import Broadcast, sse_event
+
+PUSH_INTERVAL = 0.5  # seconds; the coalescing window for tally updates
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class TallyUpdate:
+    id: str
+    song_id: str
+    thumbs_up: int
+    thumbs_down: int
+    event: bytes
+
+
+def tally_update(song_id, version, tally):
+    """Build a TallyUpdate with its pre-encoded event"""
+    thumbs_up, thumbs_down = tally
+    data = json.dumps(
+        {"song_id": song_id, "thumbs_up": thumbs_up, "thumbs_down": thumbs_down},
+        separators=(",", ":"),
+    )
+    return TallyUpdate(
+        id=str(version),
+        song_id=song_id,
+        thumbs_up=thumbs_up,
+        thumbs_down=thumbs_down,
+        event=sse_event("tally", data, event_id=version),
+    )
+
+
+class _Channel:
+    def __init__(self, version, tally):
+        self.broadcast = Broadcast()
+        self.subscribers = 0
+        self.version = version
+        self.tally = tally
+
+
+class RatingsHub:
+    """Per-worker fan-out of tally changes for the songs being watched
+
+    poll_changes(known_versions) receives {song_id: version} for every
+    watched song and returns {song_id: (version, (thumbs_up, thumbs_down))}
+    for those whose version differs.
+    """
+
+    def __init__(self, poll_changes, interval=PUSH_INTERVAL):
+        self.poll_changes = poll_changes
+        self.interval = interval
+
+        self._channels = {}
+        self._lock = threading.Lock()
+        self._background = BackgroundThread(self._run, "ratings-hub")
+        self._stop = self._background.stopping
+
+    def start(self):
+        self._background.start()
+
+    def stop(self):
+        self._background.stop()
+
+    def watched(self):
+        """Number of songs with at least one subscriber in this worker"""
+        return len(self._channels)
+
+    def subscribe(self, song_id, version, tally):
+        """Return the song's Broadcast, seeding it with the caller's read of the tally
+
+        A song already being watched keeps its own, possibly newer, state.
+        """
+        with self._lock:
+            channel = self._channels.get(song_id)
+            if channel is None:
+                channel = _Channel(version, tally)
+                channel.broadcast.publish(tally_update(song_id, version, tally))
+                self._channels[song_id] = channel
+            channel.subscribers += 1
+            return channel.broadcast
+
+    def unsubscribe(self, song_id):
+        with self._lock:
+            channel = self._channels.get(song_id)
+            if channel is None:
+                return
+            channel.subscribers -= 1
+            if channel.subscribers <= 0:
+                del self._channels[song_id]
+
+    def refresh(self):
+        """Re-aggregate every watched song whose version changed; one tick"""
+        with self._lock:
+            known = {song_id: ch.version for song_id, ch in self._channels.items()}
+        if not known:
+            return
+
+        for song_id, (version, tally) in self.poll_changes(known).items():
+            with self._lock:
+                channel = self._channels.get(song_id)
+                if channel is None:
+                    continue
+                channel.version = version
+                # Votes that cancel out, or a repeated vote, change nothing
+                if tally == channel.tally:
+                    continue
+                channel.tally = tally
+                channel.broadcast.publish(tally_update(song_id, version, tally))
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning("Rating tally refresh failed: %s", e)
+            self._stop.wait(self.interval)
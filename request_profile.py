@@ -0,0 +1,195 @@
+"""
+Opt-in per-request profiling for Radio Calico
+
+When enabled, every SQL statement a request runs is timed, either through
+the sqlite3 trace callback or SQLAlchemy's cursor events, along with the
+time spent in the response cache and in JSON serialization. The totals go
+out in a Server-Timing header, which browser dev tools show next to the
+request, and requests slower than a threshold log their full query list.
+Nothing here is installed when profiling is off, so it costs nothing then.
+"""
+
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+SLOW_REQUEST_MS = 500.0
+
+_current = ContextVar("request_profile", default=None)
+
+
+class RequestProfile:
+    """Statements and phase timings collected while handling one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []  # (statement, seconds), in the order they ran
+        self.phases = {}  # phase name -> seconds
+        self._traced = []  # (statement, started) not yet known to be done
+
+    def add_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def add_query(self, statement, seconds):
+        self.queries.append((statement, seconds))
+
+    def trace(self, statement):
+        """sqlite3 trace callback: statement is about to run"""
+        self._traced.append((statement, time.perf_counter()))
+
+    def settle(self):
+        """Close out traced statements once the call that ran them returns
+
+        A single execute() or commit() may run several statements, such as
+        the implicit BEGIN before an INSERT, so each one lasts until the
+        next one starts.
+        """
+        if not self._traced:
+            return
+        ended = time.perf_counter()
+        traced, self._traced = self._traced, []
+        for (statement, started), (_, next_started) in zip(
+            traced, traced[1:] + [(None, ended)]
+        ):
+            self.add_query(statement, next_started - started)
+
+    @property
+    def db_seconds(self):
+        return sum(seconds for _, seconds in self.queries)
+
+    def server_timing(self, total):
+        """Server-Timing header value, durations in milliseconds"""
+        parts = [
+            f'db;desc="{len(self.queries)} queries";dur={self.db_seconds * 1000:.2f}'
+        ]
+        for name in ("cache", "serialize"):
+            if name in self.phases:
+                parts.append(f"{name};dur={self.phases[name] * 1000:.2f}")
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+    def report(self, total):
+        """Multi-line log entry listing every statement with its duration"""
+        lines = [
+            f"Slow request {request.method} {request.full_path.rstrip('?')}: "
+            f"{total * 1000:.1f} ms, {len(self.queries)} queries, "
+            f"{self.db_seconds * 1000:.1f} ms in db"
+        ]
+        for statement, seconds in self.queries:
+            lines.append(f"  {seconds * 1000:8.2f} ms  {' '.join(statement.split())}")
+        return "\n".join(lines)
+
+
+def trace_statement(statement):
+    """sqlite3 trace callback; statements outside a request are ignored"""
+    profile = _current.get()
+    if profile is not None:
+        profile.trace(statement)
+
+
+def traced_connection(base):
+    """sqlite3.Connection subclass that settles traced statements per call
+
+    Pair it with conn.set_trace_callback(trace_statement).
+    """
+
+    class TracedConnection(base):
+        def execute(self, *args):
+            try:
+                return super().execute(*args)
+            finally:
+                _settle()
+
+        def executemany(self, *args):
+            try:
+                return super().executemany(*args)
+            finally:
+                _settle()
+
+        def commit(self):
+            try:
+                return super().commit()
+            finally:
+                _settle()
+
+    return TracedConnection
+
+
+def _settle():
+    profile = _current.get()
+    if profile is not None:
+        profile.settle()
+
+
+def timed_phase(name, func):
+    """Wrap func so its time counts towards the named Server-Timing phase"""
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        profile = _current.get()
+        if profile is None:
+            return func(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.add_phase(name, time.perf_counter() - started)
+
+    return wrapper
+
+
+class ProfiledJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that times serialization as the serialize phase"""
+
+    def dumps(self, obj, **kwargs):
+        return timed_phase("serialize", super().dumps)(obj, **kwargs)
+
+
+def listen_sqlalchemy(engine):
+    """Time every statement an SQLAlchemy engine (or the Engine class) runs"""
+    from sqlalchemy import event
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        if context is not None:
+            context.request_profile_started = time.perf_counter()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        profile = _current.get()
+        started = getattr(context, "request_profile_started", None)
+        if profile is not None and started is not None:
+            profile.add_query(statement, time.perf_counter() - started)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+
+def profile_requests(app, slow_ms=SLOW_REQUEST_MS, log=print):
+    """Profile every request app handles
+
+    Adds the Server-Timing header and passes the report of requests taking
+    at least slow_ms to log.
+    """
+    app.json = ProfiledJSONProvider(app)
+
+    @app.before_request
+    def start_profile():
+        _current.set(RequestProfile())
+
+    @app.after_request
+    def add_server_timing(response):
+        profile = _current.get()
+        if profile is None:
+            return response
+        profile.settle()
+        total = time.perf_counter() - profile.started
+        response.headers["Server-Timing"] = profile.server_timing(total)
+        if total * 1000 >= slow_ms:
+            log(profile.report(total))
+        return response
+
+    @app.teardown_request
+    def end_profile(exception):
+        _current.set(None)
@@ -0,0 +1,114 @@
+"""
+Statistical CPU profiler for Radio Calico
+
+A sampler reads the Python stacks of other threads in the process at a
+fixed interval and counts identical stacks. A gthread worker holds hundreds
+of threads that mostly sit waiting, so the app registers the threads that
+are handling a request in an ActiveThreads set and only those are walked;
+stacks parked in a known wait are dropped and deep stacks are cut short.
+Nothing else is hooked into the code being profiled, so the overhead is
+the sampler thread itself, and only while it runs. Results come out in the
+collapsed-stack format that flamegraph.pl, speedscope and inferno read: one
+line per stack, frames joined by semicolons, followed by the number of
+samples.
+"""
+
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+SAMPLE_INTERVAL = 0.01  # seconds between samples, i.e. 100 Hz
+MAX_SECONDS = 60
+MAX_DEPTH = 64  # innermost frames kept per stack
+
+# Innermost frames of a thread parked until there is work for it
+IDLE_FRAMES = frozenset(
+    {
+        ("threading.py", "wait"),
+        ("selectors.py", "select"),
+        ("queue.py", "get"),
+        ("socket.py", "accept"),
+    }
+)
+
+
+class ActiveThreads:
+    """Idents of the threads currently doing work worth sampling"""
+
+    def __init__(self):
+        self._idents = set()
+
+    def enter(self):
+        self._idents.add(threading.get_ident())
+
+    def exit(self):
+        self._idents.discard(threading.get_ident())
+
+    def snapshot(self):
+        # set.copy runs under the GIL, so it never sees a resize mid-way
+        return self._idents.copy()
+
+
+def thread_label(name):
+    """Thread name without its counter, so pool threads fold together"""
+    return re.sub(r"[-_\d]+$", "", name or "") or "thread"
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def is_idle(frame):
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES
+
+
+def collapse(frame, root, max_depth=MAX_DEPTH):
+    """Semicolon-joined stack from root (the thread) down to frame
+
+    Only the innermost max_depth frames are kept; "..." marks the cut.
+    """
+    labels = []
+    while frame is not None and len(labels) < max_depth:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    if frame is not None:
+        labels.append("...")
+    labels.append(root)
+    return ";".join(reversed(labels))
+
+
+def sample_stacks(seconds, interval=SAMPLE_INTERVAL, active=None, max_depth=MAX_DEPTH):
+    """Sample other threads for seconds; return (stack counts, samples)
+
+    With active, an ActiveThreads, only the threads in it at each sample are
+    walked; otherwise every thread is. Idle stacks are skipped either way.
+    """
+    own = threading.get_ident()
+    stacks = Counter()
+    samples = 0
+    names = {}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frames = sys._current_frames()
+        idents = frames.keys() if active is None else active.snapshot()
+        for ident in idents:
+            frame = frames.get(ident)
+            if ident == own or frame is None or is_idle(frame):
+                continue
+            if ident not in names:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                names.setdefault(ident, None)
+            stacks[collapse(frame, thread_label(names.get(ident)), max_depth)] += 1
+        samples += 1
+        time.sleep(interval)
+    return stacks, samples
+
+
+def format_collapsed(stacks):
+    """Collapsed-stack text, most sampled stacks first"""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
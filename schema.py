@@ -0,0 +1,194 @@
+"""
+SQLite schema and migrations for Radio Calico
+
+Creating tables and indexes and checking for legacy layouts used to run in
+every gunicorn worker on every boot. Now the gunicorn master runs them once
+(see gunicorn.conf.py) and records SCHEMA_VERSION in PRAGMA user_version, a
+field in the database header; workers read that one integer and skip the
+DDL when it matches. This module imports nothing beyond the standard
+library, so the master can use it without loading the app.
+
+PostgreSQL deployments get their schema from init-db.sql instead.
+"""
+
+import hashlib
+import logging
+import sqlite3
+
+# Bump whenever create_schema changes, so existing databases run it again
+SCHEMA_VERSION = 1
+LOCK_TIMEOUT = 30  # seconds to wait for another process's migration
+
+logger = logging.getLogger(__name__)
+
+SONG_RATINGS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS song_ratings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        song_id INTEGER NOT NULL REFERENCES songs(id),
+        user_fingerprint BLOB NOT NULL,
+        rating INTEGER NOT NULL CHECK(rating IN (1, -1)),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(song_id, user_fingerprint)
+    )
+"""
+
+# Columns added to songs after it was first created, for existing databases
+SONGS_ADDED_COLUMNS = (
+    ("ratings_version", "INTEGER NOT NULL DEFAULT 0"),
+    ("title", "TEXT"),
+    ("artist", "TEXT"),
+    ("album", "TEXT"),
+)
+
+
+def fingerprint_to_bytes(fingerprint):
+    """Pack a hex fingerprint into the 16-byte form stored in song_ratings"""
+    try:
+        return bytes.fromhex(fingerprint)[:16].ljust(16, b"\0")
+    except ValueError:
+        # Legacy rows may hold arbitrary text; keep them distinct but fixed-size
+        return hashlib.md5(fingerprint.encode()).digest()
+
+
+def is_postgres(database):
+    return database.startswith("postgresql://")
+
+
+def stored_version(conn):
+    """Schema version recorded in the database header; 0 for a new database"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def create_schema(conn):
+    """Create or migrate every table and index, then record SCHEMA_VERSION
+
+    Idempotent, so it is safe to run against a database of any version.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS songs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            song_key TEXT UNIQUE NOT NULL,
+            ratings_version INTEGER NOT NULL DEFAULT 0,
+            title TEXT,
+            artist TEXT,
+            album TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+    )
+    if isinstance(conn, sqlite3.Connection):
+        add_missing_columns(conn, "songs", SONGS_ADDED_COLUMNS)
+        migrate_legacy_song_ratings(conn)
+    conn.execute(SONG_RATINGS_SCHEMA)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS plays (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            song_id INTEGER NOT NULL REFERENCES songs(id),
+            played_at TIMESTAMP NOT NULL
+        )
+    """
+    )
+
+    # Create indexes for better query performance. Lookups by song are served
+    # by the UNIQUE(song_id, user_fingerprint) index, so no separate one is needed.
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_song_ratings_fingerprint"
+        " ON song_ratings(user_fingerprint)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)")
+
+    if isinstance(conn, sqlite3.Connection):
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.commit()
+
+
+def add_missing_columns(conn, table, columns):
+    """Add any of the (name, definition) columns that table does not have yet"""
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, definition in columns:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+
+def migrate_legacy_song_ratings(conn):
+    """Rewrite a text-keyed song_ratings table onto songs ids and binary fingerprints
+
+    Does not commit: it runs inside create_schema's transaction, so the
+    rewrite lands together with the rest of the schema or not at all.
+    """
+    columns = {
+        row[1]: row[2].upper()
+        for row in conn.execute("PRAGMA table_info(song_ratings)").fetchall()
+    }
+    if columns.get("user_fingerprint") != "TEXT":
+        return
+
+    conn.execute("ALTER TABLE song_ratings RENAME TO song_ratings_legacy")
+    conn.execute(SONG_RATINGS_SCHEMA)
+    conn.execute(
+        "INSERT OR IGNORE INTO songs (song_key)"
+        " SELECT DISTINCT song_id FROM song_ratings_legacy"
+    )
+
+    rows = conn.execute(
+        """
+        SELECT s.id, l.user_fingerprint, l.rating, l.created_at
+        FROM song_ratings_legacy l JOIN songs s ON s.song_key = l.song_id
+        """
+    )
+    while True:
+        batch = rows.fetchmany(1000)
+        if not batch:
+            break
+        conn.executemany(
+            """
+            INSERT OR IGNORE INTO song_ratings
+                (song_id, user_fingerprint, rating, created_at)
+            VALUES (?, ?, ?, ?)
+            """,
+            [
+                (song_ref, fingerprint_to_bytes(fingerprint), rating, created_at)
+                for song_ref, fingerprint, rating, created_at in batch
+            ],
+        )
+
+    conn.execute("DROP TABLE song_ratings_legacy")
+    logger.info("Migrated song_ratings to interned song ids and binary fingerprints")
+
+
+def ensure_schema(database):
+    """Bring a SQLite database up to SCHEMA_VERSION; True if anything ran
+
+    An up-to-date database costs one PRAGMA read. Otherwise the first
+    process to take the write lock migrates and any others waiting on it
+    find the version already current.
+    """
+    if is_postgres(database):
+        return False
+    conn = sqlite3.connect(database, timeout=LOCK_TIMEOUT)
+    try:
+        if stored_version(conn) == SCHEMA_VERSION:
+            return False
+        # Persistent, and cannot be switched inside the transaction below
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("BEGIN IMMEDIATE")
+        if stored_version(conn) == SCHEMA_VERSION:
+            conn.rollback()
+            return False
+        create_schema(conn)
+        logger.info("Database schema at version %d: %s", SCHEMA_VERSION, database)
+        return True
+    finally:
+        conn.close()
@@ -50,6 +50,10 @@ log "Project root: $PROJECT_ROOT"
 log "Stopping existing containers..."
 docker-compose --profile prod down --remove-orphans || true
 
+# Drop the shared static volume so nginx gets the assets from the new image
+log "Removing stale static asset volume..."
+docker volume rm "${COMPOSE_PROJECT_NAME:-$(basename "$PROJECT_ROOT")}_static-assets" 2>/dev/null || true
+
 # Remove old images (optional - uncomment if you want to rebuild from scratch)
 # log "Removing old images..."
 # docker-compose --profile prod down --rmi all || true
@@ -0,0 +1,111 @@
+"""
+Server-Sent Events building blocks for Radio Calico
+
+A Broadcast holds only the latest value and a version number, so a
+subscriber costs one blocked thread and the version it last saw, no matter
+how far behind it falls. Published values carry a pre-encoded event, so
+each change is serialized once rather than once per subscriber.
+"""
+
+import threading
+import time
+
+KEEPALIVE_INTERVAL = 15  # seconds; keeps proxies from closing idle streams
+STREAM_MAX_SECONDS = 300  # streams end so EventSource reconnects and rebalances
+RECONNECT_DELAY_MS = 3000
+MAX_SUBSCRIBERS = 200  # per worker, across every stream
+
+
+class Broadcast:
+    """Latest-value channel; subscribers that fall behind skip to the newest"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._version = 0
+        self._value = None
+
+    def publish(self, value):
+        with self._condition:
+            self._version += 1
+            self._value = value
+            self._condition.notify_all()
+
+    @property
+    def latest(self):
+        """(version, value) of the newest publication"""
+        with self._condition:
+            return self._version, self._value
+
+    def wait(self, seen_version, timeout):
+        """Block until a version newer than seen_version, or None on timeout"""
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: self._version != seen_version, timeout
+            ):
+                return None
+            return self._version, self._value
+
+
+class SubscriberLimit:
+    """Per-worker cap on open streams, so they cannot take every thread"""
+
+    def __init__(self, max_subscribers=MAX_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self._count = 0
+        self._lock = threading.Lock()
+
+    @property
+    def count(self):
+        return self._count
+
+    def try_acquire(self):
+        """Reserve a slot; False when this worker is full"""
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                return False
+            self._count += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._count -= 1
+
+
+def sse_event(event, data, event_id=None):
+    """Encode one Server-Sent Event"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in data.splitlines() or [""])
+    return ("\n".join(lines) + "\n\n").encode()
+
+
+def stream_events(
+    broadcast,
+    last_event_id=None,
+    keepalive=KEEPALIVE_INTERVAL,
+    max_seconds=STREAM_MAX_SECONDS,
+):
+    """SSE body following a Broadcast whose values have .id and .event
+
+    Sends the current value first unless the client reconnected with it as
+    Last-Event-ID, then each newer value, with comment lines while idle.
+    """
+    yield f"retry: {RECONNECT_DELAY_MS}\n\n".encode()
+
+    version, value = broadcast.latest
+    if value is not None and value.id != last_event_id:
+        yield value.event
+
+    deadline = time.monotonic() + max_seconds
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        changed = broadcast.wait(version, min(keepalive, remaining))
+        if changed is None:
+            yield b": keepalive\n\n"
+            continue
+        version, value = changed
+        yield value.event
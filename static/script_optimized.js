@@ -27,7 +27,11 @@ const elements = {
 const config = {
     streamUrl: 'https://d3d4yli4hf5bmh.cloudfront.net/hls/live.m3u8',
     metadataUrl: 'https://d3d4yli4hf5bmh.cloudfront.net/metadatav2.json',
-    metadataInterval: 10000, // 10 seconds
+    metadataInterval: 10000, // 10 seconds, only when EventSource is unavailable
+    nowPlayingStreamUrl: '/api/now-playing/stream',
+    bootstrapUrl: '/api/bootstrap',
+    heartbeatUrl: '/api/heartbeat',
+    heartbeatInterval: 30000, // 30 seconds, so every minute counts each listener
     retryDelay: 5000 // 5 seconds
 };
 
@@ -35,6 +39,9 @@ const config = {
 const state = {
     hls: null,
     metadataUpdateInterval: null,
+    heartbeatInterval: null,
+    nowPlayingStream: null,
+    ratingsStream: null,
     currentSongId: null,
     isPlaying: false,
     lastMetadataFetch: 0,
@@ -159,27 +166,7 @@ async function fetchMetadata() {
             throw new Error(`HTTP ${response.status}`);
         }
 
-        const data = await response.json();
-        
-        // Cache the metadata briefly to avoid redundant processing
-        const cacheKey = JSON.stringify(data);
-        if (state.metadataCache.has(cacheKey)) {
-            return;
-        }
-        
-        state.metadataCache.set(cacheKey, data);
-        // Clear old cache entries (keep only last 3)
-        if (state.metadataCache.size > 3) {
-            const firstKey = state.metadataCache.keys().next().value;
-            state.metadataCache.delete(firstKey);
-        }
-
-        // Process metadata in idle callback
-        scheduleWork(() => {
-            updateNowPlaying(data);
-            updateRecentlyPlayed(parsePreviousTracks(data));
-            updateStreamQuality(data);
-        });
+        applyMetadata(await response.json());
 
     } catch (error) {
         console.warn('Metadata fetch failed:', error);
@@ -189,6 +176,64 @@ async function fetchMetadata() {
     }
 }
 
+// First paint: metadata, ratings and album art in one request
+async function fetchBootstrap() {
+    try {
+        const response = await fetch(config.bootstrapUrl);
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        const data = await response.json();
+
+        // Points at the local HLS relay when the server runs one
+        if (data.stream_url && !state.hls) {
+            config.streamUrl = data.stream_url;
+        }
+
+        // Ratings arrive with the metadata, so skip the separate request
+        state.currentSongId = data.song_id;
+        updateRatingDisplay(data.ratings);
+        if (window.EventSource) {
+            openRatingsStream(data.song_id);
+        }
+        applyMetadata(data.metadata, data.album_art.url);
+    } catch (error) {
+        console.warn('Bootstrap failed, fetching metadata directly:', error);
+        fetchMetadata();
+    }
+}
+
+function applyMetadata(data, albumArtUrl) {
+    // Cache the metadata briefly to avoid redundant processing
+    const cacheKey = JSON.stringify(data);
+    if (state.metadataCache.has(cacheKey)) {
+        return;
+    }
+    
+    state.metadataCache.set(cacheKey, data);
+    // Clear old cache entries (keep only last 3)
+    if (state.metadataCache.size > 3) {
+        const firstKey = state.metadataCache.keys().next().value;
+        state.metadataCache.delete(firstKey);
+    }
+
+    // Process metadata in idle callback
+    scheduleWork(() => {
+        updateNowPlaying(data, albumArtUrl);
+        updateRecentlyPlayed(parsePreviousTracks(data));
+        updateStreamQuality(data);
+    });
+}
+
+// Track changes are pushed by the server; EventSource reconnects by itself
+function openNowPlayingStream() {
+    const source = new EventSource(config.nowPlayingStreamUrl);
+    source.addEventListener('now-playing', (event) => {
+        applyMetadata(JSON.parse(event.data).metadata);
+    });
+    state.nowPlayingStream = source;
+}
+
 // Optimized DOM updates with DocumentFragment for multiple elements
 function updateRecentlyPlayed(tracks) {
     const fragment = document.createDocumentFragment();
@@ -214,7 +259,7 @@ function updateRecentlyPlayed(tracks) {
     elements.recentTracks.appendChild(fragment);
 }
 
-function updateNowPlaying(data) {
+function updateNowPlaying(data, albumArtUrl) {
     // Batch DOM updates
     elements.currentTitle.textContent = data.title || 'Unknown Title';
     elements.currentArtist.textContent = data.artist || 'Unknown Artist';
@@ -229,9 +274,9 @@ function updateNowPlaying(data) {
         elements.yearBanner.style.display = 'none';
     }
     
-    // Use direct CloudFront URL for album art
+    // Use direct CloudFront URL for album art unless the server named one
     const timestamp = Date.now();
-    elements.albumArt.src = `https://d3d4yli4hf5bmh.cloudfront.net/cover.jpg?t=${timestamp}`;
+    elements.albumArt.src = albumArtUrl || `https://d3d4yli4hf5bmh.cloudfront.net/cover.jpg?t=${timestamp}`;
     
     // Handle song change for ratings
     const newSongId = generateSongId(data);
@@ -239,6 +284,29 @@ function updateNowPlaying(data) {
         state.currentSongId = newSongId;
         // Load ratings in idle callback to avoid blocking
         scheduleWork(() => loadRatings(state.currentSongId));
+        if (window.EventSource) {
+            openRatingsStream(state.currentSongId);
+        }
+    }
+}
+
+// Live tallies for the current song; the stream only carries counts
+function openRatingsStream(songId) {
+    closeRatingsStream();
+    const source = new EventSource(`/api/ratings/${songId}/stream`);
+    source.addEventListener('tally', (event) => {
+        const data = JSON.parse(event.data);
+        if (data.song_id === state.currentSongId) {
+            updateTally(data);
+        }
+    });
+    state.ratingsStream = source;
+}
+
+function closeRatingsStream() {
+    if (state.ratingsStream) {
+        state.ratingsStream.close();
+        state.ratingsStream = null;
     }
 }
 
@@ -329,13 +397,17 @@ const submitRating = throttle(async (songId, rating) => {
 }, 1000); // Throttle to prevent spam
 
 function updateRatingDisplay(data) {
-    elements.thumbsUpCount.textContent = data.thumbs_up || 0;
-    elements.thumbsDownCount.textContent = data.thumbs_down || 0;
-    
     // Update button states
     elements.thumbsUpBtn.classList.toggle('active-up', data.user_rating === 1);
     elements.thumbsDownBtn.classList.toggle('active-down', data.user_rating === -1);
     
+    updateTally(data);
+}
+
+function updateTally(data) {
+    elements.thumbsUpCount.textContent = data.thumbs_up || 0;
+    elements.thumbsDownCount.textContent = data.thumbs_down || 0;
+    
     const total = (data.thumbs_up || 0) + (data.thumbs_down || 0);
     if (total > 0) {
         elements.ratingStats.textContent = `${total} listener${total === 1 ? '' : 's'} rated this song`;
@@ -357,6 +429,7 @@ const handlePlayPause = async () => {
             elements.playBtn.textContent = '⏸️';
             state.isPlaying = true;
             startMetadataUpdates();
+            startHeartbeat();
             updateStatus('Playing live stream', 'playing');
             
         } else {
@@ -364,6 +437,7 @@ const handlePlayPause = async () => {
             elements.playBtn.textContent = '▶️';
             state.isPlaying = false;
             stopMetadataUpdates();
+            stopHeartbeat();
             updateStatus('Stream paused', '');
         }
     } catch (error) {
@@ -373,17 +447,55 @@ const handlePlayPause = async () => {
 };
 
 function startMetadataUpdates() {
+    if (window.EventSource) {
+        // The stream sends the current track as soon as it connects
+        if (!state.nowPlayingStream) {
+            openNowPlayingStream();
+        }
+        if (state.currentSongId && !state.ratingsStream) {
+            openRatingsStream(state.currentSongId);
+        }
+        return;
+    }
     fetchMetadata(); // Immediate fetch
     state.metadataUpdateInterval = setInterval(fetchMetadata, config.metadataInterval);
 }
 
 function stopMetadataUpdates() {
+    if (state.nowPlayingStream) {
+        state.nowPlayingStream.close();
+        state.nowPlayingStream = null;
+    }
+    closeRatingsStream();
     if (state.metadataUpdateInterval) {
         clearInterval(state.metadataUpdateInterval);
         state.metadataUpdateInterval = null;
     }
 }
 
+// Tells the server this listener is still here, for the listener count
+function sendHeartbeat() {
+    if (navigator.sendBeacon) {
+        navigator.sendBeacon(config.heartbeatUrl);
+    } else {
+        fetch(config.heartbeatUrl, { method: 'POST', keepalive: true }).catch(() => {});
+    }
+}
+
+function startHeartbeat() {
+    if (!state.heartbeatInterval) {
+        sendHeartbeat();
+        state.heartbeatInterval = setInterval(sendHeartbeat, config.heartbeatInterval);
+    }
+}
+
+function stopHeartbeat() {
+    if (state.heartbeatInterval) {
+        clearInterval(state.heartbeatInterval);
+        state.heartbeatInterval = null;
+    }
+}
+
 // Initialize event listeners with passive events where appropriate
 function initializeEventListeners() {
     // Throttled volume control
@@ -430,5 +542,5 @@ if (document.readyState === 'loading') {
 
 // Load initial metadata
 scheduleWork(() => {
-    fetchMetadata();
+    fetchBootstrap();
 });
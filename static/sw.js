@@ -25,6 +25,23 @@ self.addEventListener('install', (event) => {
 self.addEventListener('fetch', (event) => {
   const url = new URL(event.request.url);
   
+  // Votes and heartbeats must reach the server, and the Cache API cannot
+  // store POST responses anyway
+  if (event.request.method !== 'GET') {
+    return;
+  }
+
+  // Event streams never end, so they cannot be cached; let the browser handle them
+  if (url.pathname.endsWith('/stream')) {
+    return;
+  }
+
+  // Describes the current track, so a stale copy would paint the wrong song;
+  // the browser revalidates it with its ETag instead
+  if (url.pathname === '/api/bootstrap') {
+    return;
+  }
+
   // Handle API requests with stale-while-revalidate strategy
   if (url.pathname.startsWith('/api/')) {
     event.respondWith(
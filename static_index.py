@@ -0,0 +1,196 @@
+"""
+In-memory index of static files for Radio Calico
+
+The index is built once at startup and records size, mtime and a content hash
+for every file, so requests are answered with strong ETags, Last-Modified,
+304s and byte ranges without touching the filesystem. Small hot files are
+also kept in memory. A background thread per process rescans the tree every
+rescan_interval seconds, off the request path, and only changed files are
+re-read. A file replaced between scans is still served with its real length.
+"""
+
+import hashlib
+import os
+from dataclasses import dataclass, replace
+from typing import Optional
+
+from werkzeug.wrappers import Response
+from werkzeug.wsgi import wrap_file
+
+from background import BackgroundThread
+
+HOT_FILE_MAX_SIZE = 64 * 1024  # bytes; larger files are streamed from disk
+HOT_CACHE_MAX_BYTES = 8 * 1024 * 1024  # total in-memory budget per index
+RESCAN_INTERVAL = 2.0  # seconds
+
+
+@dataclass(frozen=True)
+class StaticEntry:
+    path: str
+    size: int
+    mtime: float
+    mtime_ns: int
+    etag: str
+    data: Optional[bytes] = None
+
+
+class StaticFileIndex:
+    """Snapshot of a directory tree keyed by '/'-separated relative path"""
+
+    def __init__(
+        self,
+        root,
+        suffixes=None,
+        recursive=True,
+        hot_file_max_size=HOT_FILE_MAX_SIZE,
+        hot_cache_max_bytes=HOT_CACHE_MAX_BYTES,
+        rescan_interval=RESCAN_INTERVAL,
+    ):
+        self.root = root
+        self.suffixes = tuple(suffixes) if suffixes else None
+        self.recursive = recursive
+        self.hot_file_max_size = hot_file_max_size
+        self.hot_cache_max_bytes = hot_cache_max_bytes
+        self.rescan_interval = rescan_interval
+
+        self._entries = {}
+        self._rescanner = BackgroundThread(self._run, "static-rescan")
+        self.scan()
+
+    def _walk(self):
+        """Yield (relative path, absolute path, os.stat_result) per indexed file"""
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            if not self.recursive:
+                dirnames[:] = []
+            for name in filenames:
+                if name.endswith(".tmp"):
+                    continue
+                if self.suffixes and not name.endswith(self.suffixes):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                relpath = os.path.relpath(path, self.root).replace(os.sep, "/")
+                yield relpath, path, stat
+
+    def scan(self):
+        """Rebuild the index, re-reading only files whose size or mtime changed"""
+        previous = self._entries
+        entries = {}
+        hot_bytes = 0
+
+        # Smallest files first so the memory budget covers the most files
+        for relpath, path, stat in sorted(self._walk(), key=lambda f: f[2].st_size):
+            entry = previous.get(relpath)
+            if (
+                entry is None
+                or entry.size != stat.st_size
+                or entry.mtime_ns != stat.st_mtime_ns
+            ):
+                entry = self._load(path, stat)
+                if entry is None:
+                    continue
+
+            keep_in_memory = (
+                entry.size <= self.hot_file_max_size
+                and hot_bytes + entry.size <= self.hot_cache_max_bytes
+            )
+            if keep_in_memory and entry.data is None:
+                entry = self._load(path, stat) or entry
+            elif not keep_in_memory and entry.data is not None:
+                entry = replace(entry, data=None)
+            if entry.data is not None:
+                hot_bytes += entry.size
+            entries[relpath] = entry
+
+        self._entries = entries
+
+    def _load(self, path, stat):
+        """Hash a file, keeping its bytes when it is small enough to be hot"""
+        digest = hashlib.sha256()
+        chunks = []
+        try:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(65536), b""):
+                    digest.update(chunk)
+                    if stat.st_size <= self.hot_file_max_size:
+                        chunks.append(chunk)
+        except OSError:
+            return None
+
+        data = b"".join(chunks) if chunks or stat.st_size == 0 else None
+        return StaticEntry(
+            path=path,
+            size=stat.st_size,
+            mtime=stat.st_mtime,
+            mtime_ns=stat.st_mtime_ns,
+            etag=digest.hexdigest()[:32],
+            data=data,
+        )
+
+    def start(self):
+        if self.rescan_interval:
+            self._rescanner.start()
+
+    def stop(self):
+        self._rescanner.stop()
+
+    def _run(self):
+        while not self._rescanner.stopping.wait(self.rescan_interval):
+            self.scan()
+
+    def get(self, relpath):
+        """Return the entry for a relative path, or None if it is not indexed"""
+        self.start()
+        return self._entries.get(relpath)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def memory_bytes(self):
+        """Bytes of file content currently held in memory"""
+        return sum(len(e.data) for e in self._entries.values() if e.data is not None)
+
+
+def make_entry_response(
+    entry, environ, mimetype, accept_ranges=True, response_class=Response
+):
+    """Build a conditional response for an indexed file
+
+    Answers If-None-Match/If-Modified-Since with 304 and Range with 206 from
+    the index metadata alone; only the body read touches the disk, and not
+    even that for in-memory entries. A file on disk whose size changed since
+    it was indexed is described by fstat of the opened file instead, without
+    an ETag until the next scan hashes it.
+    """
+    etag = entry.etag
+    if entry.data is not None:
+        response = response_class(entry.data, mimetype=mimetype)
+    else:
+        f = open(entry.path, "rb")
+        try:
+            stat = os.fstat(f.fileno())
+        except OSError:
+            f.close()
+            raise
+        if stat.st_size != entry.size:
+            entry = replace(
+                entry,
+                size=stat.st_size,
+                mtime=stat.st_mtime,
+                mtime_ns=stat.st_mtime_ns,
+            )
+            etag = None
+        response = response_class(
+            wrap_file(environ, f), mimetype=mimetype, direct_passthrough=True
+        )
+
+    response.content_length = entry.size
+    response.last_modified = entry.mtime
+    if etag is not None:
+        response.set_etag(etag)
+    return response.make_conditional(
+        environ, accept_ranges=accept_ranges, complete_length=entry.size
+    )
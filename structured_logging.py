@@ -0,0 +1,233 @@
+"""
+Non-blocking structured logging for Radio Calico
+
+Request threads never write to stdout themselves. Log records go onto a
+bounded in-memory queue, and one writer thread per process formats them
+as JSON lines and writes them in batches. When the queue is full, for
+instance because stdout is a slow pipe during a traffic burst, records
+are dropped and counted rather than stalling the worker; the writer
+reports how many were lost once it catches up.
+
+Access logs are written by log_requests(), which samples busy routes
+per route but always logs slow requests and server errors.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+from flask import g, request
+
+from metrics import registry
+
+QUEUE_SIZE = 10000  # records buffered before new ones are dropped
+BATCH_SIZE = 500  # records formatted and written per write() call
+SLOW_REQUEST_MS = 1000.0
+EXIT_FLUSH_SECONDS = 2.0
+
+DROPPED = registry.counter(
+    "radiocalico_log_records_dropped_total",
+    "Log records dropped because the log queue was full",
+)
+
+# Attributes every LogRecord has; anything else was passed in extra=
+STANDARD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with extra= fields at the top level"""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+            + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "pid": record.process,
+        }
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class AsyncLogHandler(logging.Handler):
+    """Queue records for a writer thread; drop them when the queue is full
+
+    Records are queued as they are, so message arguments are formatted by
+    the writer thread rather than the thread that logged them. The writer
+    is started lazily in each process, since threads do not survive fork.
+    """
+
+    def __init__(self, stream=None, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE):
+        super().__init__()
+        self.stream = stream or sys.stdout
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.dropped = 0
+
+        self._queue = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._reported_dropped = 0
+
+    def _ensure_writer(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # A queue inherited across fork may hold a lock the parent's
+            # writer had taken, so each process gets its own
+            self._queue = queue.Queue(self.queue_size)
+            self._pid = os.getpid()
+            self.dropped = self._reported_dropped = 0
+            threading.Thread(
+                target=self._write_loop, name="log-writer", daemon=True
+            ).start()
+            atexit.register(self.flush)
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self._ensure_writer()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            DROPPED.inc()
+
+    def _write_loop(self):
+        records = self._queue
+        while True:
+            batch = [records.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(records.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+            for _ in batch:
+                records.task_done()
+
+    def _write(self, batch):
+        lines = []
+        dropped = self.dropped
+        if dropped > self._reported_dropped:
+            notice = logging.makeLogRecord(
+                {
+                    "name": __name__,
+                    "levelno": logging.WARNING,
+                    "levelname": "WARNING",
+                    "msg": "Dropped %d log records; the log queue was full",
+                    "args": (dropped - self._reported_dropped,),
+                }
+            )
+            batch = [notice] + batch
+            self._reported_dropped = dropped
+        for record in batch:
+            try:
+                lines.append(self.format(record))
+            except Exception:
+                self.handleError(record)
+        try:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+        except Exception:
+            self.handleError(batch[-1])
+
+    def flush(self, timeout=EXIT_FLUSH_SECONDS):
+        """Wait until queued records are written, for at most timeout seconds"""
+        if self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+
+def configure_logging(level=logging.INFO, stream=None, queue_size=QUEUE_SIZE):
+    """Send all logging through one AsyncLogHandler on the root logger"""
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in root.handlers:
+        if isinstance(handler, AsyncLogHandler):
+            return handler
+    handler = AsyncLogHandler(stream, queue_size)
+    handler.setFormatter(JsonFormatter())
+    root.addHandler(handler)
+    return handler
+
+
+def parse_sample_rates(text):
+    """{route: rate} from "route=rate,route=rate" """
+    rates = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        route, _, rate = item.rpartition("=")
+        rates[route] = float(rate)
+    return rates
+
+
+def log_requests(
+    app,
+    logger,
+    default_rate=1.0,
+    route_rates=None,
+    slow_ms=SLOW_REQUEST_MS,
+):
+    """Write an access log entry for a sample of app's requests
+
+    Each route (its URL rule, e.g. /api/ratings/<song_id>) is logged at its
+    rate in route_rates, or default_rate. Requests taking at least slow_ms
+    and server errors are always logged, at WARNING and ERROR.
+    """
+    route_rates = route_rates or {}
+
+    @app.before_request
+    def start_access_log():
+        g.access_log_started = time.perf_counter()
+
+    @app.after_request
+    def write_access_log(response):
+        started = g.pop("access_log_started", None)
+        if started is None:
+            return response
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        rate = route_rates.get(route, default_rate)
+
+        if response.status_code >= 500:
+            level = logging.ERROR
+        elif elapsed_ms >= slow_ms:
+            level = logging.WARNING
+        elif rate >= 1 or random.random() < rate:
+            level = logging.INFO
+        else:
+            return response
+
+        logger.log(
+            level,
+            "%s %s %s",
+            request.method,
+            request.path,
+            response.status_code,
+            extra={
+                "method": request.method,
+                "route": route,
+                "path": request.path,
+                "status": response.status_code,
+                "duration_ms": round(elapsed_ms, 2),
+                "bytes": response.content_length,
+                "remote_addr": request.headers.get("X-Real-IP", request.remote_addr),
+                "slow": elapsed_ms >= slow_ms,
+                "sample_rate": rate,
+            },
+        )
+        return response
@@ -1,5 +1,9 @@
+import hashlib
 import os
 import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 import pytest
 from flask import Flask
@@ -285,3 +289,116 @@ def app_context(test_app):
     """Create an application context."""
     with test_app.app_context():
         yield test_app
+
+
+@pytest.fixture
+def optimized_app(tmp_path, monkeypatch):
+    """Load app_optimized against a fresh temporary SQLite database."""
+    db_path = str(tmp_path / "optimized.db")
+    runtime_dir = str(tmp_path / "runtime")
+    monkeypatch.setenv("DATABASE_PATH", db_path)
+    monkeypatch.setenv("LISTENER_ID_SECRET", "test-listener-secret")
+    # Only read on first import; keeps the module defaults out of the repo
+    monkeypatch.setenv("RUNTIME_DIR", runtime_dir)
+
+    import app_optimized
+    from listener_count import ListenerCounter
+
+    monkeypatch.setattr(app_optimized, "DATABASE", db_path)
+    # Per-worker files such as <pid>.hll and <pid>.json go under tmp_path
+    monkeypatch.setattr(app_optimized, "RUNTIME_DIR", runtime_dir)
+    monkeypatch.setattr(
+        app_optimized.registry, "state_dir", os.path.join(runtime_dir, "metrics")
+    )
+    listener_counter = ListenerCounter(os.path.join(runtime_dir, "listeners"))
+    monkeypatch.setattr(app_optimized, "listener_counter", listener_counter)
+    app_optimized.app.config["TESTING"] = True
+    app_optimized.cache.clear()
+    with app_optimized.app.app_context():
+        app_optimized.init_db()
+
+    yield app_optimized
+    listener_counter.stop()
+
+
+@pytest.fixture
+def optimized_client(optimized_app):
+    """Create a test client for app_optimized."""
+    return optimized_app.app.test_client()
+
+
+class FakeOrigin:
+    """Local stand-in for the CloudFront origin."""
+
+    def __init__(self):
+        self.files = {}
+        self.requests = []
+        self.delay = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def _handler(self):
+        origin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.lstrip("/")
+                origin.requests.append((path, dict(self.headers)))
+                time.sleep(origin.delay)
+
+                if path not in origin.files:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                body = origin.files[path]
+                etag = f'"{hashlib.md5(body).hexdigest()}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "binary/octet-stream")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", "Mon, 06 Jan 2025 12:00:00 GMT")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_HEAD(self):
+                path = self.path.lstrip("/")
+                origin.requests.append((path, dict(self.headers)))
+                self.send_response(200 if path in origin.files else 404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+@pytest.fixture
+def album_art_origin():
+    """Run a local album art origin server for the duration of a test."""
+    yield from run_fake_origin()
+
+
+@pytest.fixture
+def hls_origin():
+    """Run a local HLS origin server for the duration of a test."""
+    yield from run_fake_origin()
+
+
+def run_fake_origin():
+    origin = FakeOrigin()
+    thread = threading.Thread(
+        target=origin.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    )
+    thread.start()
+    yield origin
+    origin.server.shutdown()
+    origin.server.server_close()
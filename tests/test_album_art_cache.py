@@ -0,0 +1,107 @@
+import os
+import threading
+
+import pytest
+import requests
+
+from album_art_cache import AlbumArtCache
+
+
+class TestAlbumArtCache:
+    """Tests for the disk-backed album art cache."""
+
+    def test_hits_are_served_from_disk(self, tmp_path, album_art_origin):
+        """Test a fresh copy is reused without going upstream."""
+        album_art_origin.files["cover.jpg"] = b"jpeg" * 100
+        cache = AlbumArtCache(str(tmp_path), album_art_origin.url)
+
+        first = cache.get("cover.jpg")
+        second = cache.get("cover.jpg")
+
+        assert len(album_art_origin.requests) == 1
+        assert first.etag == second.etag
+        with open(second.path, "rb") as f:
+            assert f.read() == b"jpeg" * 100
+
+    def test_stale_copy_is_revalidated(self, tmp_path, album_art_origin):
+        """Test stale entries send validators and a 304 keeps the body."""
+        album_art_origin.files["cover.jpg"] = b"jpeg" * 100
+        cache = AlbumArtCache(str(tmp_path), album_art_origin.url, fresh_for=0)
+
+        etag = cache.get("cover.jpg").etag
+        entry = cache.get("cover.jpg")
+
+        _, headers = album_art_origin.requests[-1]
+        assert "If-None-Match" in headers
+        assert "If-Modified-Since" in headers
+        assert entry.etag == etag
+
+        album_art_origin.files["cover.jpg"] = b"new cover"
+        entry = cache.get("cover.jpg")
+        assert entry.etag != etag
+        assert entry.size == len(b"new cover")
+        assert len([n for n in os.listdir(tmp_path) if n.endswith(".bin")]) == 1
+
+    def test_concurrent_misses_are_coalesced(self, tmp_path, album_art_origin):
+        """Test simultaneous misses for one file make a single upstream fetch."""
+        album_art_origin.files["cover.jpg"] = b"jpeg" * 100
+        album_art_origin.delay = 0.2
+        cache = AlbumArtCache(str(tmp_path), album_art_origin.url)
+
+        threads = [
+            threading.Thread(target=cache.get, args=("cover.jpg",)) for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(album_art_origin.requests) == 1
+
+    def test_serves_stale_when_origin_fails(self, tmp_path, album_art_origin):
+        """Test an origin error falls back to the cached copy, or raises."""
+        album_art_origin.files["cover.jpg"] = b"jpeg" * 100
+        cache = AlbumArtCache(str(tmp_path), album_art_origin.url, fresh_for=0)
+        etag = cache.get("cover.jpg").etag
+
+        del album_art_origin.files["cover.jpg"]
+        assert cache.get("cover.jpg").etag == etag
+
+        with pytest.raises(requests.HTTPError):
+            cache.get("missing.jpg")
+
+    def test_least_recently_used_files_are_evicted(self, tmp_path, album_art_origin):
+        """Test the cache stays under its byte budget."""
+        cache = AlbumArtCache(str(tmp_path), album_art_origin.url, max_bytes=3000)
+        for name, size in (("a.jpg", 1000), ("b.jpg", 1000), ("c.jpg", 1500)):
+            album_art_origin.files[name] = b"x" * size
+            cache.get(name)
+            os.utime(cache.get(name).path, (0, 0) if name == "a.jpg" else None)
+
+        assert cache.disk_bytes() <= 3000
+        assert not os.path.exists(os.path.join(tmp_path, f"{cache._key('a.jpg')}.json"))
+        assert cache.get("c.jpg").size == 1500
+
+    def test_fill_locks_do_not_grow_with_filenames(self, tmp_path, album_art_origin):
+        """Test misses for many distinct names reuse a fixed set of lock files."""
+        cache = AlbumArtCache(str(tmp_path), album_art_origin.url)
+
+        for i in range(200):
+            with pytest.raises(requests.HTTPError):
+                cache.get(f"missing-{i}.jpg")
+
+        lock_files = [n for n in os.listdir(tmp_path) if n.endswith(".lock")]
+        assert len(lock_files) <= len(cache._fill_locks)
+        assert not [n for n in os.listdir(tmp_path) if n.endswith(".json")]
+
+    def test_opened_session_is_per_process(self, tmp_path, album_art_origin):
+        """Test only a session made in this process is reported."""
+        album_art_origin.files["cover.jpg"] = b"jpeg"
+        cache = AlbumArtCache(str(tmp_path), album_art_origin.url)
+        assert cache.opened_session() is None
+
+        cache.get("cover.jpg")
+        assert cache.opened_session() is cache.session
+
+        cache._session_pid = os.getpid() + 1  # as if inherited across fork
+        assert cache.opened_session() is None
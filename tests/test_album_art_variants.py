@@ -0,0 +1,82 @@
+import io
+import threading
+
+from PIL import Image
+
+from album_art_variants import VariantRenderer, snap_size
+from static_index import StaticFileIndex
+
+
+def write_cover(path, size=(600, 400)):
+    Image.new("RGB", size, (200, 80, 40)).save(path, "JPEG")
+
+
+class TestAlbumArtVariants:
+    """Tests for resized and re-encoded album art."""
+
+    def test_sizes_snap_to_the_variant_ladder(self):
+        """Test arbitrary ?w= values collapse onto a few cached sizes."""
+        assert snap_size("100") == 128
+        assert snap_size("128") == 128
+        assert snap_size("5000") == 1024
+        assert snap_size("0") is None
+        assert snap_size("big") is None
+        assert snap_size(None) is None
+
+    def test_negotiates_only_explicitly_accepted_formats(self):
+        """Test */* does not turn JPEG into WebP but image/webp does."""
+        from werkzeug.datastructures import MIMEAccept
+
+        renderer = VariantRenderer()
+        browser = MIMEAccept([("image/webp", 1), ("*/*", 0.8)])
+        curl = MIMEAccept([("*/*", 1)])
+
+        assert renderer.negotiate(browser, "JPEG") == "WEBP"
+        assert renderer.negotiate(curl, "JPEG") == "JPEG"
+
+    def test_renders_once_and_caches(self, tmp_path):
+        """Test a variant is resized, re-encoded and reused across requests."""
+        write_cover(tmp_path / "cover.jpg")
+        source = StaticFileIndex(str(tmp_path)).get("cover.jpg")
+        renderer = VariantRenderer()
+        renders = []
+        original_render = renderer._render
+
+        def counting_render(*args):
+            renders.append(args)
+            return original_render(*args)
+
+        renderer._render = counting_render
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(renderer.get(source, "WEBP", 128))
+            )
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(renders) == 1
+        assert len({entry.etag for entry in results}) == 1
+        with Image.open(io.BytesIO(results[0].data)) as img:
+            assert img.format == "WEBP"
+            assert img.size == (128, 85)
+
+        assert renderer.get(source, "WEBP", 128) is results[0]
+        assert renderer.get(source, "JPEG", 128).etag != results[0].etag
+
+    def test_variant_cache_is_bounded(self, tmp_path):
+        """Test old variants are evicted once the byte budget is exceeded."""
+        write_cover(tmp_path / "cover.jpg")
+        source = StaticFileIndex(str(tmp_path)).get("cover.jpg")
+        first = VariantRenderer().get(source, "JPEG", 64)
+        renderer = VariantRenderer(max_bytes=first.size * 2)
+
+        for width in (64, 128, 256):
+            renderer.get(source, "JPEG", width)
+
+        assert renderer.memory_bytes() <= first.size * 2
+        assert (source.etag, 64, None, "JPEG") not in renderer._cache
@@ -0,0 +1,900 @@
+import json
+import sqlite3
+import threading
+
+import pytest
+
+
+class TestRatingStorage:
+    """Tests for the compact song_ratings layout in app_optimized."""
+
+    def test_votes_use_interned_song_ids_and_binary_fingerprints(
+        self, optimized_app, optimized_client
+    ):
+        """Test votes are stored against songs.id with 16-byte fingerprints."""
+        response = optimized_client.post(
+            "/api/ratings/compact_song",
+            data=json.dumps({"rating": 1}),
+            content_type="application/json",
+        )
+        assert response.status_code == 200
+        assert json.loads(response.data)["song_id"] == "compact_song"
+
+        conn = sqlite3.connect(optimized_app.DATABASE)
+        song_ref, fingerprint = conn.execute(
+            """
+            SELECT r.song_id, r.user_fingerprint
+            FROM song_ratings r JOIN songs s ON s.id = r.song_id
+            WHERE s.song_key = 'compact_song'
+            """
+        ).fetchone()
+        conn.close()
+
+        assert isinstance(song_ref, int)
+        assert isinstance(fingerprint, bytes)
+        assert len(fingerprint) == 16
+
+    def test_update_reports_existing_vote(self, optimized_client):
+        """Test re-voting updates the row instead of adding a new one."""
+        for rating in (1, -1):
+            response = optimized_client.post(
+                "/api/ratings/revote_song",
+                data=json.dumps({"rating": rating}),
+                content_type="application/json",
+            )
+
+        data = json.loads(response.data)
+        assert data["message"] == "Rating updated successfully"
+        assert data["thumbs_up"] == 0
+        assert data["thumbs_down"] == 1
+
+    def test_cached_tally_does_not_leak_other_listeners_vote(self, optimized_app):
+        """Test the cached tally is combined with each caller's own vote."""
+        optimized_client = optimized_app.app.test_client(use_cookies=False)
+        optimized_client.post(
+            "/api/ratings/shared_song",
+            data=json.dumps({"rating": 1}),
+            headers={"User-Agent": "listener-a"},
+            content_type="application/json",
+        )
+        optimized_client.get(
+            "/api/ratings/shared_song", headers={"User-Agent": "listener-a"}
+        )
+
+        response = optimized_client.get(
+            "/api/ratings/shared_song", headers={"User-Agent": "listener-b"}
+        )
+        data = json.loads(response.data)
+        assert response.headers["X-Cache"] == "HIT"
+        assert data["thumbs_up"] == 1
+        assert data["user_rating"] is None
+
+    def test_legacy_table_is_migrated(self, optimized_app):
+        """Test text-keyed legacy rows are rewritten onto the new layout."""
+        conn = sqlite3.connect(optimized_app.DATABASE)
+        conn.execute("DROP TABLE song_ratings")
+        conn.execute(
+            """
+            CREATE TABLE song_ratings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                song_id TEXT NOT NULL,
+                user_fingerprint TEXT NOT NULL,
+                rating INTEGER NOT NULL CHECK(rating IN (1, -1)),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(song_id, user_fingerprint)
+            )
+            """
+        )
+        conn.execute(
+            "INSERT INTO song_ratings (song_id, user_fingerprint, rating) "
+            "VALUES ('legacy_song', '0123456789abcdef0123456789abcdef', -1)"
+        )
+        conn.commit()
+        conn.close()
+
+        with optimized_app.app.app_context():
+            optimized_app.init_db()
+
+        conn = sqlite3.connect(optimized_app.DATABASE)
+        row = conn.execute(
+            """
+            SELECT s.song_key, r.user_fingerprint, r.rating
+            FROM song_ratings r JOIN songs s ON s.id = r.song_id
+            """
+        ).fetchone()
+        conn.close()
+
+        assert row == (
+            "legacy_song",
+            bytes.fromhex("0123456789abcdef0123456789abcdef"),
+            -1,
+        )
+
+
+class TestListenerIdentity:
+    """Tests for the signed listener-id cookie in app_optimized."""
+
+    def test_cookie_keeps_identity_across_networks(self, optimized_client):
+        """Test a listener keeps their vote after their IP address changes."""
+        first = optimized_client.post(
+            "/api/ratings/roaming_song",
+            data=json.dumps({"rating": 1}),
+            environ_base={"REMOTE_ADDR": "10.0.0.1"},
+            content_type="application/json",
+        )
+        assert "rc_lid=" in first.headers["Set-Cookie"]
+
+        response = optimized_client.get(
+            "/api/ratings/roaming_song", environ_base={"REMOTE_ADDR": "10.9.9.9"}
+        )
+        assert json.loads(response.data)["user_rating"] == 1
+        assert "Set-Cookie" not in response.headers
+
+    def test_cookieless_client_falls_back_to_fingerprint(self, optimized_app):
+        """Test clients that drop cookies are still recognised by fingerprint."""
+        client = optimized_app.app.test_client(use_cookies=False)
+        client.post(
+            "/api/ratings/cookieless_song",
+            data=json.dumps({"rating": -1}),
+            content_type="application/json",
+        )
+
+        response = client.get("/api/ratings/cookieless_song")
+        assert json.loads(response.data)["user_rating"] == -1
+
+    def test_personal_responses_are_never_shared(self, optimized_app):
+        """Test votes and new listener cookies are kept out of shared caches."""
+        client = optimized_app.app.test_client()
+        response = client.get("/api/ratings/private_song")
+        assert response.headers["Cache-Control"] == "private, no-cache"
+        assert "Set-Cookie" in response.headers
+
+        # Public elsewhere, but not on the response that issues the cookie
+        response = optimized_app.app.test_client().post("/api/heartbeat")
+        assert "Set-Cookie" in response.headers
+        assert "public" not in response.headers.get("Cache-Control", "")
+
+
+class TestPrecompressedAssets:
+    """Tests for serving prebuilt .br/.gz variants."""
+
+    def test_serves_best_accepted_variant(self, optimized_app, tmp_path, monkeypatch):
+        """Test the gzip variant is chosen from Accept-Encoding with Vary."""
+        from precompress_assets import precompress_file
+
+        static_dir = tmp_path / "static"
+        static_dir.mkdir()
+        source = static_dir / "player.js"
+        source.write_text("function play() { return 'live'; }\n" * 100)
+        precompress_file(str(source))
+        monkeypatch.setattr(optimized_app.app, "root_path", str(tmp_path))
+        monkeypatch.setattr(
+            optimized_app, "static_indexes", optimized_app.build_static_indexes()
+        )
+        client = optimized_app.app.test_client()
+
+        response = client.get(
+            "/static/player.js", headers={"Accept-Encoding": "gzip"}
+        )
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["Vary"]
+        assert response.mimetype in ("application/javascript", "text/javascript")
+        assert response.data == (static_dir / "player.js.gz").read_bytes()
+
+        response = client.get(
+            "/static/player.js", headers={"Accept-Encoding": "identity"}
+        )
+        assert "Content-Encoding" not in response.headers
+        assert response.data == source.read_bytes()
+
+
+class TestStaticIndex:
+    """Tests for serving static files from the startup index."""
+
+    def test_conditional_and_range_requests(self, optimized_client):
+        """Test strong ETags give 304s and uncompressed types honour Range."""
+        response = optimized_client.get("/static/RadioCalicoLogoTM.png")
+        etag = response.headers["ETag"]
+        assert response.status_code == 200
+        assert not etag.startswith("W/")
+        assert response.headers["Accept-Ranges"] == "bytes"
+        assert "Last-Modified" in response.headers
+
+        response = optimized_client.get(
+            "/static/RadioCalicoLogoTM.png", headers={"If-None-Match": etag}
+        )
+        assert response.status_code == 304
+        assert response.data == b""
+
+        response = optimized_client.get(
+            "/static/RadioCalicoLogoTM.png", headers={"Range": "bytes=0-15"}
+        )
+        assert response.status_code == 206
+        assert len(response.data) == 16
+        assert response.headers["Content-Range"].startswith("bytes 0-15/")
+
+    def test_compressible_types_ignore_range(self, optimized_client):
+        """Test text that Flask-Compress may encode is never sent partially."""
+        response = optimized_client.get(
+            "/static/styles.css",
+            headers={"Range": "bytes=0-15", "Accept-Encoding": "identity"},
+        )
+        assert response.status_code == 200
+        assert "Accept-Ranges" not in response.headers
+
+
+class TestHashedAssets:
+    """Tests for serving the content-hashed asset build."""
+
+    def test_hashed_assets_are_immutable(self, optimized_app, tmp_path, monkeypatch):
+        """Test hashed URLs get a one-year immutable Cache-Control."""
+        from asset_pipeline import build
+
+        static_dir = tmp_path / "static"
+        static_dir.mkdir()
+        (static_dir / "styles.css").write_text("body { margin: 0; }\n")
+        (static_dir / "sw.js").write_text("const CACHE_NAME = 'radio-russell-v1';\n")
+        (tmp_path / "index_optimized.html").write_text(
+            '<link rel="stylesheet" href="static/styles.css">\n'
+        )
+        build(str(static_dir), str(tmp_path))
+
+        monkeypatch.setattr(optimized_app.app, "root_path", str(tmp_path))
+        monkeypatch.setattr(
+            optimized_app, "static_indexes", optimized_app.build_static_indexes()
+        )
+        manifest = optimized_app.load_asset_manifest()
+        monkeypatch.setattr(optimized_app, "asset_manifest", manifest)
+        monkeypatch.setattr(optimized_app, "hashed_assets", set(manifest.values()))
+        client = optimized_app.app.test_client()
+
+        response = client.get(f"/static/{manifest['styles.css']}")
+        assert response.status_code == 200
+        assert response.headers["Cache-Control"] == (
+            "public, max-age=31536000, immutable"
+        )
+
+        page = client.get("/", headers={"Accept-Encoding": "identity"})
+        assert manifest["styles.css"].encode() in page.data
+        # The first visit issues the listener cookie, so it is not shareable
+        assert page.headers["Cache-Control"] == "max-age=0, private"
+        page = client.get("/", headers={"Accept-Encoding": "identity"})
+        assert page.headers["Cache-Control"] == "public, max-age=0"
+
+        worker = client.get("/sw.js")
+        assert worker.status_code == 200
+        assert b"radio-russell-v1" not in worker.data
+
+
+class TestAccelRedirect:
+    """Tests for handing file bodies to nginx via X-Accel-Redirect."""
+
+    NGINX = {"X-Sendfile-Type": "X-Accel-Redirect"}
+
+    def test_static_file_is_offloaded(self, optimized_app, monkeypatch):
+        """Test nginx gets an internal path and the app sends no body."""
+        monkeypatch.setattr(optimized_app, "ACCEL_REDIRECT", True)
+        client = optimized_app.app.test_client()
+
+        response = client.get("/static/styles.css", headers=self.NGINX)
+
+        assert response.status_code == 200
+        assert response.headers["X-Accel-Redirect"] == "/_accel/static/styles.css"
+        assert response.mimetype == "text/css"
+        assert response.data == b""
+        assert "ETag" not in response.headers
+        assert response.headers["Cache-Control"] == "public, max-age=2592000"
+
+    def test_missing_file_is_not_offloaded(self, optimized_app, monkeypatch):
+        """Test unknown files are rejected before reaching nginx."""
+        monkeypatch.setattr(optimized_app, "ACCEL_REDIRECT", True)
+        client = optimized_app.app.test_client()
+
+        response = client.get("/static/missing.js", headers=self.NGINX)
+
+        assert response.status_code == 404
+        assert "X-Accel-Redirect" not in response.headers
+
+    def test_falls_back_without_nginx(self, optimized_app, monkeypatch):
+        """Test direct requests still get the file from Python."""
+        monkeypatch.setattr(optimized_app, "ACCEL_REDIRECT", True)
+        client = optimized_app.app.test_client()
+
+        response = client.get(
+            "/static/styles.css", headers={"Accept-Encoding": "identity"}
+        )
+
+        assert "X-Accel-Redirect" not in response.headers
+        assert len(response.data) > 0
+
+    def test_album_art_is_offloaded(self, optimized_app, monkeypatch):
+        """Test album art is redirected to the nginx cache location."""
+        monkeypatch.setattr(optimized_app, "ACCEL_REDIRECT", True)
+        client = optimized_app.app.test_client()
+
+        response = client.get("/album-art/", headers=self.NGINX)
+        assert response.headers["X-Accel-Redirect"] == "/_accel/album-art/cover.jpg"
+        assert response.mimetype == "image/jpeg"
+
+        response = client.get("/album-art/notes.txt", headers=self.NGINX)
+        assert response.status_code == 404
+
+
+class TestAlbumArt:
+    """Tests for serving album art through the disk cache."""
+
+    def test_album_art_is_cached_with_validators(
+        self, optimized_app, tmp_path, album_art_origin, monkeypatch
+    ):
+        """Test covers come from the cache with the right type and 304s."""
+        from album_art_cache import AlbumArtCache
+
+        album_art_origin.files["cover.jpg"] = b"\xff\xd8jpeg" * 100
+        monkeypatch.setattr(
+            optimized_app,
+            "album_art_cache",
+            AlbumArtCache(str(tmp_path / "album-art"), album_art_origin.url),
+        )
+        client = optimized_app.app.test_client()
+
+        response = client.get("/album-art/")
+        assert response.status_code == 200
+        assert response.mimetype == "image/jpeg"
+        assert response.data == album_art_origin.files["cover.jpg"]
+
+        response = client.get(
+            "/album-art/cover.jpg",
+            headers={"If-None-Match": response.headers["ETag"]},
+        )
+        assert response.status_code == 304
+        assert len(album_art_origin.requests) == 1
+
+    def test_origin_failure_redirects(
+        self, optimized_app, tmp_path, album_art_origin, monkeypatch
+    ):
+        """Test an uncached cover the origin cannot supply falls back to it."""
+        from album_art_cache import AlbumArtCache
+
+        monkeypatch.setattr(optimized_app, "ALBUM_ART_ORIGIN", album_art_origin.url)
+        monkeypatch.setattr(
+            optimized_app,
+            "album_art_cache",
+            AlbumArtCache(str(tmp_path / "album-art"), album_art_origin.url),
+        )
+        client = optimized_app.app.test_client()
+
+        response = client.get("/album-art/missing.jpg")
+        assert response.status_code == 302
+        assert response.headers["Location"] == f"{album_art_origin.url}/missing.jpg"
+
+    def test_resized_webp_variant(
+        self, optimized_app, tmp_path, album_art_origin, monkeypatch
+    ):
+        """Test ?w= and Accept: image/webp produce a smaller WebP cover."""
+        import io
+
+        from PIL import Image
+
+        from album_art_cache import AlbumArtCache
+
+        cover = io.BytesIO()
+        Image.new("RGB", (800, 800), (10, 20, 30)).save(cover, "JPEG")
+        album_art_origin.files["cover.jpg"] = cover.getvalue()
+        monkeypatch.setattr(
+            optimized_app,
+            "album_art_cache",
+            AlbumArtCache(str(tmp_path / "album-art"), album_art_origin.url),
+        )
+        client = optimized_app.app.test_client()
+
+        response = client.get(
+            "/album-art/cover.jpg?w=200", headers={"Accept": "image/webp,*/*"}
+        )
+        assert response.status_code == 200
+        assert response.mimetype == "image/webp"
+        assert "Accept" in response.headers["Vary"]
+        with Image.open(io.BytesIO(response.data)) as img:
+            assert img.size == (256, 256)
+
+        response = client.get("/album-art/cover.jpg", headers={"Accept": "*/*"})
+        assert response.mimetype == "image/jpeg"
+        assert response.data == album_art_origin.files["cover.jpg"]
+
+
+class TestNowPlayingStream:
+    """Tests for the now-playing Server-Sent Events endpoint."""
+
+    def test_stream_sends_current_track(self, optimized_app, tmp_path, monkeypatch):
+        """Test subscribers get the snapshot and release their slot on close."""
+        from now_playing import NowPlayingPoller
+
+        poller = NowPlayingPoller(str(tmp_path), "http://127.0.0.1:9/metadata.json")
+        poller._update({"artist": "A", "title": "B"})
+        monkeypatch.setattr(poller, "start", lambda: None)
+        monkeypatch.setattr(optimized_app, "now_playing", poller)
+        client = optimized_app.app.test_client()
+
+        response = client.get("/api/now-playing/stream", buffered=False)
+        assert response.mimetype == "text/event-stream"
+        assert response.headers["X-Accel-Buffering"] == "no"
+        chunks = iter(response.response)
+        assert next(chunks).startswith(b"retry:")
+        assert next(chunks) == poller.current.event
+        assert optimized_app.stream_slots.count == 1
+
+        response.close()
+        assert optimized_app.stream_slots.count == 0
+
+    def test_full_worker_rejects_subscribers(self, optimized_app, monkeypatch):
+        """Test the per-worker subscriber cap answers 503 with Retry-After."""
+        from sse import SubscriberLimit
+
+        monkeypatch.setattr(optimized_app.now_playing, "start", lambda: None)
+        monkeypatch.setattr(optimized_app, "stream_slots", SubscriberLimit(0))
+
+        client = optimized_app.app.test_client()
+        for url in ("/api/now-playing/stream", "/api/ratings/full_song/stream"):
+            response = client.get(url)
+            assert response.status_code == 503
+            assert response.headers["Retry-After"] == "5"
+
+
+class TestBootstrap:
+    """Tests for the composite first-paint endpoint."""
+
+    @pytest.fixture
+    def playing(self, optimized_app, tmp_path, album_art_origin, monkeypatch):
+        """Serve a fixed track, with its cover from a local origin."""
+        from album_art_cache import AlbumArtCache
+        from now_playing import NowPlayingPoller
+
+        album_art_origin.files["cover.jpg"] = b"\xff\xd8jpeg" * 100
+        monkeypatch.setattr(
+            optimized_app,
+            "album_art_cache",
+            AlbumArtCache(str(tmp_path / "album-art"), album_art_origin.url),
+        )
+        poller = NowPlayingPoller(str(tmp_path))
+        poller._update(
+            {"artist": "A", "title": "B", "prev_artist_1": "C", "prev_title_1": "D"}
+        )
+        monkeypatch.setattr(poller, "start", lambda: None)
+        monkeypatch.setattr(optimized_app, "now_playing", poller)
+        monkeypatch.setattr(optimized_app, "bootstrap_cache", {})
+        return poller
+
+    def test_bootstrap_combines_track_ratings_and_art(
+        self, optimized_app, playing, album_art_origin
+    ):
+        """Test one response carries everything, with art fetched once per track."""
+        voter = optimized_app.app.test_client()
+        voter.post(
+            "/api/ratings/QS1C",
+            data=json.dumps({"rating": -1}),
+            content_type="application/json",
+        )
+
+        response = voter.get("/api/bootstrap")
+        assert response.status_code == 200
+        assert response.headers["Cache-Control"] == "private, no-cache"
+        data = json.loads(response.data)
+        assert data["song_id"] == "QS1C"
+        assert data["metadata"]["title"] == "B"
+        assert data["recently_played"] == [{"artist": "C", "title": "D", "album": ""}]
+        assert data["ratings"]["thumbs_down"] == 1
+        assert data["ratings"]["user_rating"] == -1
+        assert data["album_art"]["url"].startswith("/album-art/cover.jpg?v=")
+        assert data["album_art"]["etag"]
+
+        other = optimized_app.app.test_client().get(
+            "/api/bootstrap", headers={"User-Agent": "someone-else"}
+        )
+        assert json.loads(other.data)["ratings"]["user_rating"] is None
+        assert len(album_art_origin.requests) == 1
+
+        # As returned on a compressed response
+        etag = response.headers["ETag"][:-1] + ':gzip"'
+        response = voter.get("/api/bootstrap", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+    def test_track_change_revalidates_cover(
+        self, optimized_app, playing, album_art_origin
+    ):
+        """Test a new track gets the new cover even while the old one is fresh."""
+        client = optimized_app.app.test_client()
+        first = json.loads(client.get("/api/bootstrap").data)["album_art"]
+
+        album_art_origin.files["cover.jpg"] = b"\xff\xd8other" * 100
+        playing._update({"artist": "A", "title": "E"})
+        second = json.loads(client.get("/api/bootstrap").data)
+
+        assert second["song_id"] == "QS1F"
+        assert second["album_art"]["etag"] != first["etag"]
+        assert len(album_art_origin.requests) == 2
+
+    def test_slow_rebuild_serves_the_previous_track(
+        self, optimized_app, playing, monkeypatch
+    ):
+        """Test a track change is built once while others get the old part."""
+        client = optimized_app.app.test_client()
+        old = json.loads(client.get("/api/bootstrap").data)
+
+        building = threading.Event()
+        release = threading.Event()
+        builds = []
+        build = optimized_app.build_bootstrap_shared
+
+        def slow_build(snapshot):
+            builds.append(snapshot.id)
+            building.set()
+            release.wait(5)
+            return build(snapshot)
+
+        monkeypatch.setattr(optimized_app, "build_bootstrap_shared", slow_build)
+        playing._update({"artist": "A", "title": "E"})
+        results = []
+        builder = threading.Thread(
+            target=lambda: results.append(
+                json.loads(optimized_app.app.test_client().get("/api/bootstrap").data)
+            )
+        )
+        builder.start()
+        try:
+            assert building.wait(5)
+            during = json.loads(client.get("/api/bootstrap").data)
+        finally:
+            release.set()
+            builder.join()
+        after = json.loads(client.get("/api/bootstrap").data)
+
+        assert during["id"] == old["id"]
+        assert during["song_id"] == old["song_id"]
+        assert results[0]["song_id"] == after["song_id"] == "QS1F"
+        assert len(builds) == 1
+
+
+class TestHlsRelayRoute:
+    """Tests for serving the relayed HLS stream."""
+
+    def test_relay_serves_playlists_and_segments(
+        self, optimized_app, hls_origin, monkeypatch
+    ):
+        """Test relayed resources carry types, validators and cache lifetimes."""
+        from hls_relay import HlsRelay
+
+        client = optimized_app.app.test_client()
+        assert client.get("/hls/live.m3u8").status_code == 404
+
+        hls_origin.files["hls/live.m3u8"] = (
+            b"#EXTM3U\n#EXT-X-TARGETDURATION:4\n#EXTINF:4.0,\nsegment7.aac\n"
+        )
+        hls_origin.files["hls/segment7.aac"] = b"aac" * 100
+        relay = HlsRelay(f"{hls_origin.url}/hls/live.m3u8")
+        monkeypatch.setattr(optimized_app, "hls_relay", relay)
+
+        response = client.get("/hls/live.m3u8")
+        assert response.mimetype == "application/vnd.apple.mpegurl"
+        assert response.headers["Cache-Control"] == "public, max-age=2"
+        assert b"/hls/segment7.aac" in response.data
+
+        response = client.get("/hls/segment7.aac")
+        assert response.mimetype == "audio/aac"
+        assert response.data == b"aac" * 100
+        assert "immutable" in response.headers["Cache-Control"]
+        response = client.get(
+            "/hls/segment7.aac", headers={"If-None-Match": response.headers["ETag"]}
+        )
+        assert response.status_code == 304
+
+        # Unlisted query strings are served as the plain resource
+        plain = client.get("/hls/live.m3u8").data
+        assert client.get("/hls/live.m3u8?x=1").data == plain
+        assert list(relay._playlists) == ["live.m3u8"]
+
+        assert optimized_app.stream_url() == "/hls/live.m3u8"
+
+
+class TestListeners:
+    """Tests for heartbeats and the listener count endpoint."""
+
+    def test_heartbeats_are_counted_per_listener(self, optimized_app):
+        """Test repeated heartbeats from one listener count once."""
+        for user_agent in ("a", "a", "b"):
+            response = optimized_app.app.test_client().post(
+                "/api/heartbeat", headers={"User-Agent": user_agent}
+            )
+            assert response.status_code == 204
+
+        response = optimized_app.app.test_client().get("/api/listeners")
+        data = json.loads(response.data)
+        assert data["current"] == 2
+        assert data["peak"] == 2
+        assert data["peak_at"].endswith("Z")
+
+
+class TestHistory:
+    """Tests for the play history store and /api/history."""
+
+    def test_history_is_served_from_memory(
+        self, optimized_app, tmp_path, monkeypatch
+    ):
+        """Test the leader stores plays and reads stay off the database."""
+        import threading
+
+        from now_playing import NowPlayingPoller
+        from play_history import PlayHistory
+
+        monkeypatch.setattr(optimized_app, "play_history", PlayHistory(size=2))
+        monkeypatch.setattr(optimized_app, "background_db", threading.local())
+        poller = NowPlayingPoller(
+            str(tmp_path), on_change=optimized_app.record_track_change
+        )
+        poller._leader_file = True  # as if this worker held the poller lock
+        monkeypatch.setattr(poller, "start", lambda: None)
+        monkeypatch.setattr(optimized_app, "now_playing", poller)
+
+        for title in ("B", "C", "D"):
+            poller._update({"artist": "A", "title": title, "album": "X"})
+        poller._update({"artist": "A", "title": "D", "album": "X", "bitDepth": 16})
+
+        conn = sqlite3.connect(optimized_app.DATABASE)
+        assert conn.execute("SELECT COUNT(*) FROM plays").fetchone()[0] == 3
+        assert conn.execute(
+            "SELECT title, artist, album FROM songs WHERE song_key = 'QS1E'"
+        ).fetchone() == ("D", "A", "X")
+        conn.close()
+
+        client = optimized_app.app.test_client()
+        response = client.get("/api/history?limit=2")
+        assert response.headers["X-Cache"] == "HIT"
+        plays = json.loads(response.data)["plays"]
+        assert [play["title"] for play in plays] == ["D", "C"]
+        assert plays[0]["played_at"].endswith("Z")
+
+        # Beyond the buffer: warmed once, then read from the database
+        response = client.get("/api/history?limit=5")
+        assert response.headers["X-Cache"] == "MISS"
+        assert [p["title"] for p in json.loads(response.data)["plays"]] == [
+            "D",
+            "C",
+            "B",
+        ]
+
+        assert client.get("/api/history?limit=0").status_code == 400
+        assert client.get("/api/history?limit=x").status_code == 400
+
+
+class TestRatingsStream:
+    """Tests for the live per-song tally stream."""
+
+    def test_votes_reach_subscribers_once_per_tick(
+        self, optimized_app, optimized_client, monkeypatch
+    ):
+        """Test a burst of votes is pushed to the stream as one tally event."""
+        import threading
+
+        from rating_stream import RatingsHub
+
+        hub = RatingsHub(optimized_app.poll_rating_changes)
+        monkeypatch.setattr(hub, "start", lambda: None)
+        monkeypatch.setattr(optimized_app, "ratings_hub", hub)
+        monkeypatch.setattr(optimized_app, "background_db", threading.local())
+
+        response = optimized_client.get("/api/ratings/live_song/stream", buffered=False)
+        assert response.mimetype == "text/event-stream"
+        chunks = iter(response.response)
+        assert next(chunks).startswith(b"retry:")
+        first = next(chunks)
+        assert b"event: tally" in first
+        assert b'"thumbs_up":0' in first
+        assert hub.watched() == 1
+
+        for listener in range(3):
+            optimized_app.app.test_client().post(
+                "/api/ratings/live_song",
+                data=json.dumps({"rating": 1}),
+                content_type="application/json",
+                headers={"User-Agent": f"listener-{listener}"},
+            )
+        hub.refresh()
+        hub.refresh()  # nothing new since the last tick
+
+        update = next(chunks)
+        assert b"id: 3\n" in update
+        assert b'"thumbs_up":3' in update
+        assert hub._channels["live_song"].broadcast.latest[0] == 2
+
+        response.close()
+        assert hub.watched() == 0
+        assert optimized_app.stream_slots.count == 0
+
+
+def metric_value(text, sample):
+    for line in text.splitlines():
+        if line.startswith(sample + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+class TestMetrics:
+    """Tests for the Prometheus /metrics endpoint."""
+
+    def test_requests_and_queries_are_counted(self, optimized_app, optimized_client):
+        """Test a ratings request shows up in the route, cache and DB metrics."""
+        requests_sample = (
+            'radiocalico_http_requests_total{method="GET",'
+            'route="/api/ratings/<song_id>",status="200"}'
+        )
+        before = optimized_client.get("/metrics").get_data(as_text=True)
+
+        optimized_client.get("/api/ratings/metrics-song")
+        optimized_client.get("/api/ratings/metrics-song")
+
+        response = optimized_client.get("/metrics")
+        assert response.content_type.startswith("text/plain; version=0.0.4")
+        after = response.get_data(as_text=True)
+        assert metric_value(after, requests_sample) == (
+            metric_value(before, requests_sample) + 2
+        )
+        hit = 'radiocalico_response_cache_lookups_total{result="hit"}'
+        assert metric_value(after, hit) >= metric_value(before, hit) + 1
+        queries = "radiocalico_db_query_seconds_count"
+        assert metric_value(after, queries) > metric_value(before, queries)
+        # The scrape itself is the one request in flight
+        assert 'radiocalico_http_requests_in_flight{route="/metrics"} 1' in after
+        assert "# TYPE radiocalico_album_art_upstream_seconds histogram" in after
+
+
+class TestAdminProfile:
+    """Tests for the on-demand CPU profile endpoint."""
+
+    def test_disabled_without_a_token(self, optimized_client):
+        """Test the endpoint does not exist unless ADMIN_TOKEN is set."""
+        response = optimized_client.get("/admin/profile/cpu?seconds=0.1")
+        assert response.status_code == 404
+
+    def test_requires_the_token(self, optimized_app, optimized_client, monkeypatch):
+        """Test a missing or wrong bearer token is refused."""
+        monkeypatch.setattr(optimized_app, "ADMIN_TOKEN", "s3cret")
+        assert optimized_client.get("/admin/profile/cpu").status_code == 401
+        response = optimized_client.get(
+            "/admin/profile/cpu", headers={"Authorization": "Bearer wrong"}
+        )
+        assert response.status_code == 401
+
+    def test_returns_collapsed_stacks(
+        self, optimized_app, optimized_client, monkeypatch
+    ):
+        """Test a short profile comes back as a flamegraph-ready file."""
+        monkeypatch.setattr(optimized_app, "ADMIN_TOKEN", "s3cret")
+        headers = {"Authorization": "Bearer s3cret"}
+
+        response = optimized_client.get(
+            "/admin/profile/cpu?seconds=90", headers=headers
+        )
+        assert response.status_code == 400
+
+        response = optimized_client.get(
+            "/admin/profile/cpu?seconds=0.2&threads=all", headers=headers
+        )
+        assert response.status_code == 200
+        assert response.headers["Content-Disposition"].endswith('.folded"')
+        assert int(response.headers["X-Profile-Samples"]) > 0
+        for line in response.get_data(as_text=True).splitlines():
+            stack, count = line.rsplit(" ", 1)
+            assert ";" in stack and int(count) > 0
+
+
+class TestAdminMemory:
+    """Tests for the tracemalloc admin endpoints."""
+
+    def test_snapshot_and_diff(self, optimized_app, optimized_client, monkeypatch):
+        """Test tracing, two snapshots and their diff over HTTP."""
+        monkeypatch.setattr(optimized_app, "ADMIN_TOKEN", "s3cret")
+        headers = {"Authorization": "Bearer s3cret"}
+        assert optimized_client.get("/admin/memory").status_code == 401
+
+        response = optimized_client.post("/admin/memory/snapshots", headers=headers)
+        assert response.status_code == 400  # not tracing yet
+
+        response = optimized_client.post("/admin/memory/start", headers=headers)
+        assert response.json["tracing"] is True
+        try:
+            first = optimized_client.post(
+                "/admin/memory/snapshots", headers=headers
+            ).json["id"]
+            optimized_client.get("/api/ratings/memory-song")
+            response = optimized_client.post(
+                "/admin/memory/snapshots?group_by=module&limit=5", headers=headers
+            )
+            assert response.status_code == 201
+            second = response.json["id"]
+            assert len(response.json["top"]) <= 5
+
+            response = optimized_client.get(
+                f"/admin/memory/diff?from={first}&to={second}", headers=headers
+            )
+            assert response.status_code == 200
+            assert response.json["pid"] > 0
+            assert {"site", "bytes_diff", "count_diff"} <= set(response.json["top"][0])
+
+            response = optimized_client.get(
+                "/admin/memory/snapshots/999", headers=headers
+            )
+            assert response.status_code == 404
+            response = optimized_client.get(
+                f"/admin/memory/snapshots/{first}?group_by=function", headers=headers
+            )
+            assert response.status_code == 400
+        finally:
+            response = optimized_client.post("/admin/memory/stop", headers=headers)
+        assert response.json["tracing"] is False
+
+
+class TestHealth:
+    """Tests for the cached health endpoints."""
+
+    def test_endpoints_answer_from_background_probes(
+        self, optimized_app, tmp_path, album_art_origin, monkeypatch
+    ):
+        """Test readiness covers every probe and repeated checks reuse it."""
+        from album_art_cache import AlbumArtCache
+        from health import HealthProber
+
+        album_art_origin.files["cover.jpg"] = b"\xff\xd8jpeg"
+        monkeypatch.setattr(
+            optimized_app,
+            "album_art_cache",
+            AlbumArtCache(str(tmp_path / "album-art"), album_art_origin.url),
+        )
+        prober = HealthProber(
+            {
+                "database": optimized_app.probe_database,
+                "caches": optimized_app.probe_caches,
+                "album_art_origin": optimized_app.probe_album_art_origin,
+            },
+            critical=("database", "caches"),
+            details=optimized_app.health_saturation,
+            interval=60,
+        )
+        monkeypatch.setattr(optimized_app, "health_prober", prober)
+        client = optimized_app.app.test_client()
+        try:
+            response = client.get("/health/ready")
+            for _ in range(5):
+                legacy = client.get("/health")
+            live = client.get("/health/live")
+        finally:
+            prober.stop()
+
+        assert response.status_code == 200
+        assert response.mimetype == "application/json"
+        assert response.headers["Cache-Control"] == "no-store"
+        assert response.json["status"] == "healthy"
+        assert set(response.json["checks"]) == {
+            "database",
+            "caches",
+            "album_art_origin",
+        }
+        assert response.json["checks"]["album_art_origin"]["http_status"] == 200
+        saturation = response.json["saturation"]
+        assert saturation["sse_max_subscribers"] == optimized_app.SSE_MAX_SUBSCRIBERS
+        assert "album_art" in saturation["upstream_pools"]
+        assert legacy.data == response.data
+        assert live.json["status"] == "alive"
+        # One probe round served all seven requests
+        assert len(album_art_origin.requests) == 1
+
+    def test_database_probe_drops_a_broken_connection(self, optimized_app, monkeypatch):
+        """Test a failed probe reconnects on the next round."""
+        import threading
+
+        broken = sqlite3.connect(":memory:")
+        broken.close()
+        monkeypatch.setattr(optimized_app, "background_db", threading.local())
+        optimized_app.background_db.conn = broken
+
+        with pytest.raises(sqlite3.ProgrammingError):
+            optimized_app.probe_database()
+        assert optimized_app.background_db.conn is None
+        assert optimized_app.probe_database() == {"type": "sqlite"}
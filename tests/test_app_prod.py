@@ -0,0 +1,86 @@
+import hashlib
+import sqlite3
+
+import pytest
+from sqlalchemy import text
+
+import schema
+
+
+@pytest.fixture(scope="module")
+def prod_app(tmp_path_factory):
+    """Load app_prod against DATABASE_URL, or a temporary SQLite database."""
+    tmp_path = tmp_path_factory.mktemp("prod")
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv("DATABASE_PATH", str(tmp_path / "prod.db"))
+        monkeypatch.setenv("LISTENER_ID_SECRET", "test-listener-secret")
+
+        import app_prod
+
+        yield app_prod
+
+
+def drop_rating_tables(db):
+    db.session.execute(text("DROP TABLE IF EXISTS song_ratings"))
+    db.session.execute(text("DROP TABLE IF EXISTS songs"))
+    db.session.commit()
+
+
+class TestProdSchema:
+    """Tests for the app_prod models and legacy migration."""
+
+    def test_song_model_matches_schema(self, prod_app):
+        """Test Song has the same columns as the songs table in schema.py."""
+        conn = sqlite3.connect(":memory:")
+        schema.create_schema(conn)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(songs)")}
+        conn.close()
+
+        assert set(prod_app.Song.__table__.columns.keys()) == columns
+
+    def test_legacy_ratings_are_migrated(self, prod_app):
+        """Test text-keyed ratings move onto song ids and packed fingerprints.
+
+        Runs against DATABASE_URL when it is set, as in CI, so the
+        PostgreSQL branch is covered there.
+        """
+        db = prod_app.db
+        with prod_app.app.app_context():
+            drop_rating_tables(db)
+            try:
+                db.session.execute(
+                    text(
+                        "CREATE TABLE song_ratings (id INTEGER PRIMARY KEY, "
+                        "song_id VARCHAR(100) NOT NULL, "
+                        "user_fingerprint VARCHAR(32) NOT NULL, "
+                        "rating INTEGER NOT NULL, created_at TIMESTAMP)"
+                    )
+                )
+                db.session.execute(
+                    text(
+                        "INSERT INTO song_ratings (id, song_id, user_fingerprint, "
+                        "rating) VALUES (1, 'song-a', '00ff', 1), "
+                        "(2, 'song-a', 'not hex', -1), (3, 'song-b', '00ff', -1)"
+                    )
+                )
+                db.session.commit()
+                prod_app.Song.__table__.create(db.engine)
+
+                prod_app.migrate_legacy_song_ratings()
+
+                rows = db.session.execute(
+                    text(
+                        "SELECT s.song_key, r.user_fingerprint, r.rating "
+                        "FROM song_ratings r JOIN songs s ON s.id = r.song_id "
+                        "ORDER BY s.song_key, r.rating DESC"
+                    )
+                ).fetchall()
+                packed = b"\x00\xff".ljust(16, b"\0")
+                assert [(key, bytes(fp), rating) for key, fp, rating in rows] == [
+                    ("song-a", packed, 1),
+                    ("song-a", hashlib.md5(b"not hex").digest(), -1),
+                    ("song-b", packed, -1),
+                ]
+            finally:
+                db.session.rollback()
+                drop_rating_tables(db)
@@ -0,0 +1,68 @@
+import json
+
+from asset_pipeline import build
+
+
+def make_site(tmp_path):
+    """Create a minimal static tree shaped like the real one."""
+    static_dir = tmp_path / "static"
+    static_dir.mkdir()
+    (static_dir / "styles.css").write_text("body { margin: 0; }\n")
+    (static_dir / "script_optimized.js").write_text("console.log('live');\n")
+    (static_dir / "sw.js").write_text(
+        "const CACHE_NAME = 'radio-russell-v1';\n"
+        "const STATIC_ASSETS = [\n"
+        "  '/',\n"
+        "  '/static/styles.css',\n"
+        "  '/static/script_optimized.js'\n"
+        "];\n"
+    )
+    (tmp_path / "index_optimized.html").write_text(
+        '<link rel="preload" href="static/styles.css" as="style">\n'
+        '<script src="static/script_optimized.js" defer></script>\n'
+    )
+    return static_dir
+
+
+class TestAssetPipeline:
+    """Tests for the content-hashed asset build."""
+
+    def test_writes_hashed_copies_and_manifest(self, tmp_path):
+        """Test every asset gets a hashed copy listed in the manifest."""
+        static_dir = make_site(tmp_path)
+
+        manifest = build(str(static_dir), str(tmp_path))
+
+        assert set(manifest) == {"styles.css", "script_optimized.js"}
+        hashed = manifest["styles.css"]
+        assert hashed.startswith("dist/styles.") and hashed.endswith(".css")
+        assert (static_dir / hashed).read_text() == "body { margin: 0; }\n"
+        assert json.loads((static_dir / "dist" / "manifest.json").read_text()) == (
+            manifest
+        )
+
+    def test_rewrites_page_and_service_worker(self, tmp_path):
+        """Test the page and STATIC_ASSETS point at hashed names."""
+        static_dir = make_site(tmp_path)
+
+        manifest = build(str(static_dir), str(tmp_path))
+
+        page = (static_dir / "dist" / "index_optimized.html").read_text()
+        worker = (static_dir / "dist" / "sw.js").read_text()
+        for name, hashed in manifest.items():
+            assert f"static/{name}" not in page
+            assert f'"static/{hashed}"' in page
+            assert f"'/static/{hashed}'" in worker
+        assert "radio-russell-v1" not in worker
+
+    def test_hash_changes_with_content(self, tmp_path):
+        """Test editing an asset gives it a new URL."""
+        static_dir = make_site(tmp_path)
+        first = build(str(static_dir), str(tmp_path))
+
+        (static_dir / "styles.css").write_text("body { margin: 1px; }\n")
+        second = build(str(static_dir), str(tmp_path))
+
+        assert first["styles.css"] != second["styles.css"]
+        assert first["script_optimized.js"] == second["script_optimized.js"]
+        assert not (static_dir / first["styles.css"]).exists()
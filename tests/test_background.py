@@ -0,0 +1,43 @@
+import threading
+
+from background import BackgroundThread
+
+
+class TestBackgroundThread:
+    """Tests for the once-per-process background thread helper."""
+
+    def test_starts_once_and_restarts_after_stop(self):
+        """Test repeated start() calls share one thread until it is stopped."""
+        runs = []
+        resets = []
+
+        def run():
+            runs.append(threading.current_thread().name)
+            background.stopping.wait()
+
+        background = BackgroundThread(
+            run, "test-loop", on_start=lambda: resets.append(1)
+        )
+        try:
+            for _ in range(5):
+                background.start()
+            assert background.running()
+        finally:
+            background.stop()
+        assert not background.running()
+        assert runs == ["test-loop"]
+        assert len(resets) == 1
+
+        background.start()
+        background.stop()
+        assert len(runs) == len(resets) == 2
+
+    def test_a_new_process_gets_its_own_thread(self, monkeypatch):
+        """Test a thread recorded under another pid counts as not running."""
+        background = BackgroundThread(lambda: background.stopping.wait(), "test")
+        try:
+            background.start()
+            monkeypatch.setattr(background, "pid", -1)
+            assert not background.running()
+        finally:
+            background.stop()
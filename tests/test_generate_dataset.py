@@ -0,0 +1,68 @@
+import sqlite3
+
+
+class TestGenerateDataset:
+    """Tests for the synthetic scale-test dataset generator."""
+
+    def test_generated_sqlite_dataset_is_served_by_the_app(
+        self, optimized_app, tmp_path, monkeypatch
+    ):
+        """Test a small dataset loads skewed, valid rows the app can read."""
+        from benchmarks.generate_dataset import generate
+
+        path = str(tmp_path / "scale.db")
+        report = generate(
+            path, songs=200, ratings=20000, listeners=20000, users=50, seed=7
+        )
+
+        assert report["tables"]["songs"]["rows"] == 200
+        assert report["tables"]["users"]["rows"] == 50
+        loaded = report["tables"]["song_ratings"]["rows"]
+        assert loaded == 20000
+        assert report["popularity"]["top_1pct_songs_vote_share"] > 0.2
+
+        conn = sqlite3.connect(path)
+        song_key, version = conn.execute(
+            "SELECT song_key, ratings_version FROM songs WHERE id = 1"
+        ).fetchone()
+        per_song = [
+            count
+            for (count,) in conn.execute(
+                "SELECT COUNT(*) FROM song_ratings GROUP BY song_id ORDER BY song_id"
+            )
+        ]
+        distinct, busiest = conn.execute("""
+            SELECT COUNT(*), MAX(votes) FROM (
+                SELECT COUNT(*) AS votes FROM song_ratings GROUP BY user_fingerprint
+            )
+            """).fetchone()
+        assert conn.execute(
+            "SELECT COUNT(*) FROM song_ratings WHERE length(user_fingerprint) != 16"
+        ).fetchone() == (0,)
+        indexes = {
+            name
+            for (name,) in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index'"
+            )
+        }
+        conn.close()
+
+        # The most popular song gets the most votes, and a few listeners
+        # account for far more votes than the typical one
+        assert per_song[0] == max(per_song) == version
+        assert distinct < 20000
+        assert busiest > 5 * loaded / distinct
+        assert "idx_song_ratings_fingerprint" in indexes
+
+        monkeypatch.setattr(optimized_app, "DATABASE", path)
+        response = optimized_app.app.test_client().get(f"/api/ratings/{song_key}")
+        tally = response.json
+        assert tally["thumbs_up"] + tally["thumbs_down"] == per_song[0]
+
+    def test_copy_stream_escapes_rows_for_postgres(self):
+        """Test rows are encoded in COPY text format, bytea as hex."""
+        from benchmarks.generate_dataset import CopyStream
+
+        stream = CopyStream(iter([(1, b"\x01\xff", "tab\there"), (2, b"", "x\\y")]))
+        assert stream.read() == b"1\t\\\\x01ff\ttab\\there\n2\t\\\\x\tx\\\\y\n"
+        assert stream.count == 2
@@ -0,0 +1,123 @@
+import json
+import threading
+import time
+
+from health import HealthProber
+
+
+def fail():
+    raise ConnectionError("refused")
+
+
+def body(result):
+    code, encoded = result
+    return code, json.loads(encoded)
+
+
+class TestHealthProber:
+    """Tests for cached background health probes."""
+
+    def test_results_are_cached_between_rounds(self):
+        """Test endpoints answer from the last round instead of re-probing."""
+        calls = []
+        prober = HealthProber(
+            {"database": lambda: calls.append(1) or {"type": "sqlite"}},
+            critical=("database",),
+            details=lambda: {"saturation": {"sse_subscribers": 3}},
+            interval=60,
+        )
+        try:
+            code, ready = body(prober.ready())
+            for _ in range(10):
+                prober.ready()
+                prober.live()
+        finally:
+            prober.stop()
+
+        assert len(calls) == 1
+        assert code == 200
+        assert ready["status"] == "healthy"
+        assert ready["checks"]["database"]["ok"] is True
+        assert ready["checks"]["database"]["type"] == "sqlite"
+        assert ready["checks"]["database"]["latency_ms"] >= 0
+        assert ready["saturation"] == {"sse_subscribers": 3}
+        assert body(prober.live())[1]["status"] == "alive"
+
+    def test_non_critical_failure_is_degraded_but_ready(self):
+        """Test only critical probes take the worker out of rotation."""
+        prober = HealthProber(
+            {"database": lambda: None, "album_art_origin": fail},
+            critical=("database",),
+        )
+        prober.probe()
+        code, ready = body(prober.ready())
+        prober.stop()
+        assert code == 200
+        assert ready["status"] == "degraded"
+        assert ready["checks"]["album_art_origin"] == {
+            "ok": False,
+            "error": "refused",
+            "latency_ms": ready["checks"]["album_art_origin"]["latency_ms"],
+            "critical": False,
+        }
+
+        prober = HealthProber({"database": fail}, critical=("database",))
+        prober.probe()
+        code, ready = body(prober.ready())
+        prober.stop()
+        assert code == 503
+        assert ready["status"] == "unhealthy"
+        # A failing dependency does not make the worker itself dead
+        assert prober.live()[0] == 200
+
+    def test_stalled_prober_reports_stale(self, monkeypatch):
+        """Test readiness fails once rounds stop completing, liveness does not."""
+        prober = HealthProber({"database": lambda: None}, interval=0.01, timeout=0)
+        monkeypatch.setattr(prober, "start", lambda: None)
+        monkeypatch.setattr("health.FIRST_ROUND_WAIT", 0)
+
+        code, ready = body(prober.ready())
+        assert code == 503
+        assert ready["status"] == "starting"
+        assert body(prober.live())[1]["status"] == "starting"
+        prober._beat()
+        prober.probe()
+        assert prober.ready()[0] == 200
+        time.sleep(0.05)
+        code, ready = body(prober.ready())
+        assert code == 503
+        assert ready["status"] == "stale"
+        assert prober.live()[0] == 200
+
+        monkeypatch.setattr("health.HEARTBEAT_INTERVAL", 0.01)
+        time.sleep(0.05)
+        code, live = body(prober.live())
+        assert code == 503
+        assert live["status"] == "stale"
+        prober.stop()
+
+    def test_hung_probe_only_fails_its_own_check(self):
+        """Test a probe that never returns times out without stalling others."""
+        release = threading.Event()
+        prober = HealthProber(
+            {"database": release.wait, "caches": lambda: None},
+            critical=("database", "caches"),
+            timeout=0.05,
+        )
+        try:
+            started = time.monotonic()
+            prober.probe()
+            prober.probe()
+            elapsed = time.monotonic() - started
+            code, ready = body(prober.ready())
+            live_code = prober.live()[0]
+        finally:
+            release.set()
+            prober.stop()
+
+        assert elapsed < 1
+        assert code == 503
+        assert ready["checks"]["caches"]["ok"] is True
+        assert ready["checks"]["database"]["ok"] is False
+        assert "earlier round" in ready["checks"]["database"]["error"]
+        assert live_code == 200
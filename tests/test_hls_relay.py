@@ -0,0 +1,138 @@
+import os
+import threading
+from dataclasses import replace
+
+from hls_relay import HlsRelay
+
+MEDIA_PLAYLIST = b"""#EXTM3U
+#EXT-X-TARGETDURATION:6
+#EXT-X-MEDIA-SEQUENCE:1
+#EXT-X-KEY:METHOD=AES-128,URI="keys/k1.key"
+#EXTINF:6.0,
+segment1.ts
+#EXTINF:6.0,
+https://elsewhere.example/segment2.ts
+"""
+
+
+class TestHlsRelay:
+    """Tests for the fetch-once HLS relay."""
+
+    def test_playlist_uris_point_at_the_relay(self, hls_origin):
+        """Test origin URIs are rewritten and foreign ones left alone."""
+        relay = HlsRelay(f"{hls_origin.url}/hls/live.m3u8")
+        body, resources = relay.rewrite_playlist(MEDIA_PLAYLIST, "live.m3u8")
+
+        lines = body.decode().splitlines()
+        assert '#EXT-X-KEY:METHOD=AES-128,URI="/hls/keys/k1.key"' in lines
+        assert "/hls/segment1.ts" in lines
+        assert "https://elsewhere.example/segment2.ts" in lines
+        assert resources == ("segment1.ts",)
+
+        variant = f"{hls_origin.url}/hls/hi/index.m3u8"
+        master = f"#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=1\n{variant}\n"
+        body, _ = relay.rewrite_playlist(master.encode(), "live.m3u8")
+        assert "/hls/hi/index.m3u8" in body.decode().splitlines()
+
+    def test_playlists_refresh_per_ttl_and_prefetch_segments(self, hls_origin):
+        """Test listeners share one playlist fetch and segments arrive early."""
+        hls_origin.files["hls/live.m3u8"] = b"#EXTM3U\n#EXTINF:6.0,\nsegment1.ts\n"
+        hls_origin.files["hls/segment1.ts"] = b"s1" * 1000
+        relay = HlsRelay(f"{hls_origin.url}/hls/live.m3u8", playlist_ttl=60)
+
+        first = relay.get_playlist("live.m3u8")
+        assert relay.get_playlist("live.m3u8") is first
+        assert first.ttl == 60
+        assert first.segments == ("segment1.ts",)
+
+        relay._per_process()[1].shutdown(wait=True)
+        assert relay.get_segment("segment1.ts").data == b"s1" * 1000
+        paths = [path for path, _ in hls_origin.requests]
+        assert paths == ["hls/live.m3u8", "hls/segment1.ts"]
+
+        # Expired: revalidated upstream, and kept when the origin fails
+        relay._playlists["live.m3u8"] = replace(first, ttl=0)
+        assert relay.get_playlist("live.m3u8").entry is first.entry
+        assert "If-None-Match" in hls_origin.requests[-1][1]
+
+        del hls_origin.files["hls/live.m3u8"]
+        relay._playlists["live.m3u8"] = replace(first, ttl=0, upstream_etag=None)
+        assert relay.get_playlist("live.m3u8").entry is first.entry
+
+    def test_only_listed_query_strings_are_kept(self, hls_origin):
+        """Test made-up queries map onto the plain name, origin tokens survive."""
+        hls_origin.files["hls/live.m3u8"] = (
+            b"#EXTM3U\n#EXTINF:6.0,\nsegment1.ts?token=abc\n"
+        )
+        relay = HlsRelay(f"{hls_origin.url}/hls/live.m3u8", playlist_ttl=60)
+
+        assert relay.resolve("live.m3u8", "x=1") == "live.m3u8"
+        relay.get_playlist("live.m3u8")
+        assert relay.resolve("live.m3u8", "x=2") == "live.m3u8"
+        assert relay.resolve("segment1.ts", "token=abc") == "segment1.ts?token=abc"
+        assert relay.resolve("segment1.ts", "junk") == "segment1.ts"
+        assert relay.resolve("segment1.ts") == "segment1.ts"
+
+    def test_playlists_are_bounded(self, hls_origin):
+        """Test the least recently refreshed playlist is dropped past the limit."""
+        for i in range(4):
+            hls_origin.files[f"hls/v{i}.m3u8"] = b"#EXTM3U\n"
+        relay = HlsRelay(f"{hls_origin.url}/hls/v0.m3u8", max_playlists=2)
+
+        for i in range(4):
+            relay.get_playlist(f"v{i}.m3u8")
+
+        assert sorted(relay._playlists) == ["v2.m3u8", "v3.m3u8"]
+
+    def test_opened_session_is_per_process(self, hls_origin):
+        """Test only a session made in this process is reported."""
+        relay = HlsRelay(f"{hls_origin.url}/hls/live.m3u8")
+        assert relay.opened_session() is None
+
+        session, _ = relay._per_process()
+        assert relay.opened_session() is session
+
+        relay._pid = os.getpid() + 1  # as if inherited across fork
+        assert relay.opened_session() is None
+
+    def test_concurrent_listeners_fetch_each_segment_once(self, hls_origin):
+        """Test a burst of requests for a new segment makes one origin fetch."""
+        for number in range(3):
+            hls_origin.files[f"hls/segment{number}.ts"] = bytes([number]) * 100
+        hls_origin.delay = 0.1
+        relay = HlsRelay(f"{hls_origin.url}/hls/live.m3u8", ring_size=2)
+
+        results = []
+        listeners = [
+            threading.Thread(
+                target=lambda: results.append(relay.get_segment("segment0.ts"))
+            )
+            for _ in range(10)
+        ]
+        for listener in listeners:
+            listener.start()
+        for listener in listeners:
+            listener.join()
+        assert len(results) == 10
+        assert len(hls_origin.requests) == 1
+
+        relay.get_segment("segment1.ts")
+        relay.get_segment("segment2.ts")
+        # The ring holds two segments, so the oldest was dropped
+        assert list(relay._segments) == ["segment1.ts", "segment2.ts"]
+        assert relay.memory_bytes() == 200
+
+
+class TestHlsRelayLoad:
+    """Load test for concurrent listeners on one relaying gunicorn worker."""
+
+    def test_listeners_are_served_from_memory(self):
+        """Test many listeners cost one origin fetch per segment."""
+        from benchmarks.hls_relay_listeners import run
+
+        report = run(listeners=20, duration=3, segment_seconds=0.5)
+
+        assert report["errors"] == 0
+        assert report["segment_requests"] >= 20
+        # Each segment is fetched at most once, however many listeners
+        assert report["origin_requests"]["segment"] <= 3 / 0.5 + 2
@@ -0,0 +1,116 @@
+import os
+import threading
+import time
+
+from listener_count import HyperLogLog, ListenerCounter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+class TestHyperLogLog:
+    """Tests for the distinct-count sketch."""
+
+    def test_estimates_are_close_and_merge_like_a_union(self):
+        """Test counts stay within a few percent and merging dedupes."""
+        first, second = HyperLogLog(), HyperLogLog()
+        for i in range(20000):
+            first.add(i.to_bytes(16, "big"))
+        for i in range(10000, 30000):
+            second.add(i.to_bytes(16, "big"))
+
+        assert abs(first.count() - 20000) < 20000 * 0.05
+        first.merge(second)
+        assert abs(first.count() - 30000) < 30000 * 0.05
+        assert len(first.registers) == 4096
+
+    def test_repeated_keys_count_once(self):
+        """Test a listener sending many heartbeats is one listener."""
+        sketch = HyperLogLog()
+        for _ in range(100):
+            sketch.add(b"same-listener")
+        assert sketch.count() == 1
+
+
+class TestListenerCounter:
+    """Tests for per-minute counting merged across workers."""
+
+    def test_workers_merge_through_the_state_directory(self, tmp_path, monkeypatch):
+        """Test two workers' listeners are combined and peak is remembered."""
+        clock = FakeClock()
+        worker_a = ListenerCounter(str(tmp_path), clock=clock)
+        worker_b = ListenerCounter(str(tmp_path), clock=clock)
+        monkeypatch.setattr(worker_b, "_path", lambda pid=None: str(tmp_path / "b.hll"))
+
+        for i in range(300):
+            worker_a.add(f"listener-{i}".encode())
+        for i in range(200, 500):
+            worker_b.add(f"listener-{i}".encode())
+        worker_b.flush()
+
+        stats = worker_a.stats()
+        assert abs(stats["current"] - 500) < 25
+        assert stats["peak"] == stats["current"]
+
+        # An hour later only a few are left, but the peak is still in the window
+        clock.now += 50 * 60
+        for i in range(10):
+            worker_a.add(f"listener-{i}".encode())
+        stats = worker_a.stats()
+        assert stats["current"] == 10
+        assert abs(stats["peak"] - 500) < 25
+
+        clock.now += 20 * 60
+        worker_a.add(b"listener-0")
+        assert worker_a.stats()["peak"] <= 10
+
+    def test_concurrent_stats_calls_are_safe(self, tmp_path):
+        """Test simultaneous cache misses neither raise nor disagree."""
+        clock = FakeClock()
+        counter = ListenerCounter(str(tmp_path), clock=clock)
+        for minute in range(30):
+            clock.now += 60
+            counter.add(f"listener-{minute}".encode())
+
+        errors = []
+        results = []
+
+        def read_stats():
+            try:
+                for _ in range(20):
+                    results.append(counter.stats()["peak"])
+                    counter._final_counts = {}
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=read_stats) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        assert len(set(results)) == 1
+        counter.stats()
+        assert sorted(counter._final_counts)[-1] < counter._minute() - 1
+
+    def test_last_adds_are_flushed_without_further_traffic(self, tmp_path):
+        """Test the flush timer writes adds even when no more arrive."""
+        counter = ListenerCounter(str(tmp_path), flush_interval=0.01)
+        try:
+            counter.add(b"listener-0")
+            deadline = time.monotonic() + 5
+            while not os.path.exists(counter._path()):
+                assert time.monotonic() < deadline
+                time.sleep(0.01)
+        finally:
+            counter.stop()
+
+        other = ListenerCounter(str(tmp_path))
+        other._path = lambda pid=None: str(tmp_path / "other.hll")
+        assert other.stats()["current"] == 1
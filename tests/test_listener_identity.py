@@ -0,0 +1,37 @@
+from listener_identity import (
+    load_secret,
+    sign_listener_id,
+    verify_listener_cookie,
+)
+
+SECRET = b"test-secret"
+LISTENER_ID = bytes(range(16))
+
+
+class TestListenerCookie:
+    """Tests for signed listener-id cookies."""
+
+    def test_round_trip(self):
+        """Test a signed id verifies back to the same bytes."""
+        value = sign_listener_id(SECRET, LISTENER_ID)
+        assert len(value) == 32
+        assert verify_listener_cookie(SECRET, value) == LISTENER_ID
+
+    def test_rejects_tampered_or_foreign_cookies(self):
+        """Test forged, truncated and wrongly keyed cookies are rejected."""
+        value = sign_listener_id(SECRET, LISTENER_ID)
+        forged = sign_listener_id(b"other-secret", LISTENER_ID)
+        flipped = ("B" if value[0] == "A" else "A") + value[1:]
+
+        assert verify_listener_cookie(SECRET, forged) is None
+        assert verify_listener_cookie(SECRET, flipped) is None
+        assert verify_listener_cookie(SECRET, value[:-1]) is None
+        assert verify_listener_cookie(SECRET, None) is None
+        assert verify_listener_cookie(SECRET, "!" * 32) is None
+
+    def test_secret_file_is_shared(self, tmp_path, monkeypatch):
+        """Test workers without a configured secret agree via the secret file."""
+        monkeypatch.delenv("LISTENER_ID_SECRET", raising=False)
+        secret_file = str(tmp_path / ".listener_secret")
+
+        assert load_secret(secret_file) == load_secret(secret_file)
@@ -0,0 +1,34 @@
+class TestLoadTest:
+    """Smoke test for the app variant load test."""
+
+    def test_variants_are_compared_per_endpoint(self):
+        """Test a short run reports every variant and skips what it lacks."""
+        from benchmarks.load_test import run
+
+        report = run(
+            variants=("app", "app_optimized"),
+            scenarios=("rating_reads", "album_art"),
+            clients=4,
+            duration=1,
+            warmup=0,
+            songs=5,
+        )
+
+        runs = {(r["variant"], r["scenario"]): r for r in report["runs"]}
+        assert "skipped" in runs["app", "album_art"]
+        for key in (
+            ("app", "rating_reads"),
+            ("app_optimized", "rating_reads"),
+            ("app_optimized", "album_art"),
+        ):
+            assert runs[key]["errors"] == 0
+            assert runs[key]["requests"] > 0
+            assert set(runs[key]["latency_ms"]) == {"p50", "p95", "p99"}
+        reads = runs["app_optimized", "rating_reads"]["endpoints"]
+        assert reads["GET /api/ratings/<song_id>"]["status_codes"].keys() == {"200"}
+        # Covers come from the disk cache after one fetch per worker
+        assert runs["app_optimized", "album_art"]["origin_requests"] <= 2
+        assert (
+            "rps_ratio"
+            in report["comparison"]["sqlite"]["rating_reads"]["app_optimized"]
+        )
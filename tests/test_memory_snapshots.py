@@ -0,0 +1,56 @@
+import pytest
+
+from memory_snapshots import SnapshotStore
+
+retained = []
+
+
+def leak(count):
+    retained.extend(bytearray(1024) for _ in range(count))
+
+
+@pytest.fixture
+def store():
+    store = SnapshotStore(max_snapshots=2)
+    store.start()
+    yield store
+    store.stop()
+    retained.clear()
+
+
+class TestSnapshotStore:
+    """Tests for tracemalloc snapshots and diffs."""
+
+    def test_diff_points_at_the_growing_line(self, store):
+        """Test the leaking line tops the diff, by line and by module."""
+        first = store.take()
+        leak(2000)
+        second = store.take()
+
+        by_line = store.diff(first, second)["top"][0]
+        assert by_line["site"].endswith("test_memory_snapshots.py:9")
+        assert by_line["bytes_diff"] >= 2000 * 1024
+        assert by_line["count_diff"] >= 2000
+
+        by_module = store.diff(first, second, group_by="module", limit=3)
+        assert by_module["top"][0]["site"].endswith("test_memory_snapshots.py")
+        assert len(by_module["top"]) <= 3
+
+    def test_top_lists_the_largest_sites(self, store):
+        """Test a snapshot's report starts with its biggest allocation site."""
+        leak(1000)
+        report = store.top(store.take(), limit=5)
+        assert report["top"][0]["site"].endswith("test_memory_snapshots.py:9")
+        assert report["total_bytes"] >= report["top"][0]["bytes"]
+
+    def test_only_the_newest_snapshots_are_kept(self, store):
+        """Test old snapshots are dropped and then reported as unknown."""
+        ids = [store.take() for _ in range(3)]
+        assert store.status()["snapshots"] == ids[1:]
+        with pytest.raises(KeyError):
+            store.top(ids[0])
+
+        store.stop()
+        assert store.status()["snapshots"] == []
+        with pytest.raises(RuntimeError):
+            store.take()
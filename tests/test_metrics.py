@@ -0,0 +1,158 @@
+import os
+import subprocess
+import sys
+import threading
+
+from metrics import Registry, _write_samples
+
+
+def make_registry(state_dir=None):
+    registry = Registry()
+    registry.state_dir = state_dir
+    requests = registry.counter("requests_total", "Requests", ("route",))
+    in_flight = registry.gauge("in_flight", "In flight")
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+    return registry, requests, in_flight, latency
+
+
+def exited_pid():
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+class TestRegistry:
+    """Tests for the per-thread metric shards."""
+
+    def test_threads_record_without_sharing_and_sum_on_collect(self):
+        """Test every thread's increments appear in the totals."""
+        registry, requests, _, latency = make_registry()
+
+        def work():
+            for _ in range(1000):
+                requests.inc("/api")
+            latency.observe(0.05)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        totals = registry.collect()
+        assert totals[("requests_total", ("/api",))] == [8000]
+        assert totals[("latency_seconds", ())][-1] == 8
+        # Exited threads were folded into the retired totals
+        assert len(registry._shards) == 0
+
+    def test_live_shards_are_bounded_by_running_threads(self):
+        """Test a thread per request does not grow the shard list."""
+        registry, requests, in_flight, _ = make_registry()
+        requests.inc("/api")
+        release = threading.Event()
+
+        def handle():
+            in_flight.inc()
+            requests.inc("/api")
+            in_flight.dec()
+
+        def wait():
+            requests.inc("/api")
+            release.wait(5)
+
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        for _ in range(200):
+            thread = threading.Thread(target=handle)
+            thread.start()
+            thread.join()
+
+        try:
+            assert len(registry._shards) == 2
+            totals = registry.totals()
+            assert totals[("requests_total", ("/api",))] == [202]
+            assert totals[("in_flight", ())] == [0]
+        finally:
+            release.set()
+            waiter.join()
+
+    def test_render_uses_the_prometheus_text_format(self):
+        """Test cumulative buckets, sum, count and escaped labels."""
+        registry, requests, _, latency = make_registry()
+        requests.inc('/say"hi"', amount=2)
+        latency.observe(0.05)
+        latency.observe(0.5)
+        latency.observe(5)
+
+        lines = registry.render().splitlines()
+        assert "# TYPE latency_seconds histogram" in lines
+        assert 'latency_seconds_bucket{le="0.1"} 1' in lines
+        assert 'latency_seconds_bucket{le="1"} 2' in lines
+        assert 'latency_seconds_bucket{le="+Inf"} 3' in lines
+        assert "latency_seconds_sum 5.55" in lines
+        assert "latency_seconds_count 3" in lines
+        assert 'requests_total{route="/say\\"hi\\""} 2' in lines
+
+
+class TestWorkerAggregation:
+    """Tests for merging the per-worker metric files."""
+
+    def test_live_workers_are_summed(self, tmp_path):
+        """Test another worker's counters and gauges add to ours."""
+        registry, requests, in_flight, _ = make_registry(str(tmp_path))
+        requests.inc("/api")
+        in_flight.inc()
+        other = os.getppid()
+        _write_samples(
+            str(tmp_path / f"{other}.json"),
+            {("requests_total", ("/api",)): [4], ("in_flight", ()): [2]},
+        )
+
+        totals = registry.collect()
+        assert totals[("requests_total", ("/api",))] == [5]
+        assert totals[("in_flight", ())] == [3]
+
+    def test_exited_workers_keep_counters_but_not_gauges(self, tmp_path):
+        """Test a dead worker's file is archived once and its gauges dropped."""
+        registry, requests, in_flight, _ = make_registry(str(tmp_path))
+        requests.inc("/api")
+        dead = exited_pid()
+        _write_samples(
+            str(tmp_path / f"{dead}.json"),
+            {("requests_total", ("/api",)): [4], ("in_flight", ()): [2]},
+        )
+
+        for _ in range(2):
+            totals = registry.collect()
+            assert totals[("requests_total", ("/api",))] == [5]
+            assert ("in_flight", ()) not in totals
+        assert not (tmp_path / f"{dead}.json").exists()
+
+    def test_flush_writes_this_workers_totals(self, tmp_path):
+        """Test the file another worker reads matches our totals."""
+        registry, requests, _, _ = make_registry(str(tmp_path))
+        requests.inc("/api", amount=3)
+        registry.flush()
+
+        reader, _, _, _ = make_registry(str(tmp_path))
+        os.rename(tmp_path / f"{os.getpid()}.json", tmp_path / f"{os.getppid()}.json")
+        assert reader.collect()[("requests_total", ("/api",))] == [3]
+
+
+class TestHttpPoolStats:
+    """Tests for reading connection counts off a requests session."""
+
+    def test_counts_connections_and_requests(self, album_art_origin):
+        """Test one pooled connection is counted and reused for every request."""
+        import requests
+
+        from metrics import http_pool_stats
+
+        album_art_origin.files["a.jpg"] = b"a"
+        assert http_pool_stats(None) == (0, 0, 0)
+        with requests.Session() as session:
+            for _ in range(3):
+                session.get(f"{album_art_origin.url}/a.jpg").close()
+            opened, sent, _ = http_pool_stats(session)
+        assert opened == 1
+        assert sent == 3
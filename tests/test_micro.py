@@ -0,0 +1,33 @@
+class TestMicroBenchmarks:
+    """Tests for the micro-benchmark suite's cases and comparison."""
+
+    def test_every_case_runs_and_has_a_committed_baseline(self, optimized_app):
+        """Test the cases still work against the app and none lack a baseline."""
+        from benchmarks import micro
+
+        for name, case in micro.CASES.items():
+            with case(optimized_app) as func:
+                func()
+                func()
+        assert set(micro.load_baselines()["cases"]) == set(micro.CASES)
+
+    def test_comparison_flags_regressions_beyond_tolerance(self):
+        """Test timings are compared relative to the calibration workload."""
+        from benchmarks.micro import compare, results_document
+
+        baseline = results_document({"fast": (100, 1000), "slow": (100, 1000)})
+        # Twice as slow a machine: calibration doubles along with the cases
+        current = results_document(
+            {"fast": (200, 2000), "slow": (400, 2000), "added": (5, 2000)}
+        )
+
+        report = compare(current, baseline, tolerance=0.5)
+        assert report["fast"] == {
+            "ns": 200,
+            "baseline_ns": 200,
+            "ratio": 1.0,
+            "status": "ok",
+        }
+        assert report["slow"]["status"] == "regressed"
+        assert report["slow"]["ratio"] == 2.0
+        assert report["added"]["status"] == "new"
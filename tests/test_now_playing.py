@@ -0,0 +1,92 @@
+import json
+import time
+
+from now_playing import NowPlayingPoller, song_id_for
+from sse import stream_events
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class TestSongId:
+    """Tests for the player-compatible song ids."""
+
+    def test_song_id_matches_player(self):
+        """Test ids match the player's btoa(artist-title) with symbols removed."""
+        assert song_id_for({"artist": "A", "title": "B"}) == "QS1C"
+        assert song_id_for({}) == "VW5rbm93bi1Vbmtub3du"
+
+
+class TestNowPlayingPoller:
+    """Tests for the leader-elected metadata poller."""
+
+    def test_one_leader_polls_and_followers_use_snapshot(
+        self, tmp_path, album_art_origin
+    ):
+        """Test only one poller goes upstream and both publish changes."""
+        album_art_origin.files["metadatav2.json"] = json.dumps(
+            {"artist": "A", "title": "B"}
+        ).encode()
+        url = f"{album_art_origin.url}/metadatav2.json"
+        pollers = [
+            NowPlayingPoller(
+                str(tmp_path), url, poll_interval=0.05, follow_interval=0.02
+            )
+            for _ in range(2)
+        ]
+        try:
+            for poller in pollers:
+                poller.start()
+            assert wait_until(lambda: all(p.current for p in pollers))
+            assert sum(p.is_leader for p in pollers) == 1
+            assert {p.current.song_id for p in pollers} == {"QS1C"}
+
+            album_art_origin.files["metadatav2.json"] = json.dumps(
+                {"artist": "A", "title": "C"}
+            ).encode()
+            assert wait_until(lambda: all(p.current.song_id == "QS1D" for p in pollers))
+            # Unchanged metadata is answered with 304 and not republished
+            assert pollers[0].broadcast.latest[0] == 2
+        finally:
+            for poller in pollers:
+                poller.stop()
+
+        assert "If-None-Match" in album_art_origin.requests[-1][1]
+
+    def test_events_skip_known_version_and_keep_alive(self, tmp_path):
+        """Test reconnects with Last-Event-ID only get newer events."""
+        poller = NowPlayingPoller(str(tmp_path))
+        poller._update({"artist": "A", "title": "B"})
+        snapshot = poller.current
+
+        fresh = stream_events(poller.broadcast, keepalive=0.01, max_seconds=0.05)
+        assert next(fresh).startswith(b"retry:")
+        assert next(fresh) == snapshot.event
+        assert b"event: now-playing" in snapshot.event
+
+        resumed = list(
+            stream_events(
+                poller.broadcast, snapshot.id, keepalive=0.01, max_seconds=0.03
+            )
+        )
+        assert snapshot.event not in resumed
+        assert b": keepalive\n\n" in resumed
+
+
+class TestNowPlayingLoad:
+    """Load test for idle SSE subscribers on one gunicorn worker."""
+
+    def test_idle_subscribers_all_receive_a_change(self):
+        """Test every idle subscriber connects and gets one track change."""
+        from benchmarks.sse_idle_subscribers import run
+
+        report = run(subscribers=50, timeout=15)
+
+        assert report["connected"] == 50
+        assert report["received_change"] == 50
@@ -0,0 +1,32 @@
+from play_history import Play, PlayHistory
+
+
+def play(song_id, minute=0):
+    return Play(
+        song_id, f"Title {song_id}", "Artist", "", f"2026-01-01T00:{minute:02d}:00Z"
+    )
+
+
+class TestPlayHistory:
+    """Tests for the recently played ring buffer."""
+
+    def test_buffer_keeps_newest_and_skips_repeats(self):
+        """Test the buffer is bounded, newest first, and ignores repeats."""
+        history = PlayHistory(size=3)
+        for minute, song_id in enumerate("abbcd"):
+            history.record(play(song_id, minute))
+
+        assert [p.song_id for p in history.recent(3)] == ["d", "c", "b"]
+        # Older plays were evicted, so only the database can answer
+        assert history.recent(4) is None
+
+    def test_warm_merges_stored_plays_behind_recorded_ones(self):
+        """Test stored plays go first and the shared play is not doubled."""
+        history = PlayHistory(size=5)
+        history.record(play("b", 1))
+        history.record(play("c", 2))
+
+        history.warm([play("a", 0), play("b", 1)])
+        assert [p.song_id for p in history.recent(5)] == ["c", "b", "a"]
+        # Fewer stored plays than the buffer holds means this is all of them
+        assert [p.song_id for p in history.recent(50)] == ["c", "b", "a"]
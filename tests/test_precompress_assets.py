@@ -0,0 +1,45 @@
+import gzip
+import os
+
+from precompress_assets import find_assets, precompress_file
+
+
+class TestPrecompressAssets:
+    """Tests for the static asset precompression build step."""
+
+    def test_writes_variants_for_text_assets(self, tmp_path):
+        """Test .gz/.br siblings decode back to the original bytes."""
+        source = tmp_path / "styles.css"
+        source.write_text("body { color: #231F20; }\n" * 200)
+
+        written = precompress_file(str(source))
+
+        assert str(source) + ".gz" in written
+        assert gzip.decompress((tmp_path / "styles.css.gz").read_bytes()) == (
+            source.read_bytes()
+        )
+
+    def test_skips_up_to_date_and_tiny_files(self, tmp_path):
+        """Test rebuilding is incremental and tiny files get no variants."""
+        source = tmp_path / "script.js"
+        source.write_text("console.log('radio');\n" * 100)
+        tiny = tmp_path / "tiny.js"
+        tiny.write_text("1")
+
+        assert precompress_file(str(source))
+        assert precompress_file(str(source)) == []
+        assert precompress_file(str(tiny)) == []
+
+    def test_finds_static_and_root_html(self, tmp_path):
+        """Test asset discovery covers static/ and the root HTML files."""
+        static_dir = tmp_path / "static"
+        static_dir.mkdir()
+        (static_dir / "app.js").write_text("x")
+        (static_dir / "logo.png").write_bytes(b"png")
+        (tmp_path / "index.html").write_text("<html></html>")
+
+        assets = find_assets(str(static_dir), str(tmp_path))
+
+        assert assets == sorted(
+            [os.path.join(str(static_dir), "app.js"), str(tmp_path / "index.html")]
+        )
@@ -0,0 +1,71 @@
+from rating_stream import RatingsHub
+
+
+class FakeRatings:
+    """Stands in for the songs table: a version and tally per song."""
+
+    def __init__(self):
+        self.songs = {}
+        self.polls = []
+
+    def vote(self, song_id, thumbs_up, thumbs_down):
+        version, _ = self.songs.get(song_id, (0, None))
+        self.songs[song_id] = (version + 1, (thumbs_up, thumbs_down))
+
+    def poll_changes(self, known_versions):
+        self.polls.append(dict(known_versions))
+        return {
+            song_id: self.songs[song_id]
+            for song_id, version in known_versions.items()
+            if song_id in self.songs and self.songs[song_id][0] != version
+        }
+
+
+class TestRatingsHub:
+    """Tests for the per-worker tally fan-out."""
+
+    def test_bursts_coalesce_into_one_update_per_tick(self):
+        """Test many votes between ticks publish only the newest tally."""
+        ratings = FakeRatings()
+        hub = RatingsHub(ratings.poll_changes)
+        broadcast = hub.subscribe("song", 0, (0, 0))
+        assert hub.subscribe("song", 0, (0, 0)) is broadcast
+
+        for count in range(1, 6):
+            ratings.vote("song", count, 0)
+        hub.refresh()
+
+        version, update = broadcast.latest
+        assert version == 2
+        assert (update.id, update.thumbs_up) == ("5", 5)
+        # One query covers every watched song per tick
+        assert ratings.polls == [{"song": 0}]
+
+        hub.refresh()
+        assert broadcast.latest[0] == 2
+
+    def test_unchanged_tally_is_not_republished(self):
+        """Test a version bump that leaves the counts alone pushes nothing."""
+        ratings = FakeRatings()
+        hub = RatingsHub(ratings.poll_changes)
+        broadcast = hub.subscribe("song", 0, (1, 0))
+
+        ratings.vote("song", 1, 0)
+        hub.refresh()
+        assert broadcast.latest[0] == 1
+        assert ratings.poll_changes({"song": 1}) == {}
+
+    def test_channels_close_with_their_last_subscriber(self):
+        """Test unwatched songs are no longer polled."""
+        ratings = FakeRatings()
+        hub = RatingsHub(ratings.poll_changes)
+        hub.subscribe("song", 0, (0, 0))
+        hub.subscribe("song", 0, (0, 0))
+
+        hub.unsubscribe("song")
+        assert hub.watched() == 1
+        hub.unsubscribe("song")
+        assert hub.watched() == 0
+
+        hub.refresh()
+        assert ratings.polls == []
@@ -0,0 +1,110 @@
+import re
+import sqlite3
+
+from flask import Flask, jsonify
+
+from request_profile import (
+    listen_sqlalchemy,
+    profile_requests,
+    trace_statement,
+    traced_connection,
+)
+
+
+def profiled_app(run_queries, slow_ms=1e9):
+    app = Flask(__name__)
+    logged = []
+    profile_requests(app, slow_ms, log=logged.append)
+
+    @app.route("/work")
+    def work():
+        return jsonify(run_queries())
+
+    return app, logged
+
+
+def timings(response):
+    header = response.headers["Server-Timing"]
+    return {part.split(";")[0]: part for part in header.split(", ")}
+
+
+class TestSqliteProfiling:
+    """Tests for statements timed through the sqlite3 trace callback."""
+
+    def test_statements_are_counted_in_server_timing(self):
+        """Test implicit BEGIN and COMMIT count alongside explicit queries."""
+        conn = sqlite3.connect(
+            ":memory:", factory=traced_connection(sqlite3.Connection)
+        )
+        conn.set_trace_callback(trace_statement)
+        conn.execute("CREATE TABLE t (n INTEGER)")
+
+        def run_queries():
+            conn.execute("INSERT INTO t VALUES (?)", (1,))
+            conn.commit()
+            return conn.execute("SELECT COUNT(*) FROM t").fetchone()[0]
+
+        app, logged = profiled_app(run_queries)
+        response = app.test_client().get("/work")
+
+        parts = timings(response)
+        assert parts["db"].startswith('db;desc="4 queries";dur=')
+        assert "serialize" in parts
+        assert re.fullmatch(r"total;dur=\d+\.\d\d", parts["total"])
+        assert logged == []
+
+    def test_slow_requests_log_every_statement(self):
+        """Test the slow log lists statements with their bound values."""
+        conn = sqlite3.connect(
+            ":memory:", factory=traced_connection(sqlite3.Connection)
+        )
+        conn.set_trace_callback(trace_statement)
+
+        app, logged = profiled_app(
+            lambda: conn.execute("SELECT ?", ("x",)).fetchone()[0], slow_ms=0
+        )
+        app.test_client().get("/work?a=1")
+
+        (report,) = logged
+        first, statement = report.splitlines()
+        assert first.startswith("Slow request GET /work?a=1: ")
+        assert statement.endswith("ms  SELECT 'x'")
+
+    def test_statements_outside_requests_are_ignored(self):
+        """Test background threads with no request are not profiled."""
+        conn = sqlite3.connect(
+            ":memory:", factory=traced_connection(sqlite3.Connection)
+        )
+        conn.set_trace_callback(trace_statement)
+        assert conn.execute("SELECT 1").fetchone() == (1,)
+
+
+class TestSqlAlchemyProfiling:
+    """Tests for statements timed through SQLAlchemy cursor events."""
+
+    def test_engine_statements_are_counted(self):
+        """Test each statement the engine runs is timed."""
+        from sqlalchemy import create_engine, text
+
+        engine = create_engine("sqlite://")
+        listen_sqlalchemy(engine)
+
+        def run_queries():
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+                return conn.execute(text("SELECT 2")).scalar()
+
+        app, _ = profiled_app(run_queries)
+        response = app.test_client().get("/work")
+        assert response.json == 2
+        assert timings(response)["db"].startswith('db;desc="2 queries"')
+
+
+class TestProfilingDisabled:
+    """Tests for app_optimized with profiling off."""
+
+    def test_no_server_timing_by_default(self, optimized_client):
+        """Test nothing is added when REQUEST_PROFILE is unset."""
+        response = optimized_client.get("/api/ratings/unprofiled")
+        assert response.status_code == 200
+        assert "Server-Timing" not in response.headers
@@ -0,0 +1,110 @@
+import threading
+
+from sampling_profiler import (
+    ActiveThreads,
+    collapse,
+    format_collapsed,
+    sample_stacks,
+    thread_label,
+)
+
+
+def spin_until(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def spin_as_active(active, stop):
+    active.enter()
+    try:
+        spin_until(stop)
+    finally:
+        active.exit()
+
+
+def recurse(depth, stop):
+    if depth:
+        return recurse(depth - 1, stop)
+    spin_until(stop)
+
+
+class TestSamplingProfiler:
+    """Tests for the thread stack sampler."""
+
+    def test_busy_threads_show_up_in_collapsed_stacks(self):
+        """Test a spinning thread's function is sampled under its thread."""
+        stop = threading.Event()
+        busy = threading.Thread(target=spin_until, args=(stop,), name="busy-3")
+        busy.start()
+        try:
+            stacks, samples = sample_stacks(0.3, interval=0.005)
+        finally:
+            stop.set()
+            busy.join()
+
+        assert samples > 10
+        spinning = [s for s in stacks if "spin_until" in s]
+        assert spinning
+        assert all(s.startswith("busy;") for s in spinning)
+        assert all("test_sampling_profiler.py:spin_until" in s for s in spinning)
+        # The sampler never samples its own thread
+        assert not any("sample_stacks" in s for s in stacks)
+
+    def test_only_active_threads_are_sampled(self):
+        """Test idle and unregistered threads are left out of the profile."""
+        active = ActiveThreads()
+        stop = threading.Event()
+        threads = [
+            threading.Thread(target=spin_as_active, args=(active, stop), name="req"),
+            threading.Thread(target=spin_until, args=(stop,), name="background"),
+            threading.Thread(target=stop.wait, name="waiter"),
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            stacks, _ = sample_stacks(0.2, interval=0.005, active=active)
+            everything, _ = sample_stacks(0.2, interval=0.005)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        assert stacks
+        assert all(s.startswith("req;") for s in stacks)
+        assert any(s.startswith("background;") for s in everything)
+        # Parked threads are idle whether or not they are registered
+        assert not any(s.startswith("waiter;") for s in everything)
+        assert not active.snapshot()
+
+    def test_deep_stacks_are_truncated(self):
+        """Test only the innermost frames are kept below a marker."""
+        stop = threading.Event()
+        deep = threading.Thread(target=recurse, args=(200, stop), name="deep")
+        deep.start()
+        try:
+            stacks, _ = sample_stacks(0.1, interval=0.005, max_depth=10)
+        finally:
+            stop.set()
+            deep.join()
+
+        deep_stacks = [s for s in stacks if s.startswith("deep;")]
+        assert deep_stacks
+        for stack in deep_stacks:
+            frames = stack.split(";")
+            assert frames[1] == "..."
+            assert len(frames) == 12
+        assert collapse(None, "t") == "t"
+
+    def test_collapsed_format_is_sorted_by_count(self):
+        """Test each line is a stack and its count, busiest first."""
+        from collections import Counter
+
+        text = format_collapsed(Counter({"t;a:f": 2, "t;a:f;a:g": 5}))
+        assert text == "t;a:f;a:g 5\nt;a:f 2\n"
+
+    def test_pool_thread_names_fold_together(self):
+        """Test numbered pool threads share one root frame."""
+        assert thread_label("ThreadPoolExecutor-0_12") == "ThreadPoolExecutor"
+        assert thread_label("hls-prefetch_3") == "hls-prefetch"
+        assert thread_label("MainThread") == "MainThread"
+        assert thread_label(None) == "thread"
@@ -0,0 +1,56 @@
+import threading
+
+from sse import Broadcast, SubscriberLimit, sse_event, stream_events
+
+
+class TestBroadcast:
+    """Tests for the latest-value broadcast channel."""
+
+    def test_waiters_wake_on_publish_and_time_out(self):
+        """Test subscribers see new versions and skip to the latest."""
+        broadcast = Broadcast()
+        assert broadcast.wait(0, timeout=0.01) is None
+
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(broadcast.wait(0, 5)))
+        waiter.start()
+        broadcast.publish("first")
+        waiter.join()
+        assert results == [(1, "first")]
+
+        broadcast.publish("second")
+        broadcast.publish("third")
+        assert broadcast.wait(1, timeout=0.01) == (3, "third")
+
+
+class TestStreamEvents:
+    """Tests for the SSE encoding and stream body."""
+
+    def test_events_are_encoded_once_and_followed(self):
+        """Test the stream sends the current value, then newer ones."""
+        assert sse_event("tally", '{"a":1}', event_id=7) == (
+            b'id: 7\nevent: tally\ndata: {"a":1}\n\n'
+        )
+
+        class Value:
+            def __init__(self, id):
+                self.id = id
+                self.event = sse_event("test", id, event_id=id)
+
+        broadcast = Broadcast()
+        broadcast.publish(Value("1"))
+        events = stream_events(broadcast, keepalive=5, max_seconds=5)
+        assert next(events).startswith(b"retry:")
+        assert next(events) == b"id: 1\nevent: test\ndata: 1\n\n"
+
+        broadcast.publish(Value("2"))
+        assert next(events) == b"id: 2\nevent: test\ndata: 2\n\n"
+
+    def test_subscriber_limit(self):
+        """Test slots are refused at the cap and reusable after release."""
+        slots = SubscriberLimit(1)
+        assert slots.try_acquire()
+        assert not slots.try_acquire()
+        slots.release()
+        assert slots.try_acquire()
+        assert slots.count == 1
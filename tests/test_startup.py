@@ -0,0 +1,19 @@
+class TestStartupBenchmark:
+    """Smoke test for the worker startup benchmark."""
+
+    def test_startup_is_measured_without_loading_deferred_modules(self):
+        """Test the report covers imports, schema checks and worker boots."""
+        from benchmarks.startup import run
+
+        report = run(workers=1, repeat=1)
+
+        assert report["import"]["deferred_loaded"] == []
+        assert "flask" in report["import"]["top_imports_ms"]
+        assert "psycopg2" not in report["import"]["top_imports_ms"]
+        assert set(report["schema"]) == {"fresh_ms", "check_ms", "full_pass_ms"}
+
+        boot = report["boot"]
+        # The master created the schema before forking the worker
+        assert boot["master_schema"]["action"] == "applied"
+        assert len(boot["worker_boot_ms"]) == 1
+        assert boot["respawn_boot_ms"] > 0
@@ -0,0 +1,99 @@
+import os
+import time
+
+from werkzeug.test import EnvironBuilder
+
+from static_index import StaticFileIndex, make_entry_response
+
+
+class TestStaticFileIndex:
+    """Tests for the startup-built static file index."""
+
+    def test_small_files_are_hot_and_large_files_stream(self, tmp_path):
+        """Test the hot-file size limit and total memory budget."""
+        (tmp_path / "a.css").write_bytes(b"a" * 100)
+        (tmp_path / "b.css").write_bytes(b"b" * 200)
+        (tmp_path / "big.png").write_bytes(b"p" * 5000)
+
+        index = StaticFileIndex(
+            str(tmp_path), hot_file_max_size=1000, hot_cache_max_bytes=150
+        )
+
+        assert index.get("a.css").data == b"a" * 100
+        assert index.get("b.css").data is None
+        assert index.get("big.png").data is None
+        assert index.get("big.png").size == 5000
+        assert index.memory_bytes() == 100
+
+    def test_rescan_picks_up_changes(self, tmp_path):
+        """Test changed files get a new ETag and removed files drop out."""
+        source = tmp_path / "styles.css"
+        source.write_text("body { margin: 0; }")
+        (tmp_path / "sub").mkdir()
+        (tmp_path / "sub" / "old.js").write_text("1")
+
+        index = StaticFileIndex(str(tmp_path), rescan_interval=0)
+        etag = index.get("styles.css").etag
+        assert index.get("sub/old.js") is not None
+
+        source.write_text("body { margin: 1px; }")
+        stat = source.stat()
+        os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        os.remove(tmp_path / "sub" / "old.js")
+        index.scan()
+
+        assert index.get("styles.css").etag != etag
+        assert index.get("styles.css").data == b"body { margin: 1px; }"
+        assert index.get("sub/old.js") is None
+
+    def test_suffix_filter_and_non_recursive(self, tmp_path):
+        """Test the root page index only sees top-level HTML files."""
+        (tmp_path / "index.html").write_text("<html></html>")
+        (tmp_path / "app.py").write_text("secret = 1")
+        (tmp_path / "static").mkdir()
+        (tmp_path / "static" / "nested.html").write_text("<html></html>")
+
+        index = StaticFileIndex(str(tmp_path), suffixes=(".html",), recursive=False)
+
+        assert index.get("index.html") is not None
+        assert index.get("app.py") is None
+        assert index.get("static/nested.html") is None
+        assert len(index) == 1
+
+    def test_background_thread_rescans(self, tmp_path):
+        """Test new files appear without a request having to rescan."""
+        index = StaticFileIndex(str(tmp_path), rescan_interval=0.01)
+        assert index.get("late.css") is None
+        try:
+            (tmp_path / "late.css").write_text("a {}")
+            deadline = time.monotonic() + 5
+            while index.get("late.css") is None and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            index.stop()
+        assert index.get("late.css").data == b"a {}"
+
+    def test_replaced_file_is_served_with_its_real_length(self, tmp_path):
+        """Test a file rewritten since the scan gets fstat headers, not stale ones."""
+        source = tmp_path / "big.js"
+        source.write_bytes(b"x" * 5000)
+        index = StaticFileIndex(
+            str(tmp_path), hot_file_max_size=1000, rescan_interval=0
+        )
+        entry = index.get("big.js")
+
+        source.write_bytes(b"y" * 7000)
+        environ = EnvironBuilder().get_environ()
+        response = make_entry_response(entry, environ, "text/javascript")
+        try:
+            assert response.content_length == 7000
+            assert response.get_etag() == (None, None)
+            assert b"".join(response.response) == b"y" * 7000
+        finally:
+            response.close()
+
+        index.scan()
+        response = make_entry_response(index.get("big.js"), environ, "text/javascript")
+        response.close()
+        assert response.content_length == 7000
+        assert response.get_etag()[0] not in (None, entry.etag)
@@ -0,0 +1,148 @@
+import io
+import json
+import logging
+import threading
+import time
+
+from flask import Flask
+
+from structured_logging import (
+    AsyncLogHandler,
+    JsonFormatter,
+    log_requests,
+    parse_sample_rates,
+)
+
+
+class BlockingStream(io.StringIO):
+    """A stdout that stalls until released, like a full pipe"""
+
+    def __init__(self):
+        super().__init__()
+        self.released = threading.Event()
+
+    def write(self, text):
+        self.released.wait()
+        return super().write(text)
+
+
+def make_logger(handler, name):
+    handler.setFormatter(JsonFormatter())
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def json_lines(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+class TestAsyncLogHandler:
+    """Tests for queued JSON logging."""
+
+    def test_records_are_written_as_json_lines(self):
+        """Test message arguments, extra fields and exceptions are kept."""
+        stream = io.StringIO()
+        handler = AsyncLogHandler(stream)
+        logger = make_logger(handler, "test.json")
+
+        logger.info("Rating submitted for %s: %s", "song", 1, extra={"rating": 1})
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.exception("Failed")
+        handler.flush()
+
+        first, second = json_lines(stream)
+        assert first["msg"] == "Rating submitted for song: 1"
+        assert first["level"] == "INFO"
+        assert first["logger"] == "test.json"
+        assert first["rating"] == 1
+        assert first["ts"].endswith("Z")
+        assert second["level"] == "ERROR"
+        assert "ValueError: boom" in second["exc"]
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        """Test a stalled stream costs dropped records, not stalled callers."""
+        stream = BlockingStream()
+        handler = AsyncLogHandler(stream, queue_size=5, batch_size=1)
+        logger = make_logger(handler, "test.drops")
+
+        started = time.monotonic()
+        for i in range(100):
+            logger.info("record %d", i)
+        assert time.monotonic() - started < 1
+        # One record is stuck in write(); five fill the queue
+        assert handler.dropped >= 90
+
+        stream.released.set()
+        handler.flush()
+        logger.info("after")
+        handler.flush()
+        messages = [entry["msg"] for entry in json_lines(stream)]
+        notices = [m for m in messages if m.startswith("Dropped ")]
+        assert len(notices) == 1
+        assert (
+            notices[0]
+            == f"Dropped {handler.dropped} log records; the log queue was full"
+        )
+        assert messages[-1] == "after"
+
+
+class TestAccessLog:
+    """Tests for sampled access logging."""
+
+    def make_app(self, stream, **kwargs):
+        app = Flask(__name__)
+        handler = AsyncLogHandler(stream)
+        logger = make_logger(handler, "test.access")
+        log_requests(app, logger, **kwargs)
+
+        @app.route("/health")
+        def health():
+            return "ok"
+
+        @app.route("/slow/<name>")
+        def slow(name):
+            time.sleep(0.05)
+            return name
+
+        @app.route("/broken")
+        def broken():
+            return "no", 503
+
+        return app, handler
+
+    def test_routes_are_sampled_but_slow_and_failed_requests_kept(self):
+        """Test a zero-rate route is skipped unless slow or failing."""
+        stream = io.StringIO()
+        app, handler = self.make_app(
+            stream,
+            route_rates={"/health": 0, "/broken": 0},
+            slow_ms=40,
+        )
+        client = app.test_client()
+        for _ in range(20):
+            client.get("/health")
+        client.get("/slow/a")
+        client.get("/broken")
+        handler.flush()
+
+        slow, broken = json_lines(stream)
+        assert slow["route"] == "/slow/<name>"
+        assert slow["path"] == "/slow/a"
+        assert slow["level"] == "WARNING"
+        assert slow["slow"] is True
+        assert slow["duration_ms"] >= 40
+        assert broken["level"] == "ERROR"
+        assert broken["status"] == 503
+
+    def test_sample_rates_are_parsed(self):
+        """Test "rule=rate" pairs are read into a dict keyed by URL rule."""
+        assert parse_sample_rates("/health=0.01, /hls/<path:name>=0.5,") == {
+            "/health": 0.01,
+            "/hls/<path:name>": 0.5,
+        }
+        assert parse_sample_rates("") == {}